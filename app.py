@@ -1,5 +1,4 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
-from flask_pymongo import PyMongo
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from bson import ObjectId
@@ -9,6 +8,13 @@ import bcrypt
 import json
 from config import Config
 from models.ml_models import MLDiagnosisEngine
+from models.chatbot import get_chatbot_response
+from services.mongo import init_async_mongo, init_mongo
+from services.geo import HospitalIndex
+from services.jobs import JobQueue
+import services.tasks  # registers job handlers
+from services.uploads import delete_upload_files, user_upload_paths
+from services.thumbnails import delete_unreferenced_thumbnails
 import io
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
@@ -17,26 +23,73 @@ import csv
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# Initialize MongoDB
-mongo = PyMongo(app)
+# Initialize MongoDB (pool settings come from Config)
+mongo = init_mongo(app)
+
+# Async client for the views asgi.py serves on its event loop
+init_async_mongo(app)
 
 # Initialize ML Engine
-ml_engine = MLDiagnosisEngine()
+ml_engine = MLDiagnosisEngine(
+    cache_size=app.config['PREDICTION_CACHE_SIZE'],
+    cache_ttl=app.config['PREDICTION_CACHE_TTL'],
+    dicom_max_frames=app.config['DICOM_MAX_FRAMES']
+)
+
+# Load nearby-hospital index for the emergency page
+hospital_index = HospitalIndex.from_file(
+    app.config['HOSPITALS_DATA_FILE'],
+    geohash_precision=app.config['HOSPITALS_GEOHASH_PRECISION']
+)
+
+# Background job queue (jobs are run by worker.py)
+job_queue = JobQueue(
+    mongo,
+    max_attempts=app.config['JOBS_MAX_ATTEMPTS'],
+    retry_delay=app.config['JOBS_RETRY_DELAY'],
+    lease_seconds=app.config['JOBS_LEASE_SECONDS']
+)
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Import routes
-from routes import auth, diagnosis, profile
+from routes import auth, diagnosis, profile, admin, jobs, events
+from services.profiler import init_profiler
+from services.assets import init_assets
+from services.templating import init_templating
+from services.ratelimit import init_rate_limiter
+from services.events import init_events
+
+# Live alert fan-out (in-process bus, or a MongoDB change stream on replica sets)
+alert_hub = init_events(app, mongo)
 
 # Initialize routes with app and mongo
 auth.init_auth_routes(app, mongo)
-diagnosis.init_diagnosis_routes(app, mongo, ml_engine)
+diagnosis.init_diagnosis_routes(app, mongo, ml_engine, job_queue)
 profile.init_profile_routes(app, mongo)
+admin.init_admin_routes(app, mongo, job_queue)
+jobs.init_job_routes(app, mongo, job_queue)
+events.init_event_routes(app, mongo, alert_hub)
 
 app.register_blueprint(auth.bp)
 app.register_blueprint(diagnosis.bp)
 app.register_blueprint(profile.bp)
+app.register_blueprint(admin.bp)
+app.register_blueprint(jobs.bp)
+app.register_blueprint(events.bp)
+
+# Sampling profiler for admin-requested and 1-in-N requests
+init_profiler(app)
+
+# Fingerprinted static assets (python manage.py build-assets)
+init_assets(app)
+
+# Jinja bytecode cache, {% cache %} fragments and render timings
+init_templating(app)
+
+# Token-bucket limits on login, password reset, chatbot and diagnosis submission
+init_rate_limiter(app, mongo)
 
 @app.route('/')
 def index():
@@ -90,9 +143,17 @@ def settings():
         action = request.form.get('action')
         
         if action == 'delete_account':
-            # Delete user account
-            mongo.db.users.delete_one({'_id': ObjectId(session['user_id'])})
-            mongo.db.diagnoses.delete_many({'user_id': ObjectId(session['user_id'])})
+            # Delete user account, their diagnoses and uploaded images
+            user_id = ObjectId(session['user_id'])
+            image_paths = user_upload_paths(mongo, user_id)
+            thumbnails = mongo.db.diagnoses.distinct('thumbnail', {'user_id': user_id, 'thumbnail': {'$ne': None}})
+            mongo.db.users.delete_one({'_id': user_id})
+            mongo.db.diagnoses.delete_many({'user_id': user_id})
+            delete_upload_files(image_paths, app.config['UPLOAD_FOLDER'])
+            # Thumbnails are shared between identical uploads; keep ones still in use
+            delete_unreferenced_thumbnails(
+                mongo, thumbnails, app.config['DERIVATIVES_FOLDER'], app.config['THUMBNAIL_SIZE']
+            )
             session.clear()
             flash('Account deleted successfully', 'info')
             return redirect(url_for('auth.login'))
@@ -119,12 +180,43 @@ def emergency():
         return redirect(url_for('auth.login'))
     return render_template('emergency.html')
 
+@app.route('/emergency/hospitals')
+def emergency_hospitals():
+    """Nearest hospitals to the client's coordinates"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'lat and lon are required'}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({'error': 'Coordinates out of range'}), 400
+    
+    k = request.args.get('k', app.config['HOSPITALS_DEFAULT_COUNT'], type=int)
+    k = max(1, min(k, app.config['HOSPITALS_MAX_COUNT']))
+    
+    response = jsonify({'hospitals': hospital_index.nearest(lat, lon, k)})
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response
+
 @app.route('/chatbot', methods=['POST'])
 def chatbot():
     """AI Chatbot endpoint - MJ"""
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
+    return chatbot_reply()
+
+async def chatbot_async():
+    """chatbot() for asgi.py; replies are a keyword lookup, cheap enough for the event loop"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    return chatbot_reply()
+
+def chatbot_reply():
     if not request.is_json:
         return jsonify({'error': 'Request must be JSON'}), 400
     
@@ -134,54 +226,7 @@ def chatbot():
     
     message = data.get('message', '').strip().lower()
     
-    if not message:
-        return jsonify({'response': 'Hi! I\'m MJ. Please ask me something.'})
-    
-    # Simple rule-based chatbot with MJ personality
-    responses = {
-        'hello': 'Hello! I\'m MJ, your AI assistant. How can I help you today?',
-        'hi': 'Hi there! I\'m MJ, here to assist you with the medical diagnosis system. What can I do for you?',
-        'mj': 'Yes, that\'s me! I\'m MJ, your AI assistant. How can I help?',
-        'help': 'I\'m MJ and I can help you with: login, registration, diagnosis submission, viewing results, and more. What do you need help with?',
-        'diagnosis': 'To submit a diagnosis, go to the Diagnosis page, fill in your vital signs, upload medical images (optional), select an algorithm, and click Submit.',
-        'result': 'After submitting a diagnosis, you\'ll see results on the Result page with color-coded indicators (green=normal, yellow=moderate, red=critical).',
-        'emergency': 'If your diagnosis shows critical results, the Emergency Alert page will automatically open with nearby hospital information and emergency contacts.',
-        'history': 'You can view all your previous diagnosis records in the History page. You can filter by vital sign or date, and export them as CSV or PDF.',
-        'profile': 'Your profile page shows your personal information, age, gender, medical history, and emergency contact details. You can update it anytime.',
-        'settings': 'In Settings, you can change theme (dark/light mode), select language (English/Tamil), or delete your account if needed.',
-        'logout': 'Click on the Logout button in the navigation menu to safely log out of your account.',
-        'register': 'To create an account, go to the Registration page and fill in: Username (unique), Password (min 6 chars), Name, Age, Gender, Contact Number, School/College Name (max 10 chars), and Gmail ID.',
-        'forgot password': 'If you forgot your password, click "Forgot Password" on the login page and use your Gmail ID and School/College name to recover it.',
-        'algorithm': 'You can choose from 4 ML algorithms: Logistic Regression, SVM, CNN (for images), or LSTM. Each provides different analysis approaches.',
-        'normal': 'Normal results mean your vital signs are within healthy ranges. Continue monitoring and follow general health guidelines.',
-        'critical': 'Critical results require immediate medical attention. The Emergency Alert page will open automatically with hospital information.',
-        'thanks': 'You\'re welcome! I\'m always here to help. Is there anything else you need?',
-        'thank you': 'You\'re welcome! Feel free to ask me anything else.',
-        'bye': 'Goodbye! Take care of your health. I\'m here whenever you need me!'
-    }
-    
-    # Default response
-    response_text = "Hi! I'm MJ, your AI assistant. I can help you with: login, registration, diagnosis, results, emergency alerts, history, profile, settings, or general help. What would you like to know?"
-    
-    # Check for matching keywords
-    for key, value in responses.items():
-        if key in message:
-            response_text = value
-            break
-    
-    # If no match found, provide a helpful response
-    if response_text == "Hi! I'm MJ, your AI assistant. I can help you with: login, registration, diagnosis, results, emergency alerts, history, profile, settings, or general help. What would you like to know?":
-        # Check for partial matches
-        if any(word in message for word in ['login', 'sign in', 'log in']):
-            response_text = 'To login, enter your username and password on the login page. If you don\'t have an account, click "Register here" to create one.'
-        elif any(word in message for word in ['register', 'sign up', 'create account']):
-            response_text = 'To register, click "Register here" on the login page and fill in all required fields: Username, Password, Name, Age, Gender, Contact, School/College Name, and Gmail ID.'
-        elif any(word in message for word in ['vital', 'signs', 'temperature', 'heart rate', 'blood pressure']):
-            response_text = 'Vital signs include: Body Temperature, Heart Rate, Blood Pressure (systolic/diastolic), Respiratory Rate, and Oxygen Saturation. Enter these on the Diagnosis page.'
-        else:
-            response_text = "I'm MJ, and I'm here to help! Try asking me about: diagnosis, results, history, profile, settings, or how to use any feature of the system."
-    
-    return jsonify({'response': response_text})
+    return jsonify({'response': get_chatbot_response(message)})
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
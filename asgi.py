@@ -0,0 +1,114 @@
+"""
+ASGI entry point
+
+    uvicorn asgi:application --workers 4 --host 0.0.0.0 --port 5000
+
+Uvicorn keeps every connection on an event loop, so idle keep-alive
+clients cost a socket rather than a thread. The request body is read on
+the loop too, before the request is handed to the app: a slow upload
+holds memory (up to ASGI_MAX_BODY_SIZE, larger bodies get 413) but no
+thread.
+
+The endpoints in ASYNC_VIEWS are then served by coroutines on the loop
+(services.aio): the diagnosis pages, PDF reports, profile, login,
+registration, the chatbot and /events/alerts. They query MongoDB
+through an AsyncMongoClient, and their CPU-bound work (the algorithm
+comparison, bcrypt, ReportLab) runs on the loop's default executor, so
+a waiting or slowly reading client holds no thread. An open alert stream
+costs a socket and a queue, and EVENTS_MAX_SUBSCRIBERS can be in the
+thousands.
+
+Every other request runs the synchronous Flask app on a bounded thread
+pool (ASGI_THREADS per process), diagnosis submission included: it
+writes the upload and its derivatives to disk. Its response is streamed
+back through a queue of ASGI_SEND_QUEUE_SIZE chunks, and a client
+reading slower than that queue drains keeps its thread until it catches
+up. Keep ASGI_THREADS at or below MONGO_MAX_POOL_SIZE; more threads
+would only queue on the pool.
+"""
+
+import os
+from a2wsgi import WSGIMiddleware
+from config import Config
+from routes import auth, diagnosis, events, profile
+from services.aio import AsyncViews
+from wsgi import application as wsgi_application
+from app import chatbot_async
+
+# Uploads plus room for the form fields around them
+MAX_BODY_SIZE = int(os.environ.get('ASGI_MAX_BODY_SIZE', Config.MAX_UPLOAD_SIZE + 1024 * 1024))
+
+# Endpoints served on the event loop instead of a WSGI thread
+ASYNC_VIEWS = {
+    'diagnosis.history': diagnosis.history_async,
+    'diagnosis.comparison': diagnosis.comparison_async,
+    'diagnosis.recommendations': diagnosis.recommendations_async,
+    'diagnosis.export_pdf': diagnosis.export_pdf_async,
+    'profile.view': profile.view_async,
+    'profile.update': profile.update_async,
+    'auth.login': auth.login_async,
+    'auth.register': auth.register_async,
+    'chatbot': chatbot_async,
+    'events.alerts': events.alerts_async,
+}
+
+
+class BufferedBody:
+    """Read each HTTP request body on the event loop before the WSGI app gets a thread"""
+
+    def __init__(self, app, max_body_size):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        declared = dict(scope['headers']).get(b'content-length')
+        if declared and declared.isdigit() and int(declared) > self.max_body_size:
+            return await self._too_large(send)
+
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_size:
+                return await self._too_large(send)
+            chunks.append(chunk)
+            more_body = message.get('more_body', False)
+
+        buffered = [{'type': 'http.request', 'body': b''.join(chunks), 'more_body': False}]
+
+        async def replay():
+            # The whole body in one message, then whatever the client sends next (a disconnect)
+            if buffered:
+                return buffered.pop()
+            return await receive()
+
+        await self.app(scope, replay, send)
+
+    @staticmethod
+    async def _too_large(send):
+        await send({'type': 'http.response.start', 'status': 413, 'headers': [
+            (b'content-type', b'text/plain; charset=utf-8'), (b'connection', b'close')
+        ]})
+        await send({'type': 'http.response.body', 'body': b'Request body too large'})
+
+
+application = BufferedBody(
+    AsyncViews(
+        wsgi_application,
+        ASYNC_VIEWS,
+        WSGIMiddleware(
+            wsgi_application,
+            workers=int(os.environ.get('ASGI_THREADS', 16)),
+            send_queue_size=int(os.environ.get('ASGI_SEND_QUEUE_SIZE', 10))
+        )
+    ),
+    MAX_BODY_SIZE
+)
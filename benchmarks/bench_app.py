@@ -0,0 +1,174 @@
+"""
+Benchmarks for request-side work: chatbot, exports, bcrypt and an
+end-to-end load scenario driven through the Flask test client
+"""
+
+import random
+import time
+from datetime import datetime, timedelta
+import bcrypt
+from bson import ObjectId
+from models.chatbot import get_chatbot_response
+from services.geo import HospitalIndex
+from benchmarks.bench_engine import NORMAL_VITALS, CRITICAL_VITALS
+from benchmarks.harness import summarize
+
+CHATBOT_MESSAGES = [
+    'hello',
+    'how do i submit a diagnosis',
+    'what does critical mean',
+    'i forgot password',
+    'what are vital signs like blood pressure',
+    'something completely unrelated to the system',
+]
+
+
+def sample_diagnoses(count, user_id=None):
+    """Build diagnosis documents shaped like the ones routes/diagnosis.py stores"""
+    rng = random.Random(42)
+    user_id = user_id or ObjectId()
+    now = datetime.now()
+    diagnoses = []
+    for i in range(count):
+        vitals = dict(CRITICAL_VITALS if i % 5 == 0 else NORMAL_VITALS)
+        vitals['heart_rate'] = str(rng.randint(55, 135))
+        diagnoses.append({
+            '_id': ObjectId(),
+            'user_id': user_id,
+            'patient_name': f'Patient {i}',
+            'patient_age': str(rng.randint(18, 90)),
+            'patient_contact': '0000000000',
+            'vitals': vitals,
+            'algorithm': 'logistic_regression',
+            'result': {
+                'condition': 'Tachycardia' if int(vitals['heart_rate']) > 100 else 'Normal',
+                'severity': 'moderate' if int(vitals['heart_rate']) > 100 else 'normal',
+                'confidence': 0.85,
+                'algorithm': 'Logistic Regression'
+            },
+            'image_path': None,
+            'created_at': now - timedelta(minutes=i)
+        })
+    return diagnoses
+
+
+def run_micro(suite):
+    for message in CHATBOT_MESSAGES:
+        suite.bench(f"chatbot.{message.replace(' ', '_')[:30]}", lambda: get_chatbot_response(message))
+
+    from routes.diagnosis import build_csv, build_pdf
+
+    user = {'name': 'Benchmark User', 'age': 40, 'gender': 'Other'}
+    for count in (10, 1000):
+        diagnoses = sample_diagnoses(count)
+        suite.bench(f'export.csv.{count}_rows', lambda: build_csv(diagnoses), repeat=5)
+    diagnosis = sample_diagnoses(1)[0]
+    suite.bench('export.pdf.single_report', lambda: build_pdf(diagnosis, user), repeat=5)
+
+    rng = random.Random(3)
+    hospitals = [
+        {'name': f'Hospital {i}', 'address': '', 'phone': '',
+         'latitude': rng.uniform(8.0, 30.0), 'longitude': rng.uniform(70.0, 90.0)}
+        for i in range(10000)
+    ]
+    index = HospitalIndex(hospitals)
+    suite.bench('geo.nearest.cached_cell', lambda: index.nearest(13.0827, 80.2707, 5))
+    points = [(rng.uniform(8.0, 30.0), rng.uniform(70.0, 90.0)) for _ in range(1000)]
+    point_iter = iter(points * 1000)
+    suite.bench('geo.nearest.mixed_cells', lambda: index.nearest(*next(point_iter), 5), repeat=3, number=500)
+
+    password = b'benchmark-password'
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt())
+    suite.bench('bcrypt.hashpw', lambda: bcrypt.hashpw(password, bcrypt.gensalt()), repeat=3, number=1)
+    suite.bench('bcrypt.checkpw', lambda: bcrypt.checkpw(password, hashed), repeat=3, number=1)
+
+
+def run_load(suite, iterations=200):
+    """Drive the whole app through its test client against mongomock"""
+    if not suite.wants('load.'):
+        return
+    try:
+        import mongomock
+    except ImportError:
+        print('mongomock is not installed; skipping the load scenario')
+        return
+
+    import app as app_module
+    app_module.mongo.db = mongomock.MongoClient().db
+    flask_app = app_module.app
+    flask_app.config['TESTING'] = True
+    # One simulated user submits far faster than the per-user budgets allow
+    limiter = flask_app.extensions.get('rate_limiter')
+    if limiter is not None:
+        limiter.budgets.clear()
+    client = flask_app.test_client()
+
+    account = {
+        'username': 'benchuser',
+        'password': 'benchpass',
+        'name': 'Bench User',
+        'age': '40',
+        'gender': 'Other',
+        'contact': '0000000000',
+        'school_college': 'Bench',
+        'gmail': 'bench@example.com'
+    }
+    client.post('/auth/register', data=account)
+    client.post('/auth/login', data={'username': account['username'], 'password': account['password']})
+
+    rng = random.Random(7)
+    etags = {'last': ''}
+    steps = [
+        ('load.diagnosis_input', lambda: client.post('/diagnosis/input', data=_random_form(rng))),
+        ('load.diagnosis_result', lambda: client.get('/diagnosis/result')),
+        ('load.history', lambda: _remember_etag(etags, client.get('/diagnosis/history'))),
+        # An auto-refreshing dashboard revalidating the unchanged page (304)
+        ('load.history_revalidate', lambda: client.get('/diagnosis/history', headers={'If-None-Match': etags['last']})),
+        ('load.comparison', lambda: client.get('/diagnosis/comparison')),
+        ('load.recommendations', lambda: client.get('/diagnosis/recommendations')),
+        ('load.chatbot', lambda: client.post('/chatbot', json={'message': rng.choice(CHATBOT_MESSAGES)})),
+        ('load.export_csv', lambda: client.get('/diagnosis/export/csv')),
+        ('load.export_pdf_latest', lambda: client.get('/diagnosis/export/pdf/latest')),
+    ]
+    if suite.quick:
+        iterations = min(iterations, 20)
+
+    timings = {name: [] for name, _ in steps}
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for name, step in steps:
+            start = time.perf_counter()
+            response = step()
+            timings[name].append((time.perf_counter() - start) * 1e6)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name} returned {response.status_code}')
+    elapsed = time.perf_counter() - started
+
+    for name, values in timings.items():
+        suite.record(name, summarize(values))
+    suite.record('load.total', {
+        'iterations': iterations,
+        'requests': iterations * len(steps),
+        'seconds': elapsed,
+        'requests_per_sec': iterations * len(steps) / elapsed,
+    })
+
+
+def _remember_etag(etags, response):
+    etags['last'] = response.headers.get('ETag', '')
+    return response
+
+
+def _random_form(rng):
+    return {
+        'name': 'Load Patient',
+        'age': str(rng.randint(18, 90)),
+        'contact': '0000000000',
+        'temperature': f'{rng.uniform(97.0, 104.0):.1f}',
+        'heart_rate': str(rng.randint(45, 140)),
+        'systolic_bp': str(rng.randint(80, 190)),
+        'diastolic_bp': str(rng.randint(50, 120)),
+        'respiratory_rate': str(rng.randint(10, 30)),
+        'oxygen_saturation': str(rng.randint(85, 100)),
+        'algorithm': rng.choice(['logistic_regression', 'svm', 'cnn', 'lstm'])
+    }
@@ -0,0 +1,75 @@
+"""
+Compiled float32 inference against scikit-learn
+
+Fits the engine's scaler, logistic regression and SVM on synthetic vitals
+labelled by severity, checks the compiled models agree with sklearn's
+predict_proba and predict, then times one row through sklearn, one row through the
+compiled model and a batch through the compiled model (also reported per
+row).
+"""
+
+import warnings
+import numpy as np
+from models.compiled import PARITY_TOLERANCE, check_parity
+from models.ml_models import MLDiagnosisEngine, assess_vitals, VITAL_FIELDS
+from benchmarks.bench_engine import NORMAL_VITALS
+
+MODELS = ['logistic_regression', 'svm']
+
+VITALS_MEAN = [98.6, 75, 122, 80, 16, 97]
+VITALS_SPREAD = [1.8, 20, 25, 12, 4, 2.5]
+
+
+def synthetic_vitals(count, seed=42):
+    """Random vitals around normal ranges, labelled with the rule-based severity"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(VITALS_MEAN, VITALS_SPREAD, size=(count, len(VITAL_FIELDS)))
+    fields = [field for field, _ in VITAL_FIELDS]
+    y = np.array([assess_vitals(dict(zip(fields, row)))[1] for row in X])
+    return X, y
+
+
+def _per_row(result, rows):
+    scaled = {key: value / rows for key, value in result.items() if key.endswith('_us')}
+    scaled.update(rows=rows, repeat=result['repeat'], number=result['number'], ops_per_sec=result['ops_per_sec'] * rows)
+    return scaled
+
+
+def run(suite, batch_size=1000):
+    if not any(suite.wants(f'compiled.{name}') for name in ('parity', *MODELS)):
+        return
+
+    engine = MLDiagnosisEngine(cache_size=0)
+    X_train, y_train = synthetic_vitals(2000)
+    with warnings.catch_warnings():
+        # SVC(probability=True) is deprecated in newer scikit-learn but still what the engine trains
+        warnings.simplefilter('ignore', FutureWarning)
+        engine.train_sample_models(X_train, y_train)
+
+    X_test, _ = synthetic_vitals(batch_size, seed=7)
+    row = engine.preprocess_vitals(NORMAL_VITALS)
+
+    for name in MODELS:
+        model = engine.models[name]
+        compiled = engine.compiled[name]
+
+        diff, label_mismatches = check_parity(compiled, engine.scaler, model, X_test, rows=100)
+        if suite.wants(f'compiled.parity.{name}'):
+            suite.record(f'compiled.parity.{name}', {
+                'rows': batch_size,
+                'max_abs_diff': diff,
+                'label_mismatches': label_mismatches,
+                'tolerance': PARITY_TOLERANCE,
+            })
+        if diff > PARITY_TOLERANCE:
+            raise RuntimeError(f'compiled {name} differs from sklearn by {diff:.2e}')
+        if label_mismatches:
+            raise RuntimeError(f'compiled {name} predicts a different label than sklearn for {label_mismatches} rows')
+        if label_mismatches:
+            raise RuntimeError(f'compiled {name} predicts a different label than sklearn for {label_mismatches} rows')
+
+        suite.bench(f'compiled.{name}.sklearn_row', lambda: model.predict_proba(engine.scaler.transform(row)))
+        suite.bench(f'compiled.{name}.row', lambda: engine.model_proba(name, NORMAL_VITALS))
+        batch = suite.bench(f'compiled.{name}.batch_{batch_size}', lambda: engine.model_proba_batch(name, X_test))
+        if batch is not None:
+            suite.record(f'compiled.{name}.batch_per_row', _per_row(batch, batch_size))
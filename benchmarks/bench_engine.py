@@ -0,0 +1,56 @@
+"""
+Micro-benchmarks for MLDiagnosisEngine
+"""
+
+import glob
+import os
+from models.ml_models import MLDiagnosisEngine
+
+ALGORITHMS = ['logistic_regression', 'svm', 'cnn', 'lstm']
+
+# Form defaults and a critical case, both as the strings the form submits
+NORMAL_VITALS = {
+    'temperature': '98.6',
+    'heart_rate': '72',
+    'systolic_bp': '120',
+    'diastolic_bp': '80',
+    'respiratory_rate': '16',
+    'oxygen_saturation': '98'
+}
+
+CRITICAL_VITALS = {
+    'temperature': '103.5',
+    'heart_rate': '130',
+    'systolic_bp': '185',
+    'diastolic_bp': '110',
+    'respiratory_rate': '28',
+    'oxygen_saturation': '88'
+}
+
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
+
+
+def sample_images():
+    """Return the sample images shipped in uploads/"""
+    paths = []
+    for pattern in ('*.jpg', '*.jpeg', '*.png', '*.gif', '*.dcm'):
+        paths.extend(glob.glob(os.path.join(UPLOAD_FOLDER, '**', pattern), recursive=True))
+    return sorted(paths)
+
+
+def run(suite):
+    engine = MLDiagnosisEngine()
+
+    for algorithm in ALGORITHMS:
+        suite.bench(f'engine.predict.{algorithm}.normal', lambda: engine.predict(algorithm, NORMAL_VITALS))
+        suite.bench(f'engine.predict.{algorithm}.critical', lambda: engine.predict(algorithm, CRITICAL_VITALS))
+
+    suite.bench('engine.compare_algorithms', lambda: engine.compare_algorithms(NORMAL_VITALS))
+
+    images = sample_images()
+    if images:
+        image = images[0]
+        suite.bench('engine.preprocess_image', lambda: engine.preprocess_image(image), repeat=5)
+        suite.bench('engine.predict.cnn.with_image', lambda: engine.predict('cnn', NORMAL_VITALS, image), repeat=5)
+        suite.bench('engine.compare_algorithms.with_image',
+                    lambda: engine.compare_algorithms(NORMAL_VITALS, image), repeat=5)
@@ -0,0 +1,55 @@
+"""
+Compare two benchmark result files
+
+    python -m benchmarks.compare baseline.json latest.json --threshold 0.10
+
+Exits with status 1 when any benchmark's median slowed down by more than
+the threshold.
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold):
+    rows = []
+    regressions = []
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        old = baseline['results'][name].get('median_us')
+        new = current['results'][name].get('median_us')
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        rows.append((name, old, new, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown, e.g. 0.10 for 10%%')
+    args = parser.parse_args(argv)
+
+    baseline = load(args.baseline)
+    current = load(args.current)
+    rows, regressions = compare(baseline, current, args.threshold)
+
+    print(f"baseline {baseline['metadata'].get('commit')}  current {current['metadata'].get('commit')}")
+    for name, old, new, change in rows:
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f'{name:<50} {old:>12.2f} -> {new:>12.2f} us  {change:+7.1%}{flag}')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
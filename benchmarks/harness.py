@@ -0,0 +1,120 @@
+"""
+Timing harness shared by the benchmark modules
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+
+def _calibrate(func, min_time):
+    """Find a loop count that makes one repeat last at least min_time"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            return number
+        number *= 10 if elapsed < min_time / 10 else 2
+
+
+def measure(func, repeat=7, min_time=0.2, number=None):
+    """Time func and return per-call statistics in microseconds"""
+    if number is None:
+        number = _calibrate(func, min_time)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+
+    return summarize(timings, number=number)
+
+
+def summarize(timings_us, number=1):
+    """Summarize a list of per-call timings in microseconds"""
+    timings_us = sorted(timings_us)
+    p95_index = min(len(timings_us) - 1, int(round(0.95 * (len(timings_us) - 1))))
+    median = statistics.median(timings_us)
+    return {
+        'repeat': len(timings_us),
+        'number': number,
+        'min_us': timings_us[0],
+        'median_us': median,
+        'mean_us': statistics.fmean(timings_us),
+        'stdev_us': statistics.stdev(timings_us) if len(timings_us) > 1 else 0.0,
+        'p95_us': timings_us[p95_index],
+        'max_us': timings_us[-1],
+        'ops_per_sec': 1e6 / median if median else 0.0,
+    }
+
+
+class BenchmarkSuite:
+    """Collects named benchmark results and writes them as JSON"""
+
+    def __init__(self, name_filter=None, quick=False):
+        self.name_filter = name_filter
+        self.quick = quick
+        self.results = {}
+
+    def wants(self, name):
+        return not self.name_filter or self.name_filter in name
+
+    def bench(self, name, func, **kwargs):
+        """Time func under name unless it is filtered out"""
+        if not self.wants(name):
+            return None
+        if self.quick:
+            kwargs.setdefault('repeat', 3)
+            kwargs.setdefault('min_time', 0.05)
+        result = measure(func, **kwargs)
+        self.record(name, result)
+        return result
+
+    def record(self, name, result):
+        self.results[name] = result
+        if 'median_us' in result:
+            print(f"{name:<50} {result['median_us']:>12.2f} us  ({result['ops_per_sec']:.0f} ops/s)")
+        else:
+            print(f"{name:<50} done")
+
+    def to_dict(self):
+        return {
+            'metadata': environment_metadata(),
+            'results': self.results,
+        }
+
+    def write(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+
+def environment_metadata():
+    """Describe the machine and commit the results were produced on"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
@@ -0,0 +1,32 @@
+"""
+Run the benchmark suite and write the results to JSON
+
+    python -m benchmarks.run --output benchmarks/results/latest.json
+    python -m benchmarks.run --filter engine. --quick
+    python -m benchmarks.run --filter compiled.
+"""
+
+import argparse
+from benchmarks import bench_app, bench_compiled, bench_engine
+from benchmarks.harness import BenchmarkSuite
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the diagnosis benchmarks')
+    parser.add_argument('--output', default='benchmarks/results/latest.json', help='JSON file to write')
+    parser.add_argument('--filter', default=None, help='only run benchmarks whose name contains this')
+    parser.add_argument('--quick', action='store_true', help='fewer repeats, for smoke runs')
+    parser.add_argument('--iterations', type=int, default=200, help='load scenario iterations')
+    args = parser.parse_args(argv)
+
+    suite = BenchmarkSuite(name_filter=args.filter, quick=args.quick)
+    bench_engine.run(suite)
+    bench_compiled.run(suite)
+    bench_app.run_micro(suite)
+    bench_app.run_load(suite, iterations=args.iterations)
+    suite.write(args.output)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+"""
+Correctness checks that need a running MongoDB deployment (see checks.causal)
+"""
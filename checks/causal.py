@@ -0,0 +1,175 @@
+"""
+Check the causal read-your-writes handoff against a replica set
+
+    python -m checks.causal
+    python -m checks.causal --uri 'mongodb://localhost:27017/causal_check?replicaSet=rs0'
+
+Without --uri the check starts checks.replset.StandInReplicaSet in
+process: a primary and a secondary that applies writes --lag seconds
+late. With --uri it runs against a real replica set instead, e.g. a
+single-node one started with ``mongod --replSet rs0`` and ``rs.initiate()``.
+
+Submits a diagnosis through /diagnosis/input and then opens
+/diagnosis/history, which is routed to secondaryPreferred. Passes when the
+history ``find`` carries readConcern.afterClusterTime equal to the
+operationTime the insert stored in the Flask session, and the new record
+is on the page. On the stand-in, a read of the secondary without the
+session is expected to miss the record, which shows the page only saw it
+because of the wait.
+
+It then checks the conditional GET of the same page from a second browser
+with no causal token, after a background-job style write (rescoring the
+diagnosis and bumping the user's version without a session): each 200 it
+gets while the secondary catches up must already show the new result, so
+an ETag never labels an older body. The records it creates are deleted
+afterwards.
+"""
+
+import argparse
+import os
+import sys
+import time
+from bson import ObjectId, Timestamp
+from pymongo import ReadPreference, monitoring
+from pymongo.errors import PyMongoError
+
+RESCORED = 'Causal Check Rescored'
+
+FORM = {
+    'name': 'Causal Check', 'age': '40', 'temperature': '98.6', 'heart_rate': '72', 'systolic_bp': '120',
+    'diastolic_bp': '80', 'respiratory_rate': '16', 'oxygen_saturation': '98', 'algorithm': 'svm'
+}
+
+
+class DiagnosesFindListener(monitoring.CommandListener):
+    """Keeps the find commands sent to the diagnoses collection"""
+
+    def __init__(self):
+        self.finds = []
+
+    def started(self, event):
+        if event.command_name == 'find' and event.command.get('find') == 'diagnoses':
+            self.finds.append(event.command)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def _check_revalidation(flask_app, mongo, user_id, wait):
+    """A job-style write, then revalidation from a browser that did not make it"""
+    from services.conditional import touch_diagnoses
+
+    other = flask_app.test_client()
+    with other.session_transaction() as flask_session:
+        flask_session['user_id'] = str(user_id)
+    # Let the secondary catch up so the starting ETag labels the current page
+    time.sleep(wait)
+    response = other.get('/diagnosis/history')
+    etag = response.headers.get('ETag')
+    if response.status_code != 200 or not etag:
+        return [f'second browser got {response.status_code} without an ETag from /diagnosis/history']
+
+    mongo.db.diagnoses.update_many({'user_id': user_id}, {'$set': {'result.condition': RESCORED}})
+    touch_diagnoses(mongo, user_id)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        response = other.get('/diagnosis/history', headers={'If-None-Match': etag})
+        if response.status_code == 200:
+            if RESCORED.encode() not in response.data:
+                return [f"revalidation returned the old page under the new ETag {response.headers.get('ETag')}"]
+            if response.headers.get('ETag') == etag:
+                return ['revalidation returned the new page under the old ETag']
+            return []
+        if response.status_code != 304:
+            return [f'revalidation returned {response.status_code}']
+        time.sleep(0.1)
+    return [f'revalidation still answered 304 {wait}s after the write']
+
+
+def run_check(uri, stand_in=False, lag=0):
+    # The app reads MONGO_URI at import and the listener must exist before its client does
+    os.environ['MONGO_URI'] = uri
+    listener = DiagnosesFindListener()
+    monitoring.register(listener)
+    import app as app_module
+
+    mongo = app_module.mongo
+    flask_app = app_module.app
+    flask_app.config['TESTING'] = True
+    try:
+        hello = mongo.cx.admin.command('hello')
+    except PyMongoError as e:
+        print(f'Cannot reach {uri}: {e}')
+        return 2
+    if not hello.get('setName'):
+        print(f'{uri} is not a replica set; causal sessions are only used on replica sets')
+        return 2
+    limiter = flask_app.extensions.get('rate_limiter')
+    if limiter is not None:
+        limiter.budgets.clear()
+
+    user_id = mongo.db.users.insert_one({'username': f'causal-check-{ObjectId()}', 'name': 'Causal Check'}).inserted_id
+    failures = []
+    try:
+        client = flask_app.test_client()
+        with client.session_transaction() as flask_session:
+            flask_session['user_id'] = str(user_id)
+
+        response = client.post('/diagnosis/input', data=FORM)
+        if response.status_code != 302:
+            failures.append(f'/diagnosis/input returned {response.status_code}')
+        with client.session_transaction() as flask_session:
+            operation_time = flask_session.get('mongo_operation_time')
+            cluster_time = flask_session.get('mongo_cluster_time')
+        if not operation_time or not cluster_time:
+            failures.append('the insert did not store mongo_operation_time/mongo_cluster_time in the session')
+
+        if stand_in:
+            unordered = mongo.db.diagnoses.with_options(read_preference=ReadPreference.SECONDARY)
+            if unordered.count_documents({'user_id': user_id}):
+                failures.append('the stand-in secondary already had the write; raise --lag')
+
+        listener.finds.clear()
+        response = client.get('/diagnosis/history')
+        if response.status_code != 200 or FORM['name'].encode() not in response.data:
+            failures.append('/diagnosis/history did not show the new diagnosis')
+        after = [find.get('readConcern', {}).get('afterClusterTime') for find in listener.finds]
+        if operation_time and Timestamp(*operation_time) not in after:
+            failures.append(f'history find carried afterClusterTime {after}, expected {Timestamp(*operation_time)}')
+        if not any('$clusterTime' in find for find in listener.finds):
+            failures.append('history find did not gossip $clusterTime')
+
+        failures += _check_revalidation(flask_app, mongo, user_id, wait=lag + 3)
+    finally:
+        mongo.db.diagnoses.delete_many({'user_id': user_id})
+        mongo.db.users.delete_one({'_id': user_id})
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if not failures:
+        print(f'OK: history read waited for operationTime {Timestamp(*operation_time)}')
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Verify causally consistent reads on a replica set')
+    parser.add_argument('--uri', default=os.environ.get('CAUSAL_CHECK_URI'),
+                        help='replica set to check (default: an in-process stand-in)')
+    parser.add_argument('--lag', type=float, default=2.0, help="stand-in secondary's replication lag in seconds")
+    args = parser.parse_args(argv)
+
+    if args.uri:
+        return run_check(args.uri)
+
+    from checks.replset import StandInReplicaSet
+    with StandInReplicaSet(lag=args.lag) as replset:
+        print(f'Started stand-in replica set {replset.uri("causal_check")}')
+        return run_check(replset.uri('causal_check'), stand_in=True, lag=args.lag)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,498 @@
+"""
+In-process stand-in for a two-member MongoDB replica set
+
+    with StandInReplicaSet(lag=1.0) as replset:
+        client = MongoClient(replset.uri('mydb'))
+
+A primary and a secondary speak the MongoDB wire protocol (OP_MSG, plus
+OP_QUERY for pymongo's first handshake) on local ports, so a real
+pymongo client discovers a replica set, opens causally consistent
+sessions and routes reads by read preference exactly as it would against
+mongod. Commands run against mongomock. Every write gets a cluster time
+(a bson Timestamp) and is recorded as the post-images of the documents it
+touched. The secondary applies those records ``lag`` seconds after the
+write, so reads routed to it are stale until then, and a read carrying
+readConcern.afterClusterTime waits until the secondary has caught up,
+which is the behaviour causal consistency relies on.
+
+It implements what the app's request paths use (hello, find, aggregate,
+count, distinct, insert, update, delete, findAndModify, createIndexes and
+a few housekeeping commands), not the whole server. Unknown commands fail
+with CommandNotFound.
+"""
+
+import socketserver
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+import bson
+import mongomock
+from bson import Binary, Int64, ObjectId, Timestamp
+from bson.codec_options import CodecOptions
+from pymongo import ReturnDocument
+
+OP_REPLY = 1
+OP_QUERY = 2004
+OP_MSG = 2013
+
+MAX_WIRE_VERSION = 21  # MongoDB 7.0
+
+# Fields pymongo adds to commands that the stand-in does not act on
+COMMAND_META = frozenset({
+    '$db', 'lsid', 'txnNumber', '$clusterTime', 'readConcern', 'writeConcern', '$readPreference',
+    'apiVersion', 'apiStrict', 'apiDeprecationErrors', 'autocommit', 'startTransaction', 'maxTimeMS',
+    'comment', 'bypassDocumentValidation', 'ordered', 'let', 'collation', 'hint', 'allowDiskUse'
+})
+
+CODEC_OPTIONS = CodecOptions()
+
+WRITE_COMMANDS = frozenset({'insert', 'update', 'delete', 'findAndModify', 'findandmodify'})
+
+
+class CommandError(Exception):
+    def __init__(self, code, code_name, message):
+        super().__init__(message)
+        self.code = code
+        self.code_name = code_name
+
+
+class _Oplog:
+    """Shared state: the primary's data, the write log and the secondary's applied copy"""
+
+    def __init__(self, lag):
+        self.lag = lag
+        self.lock = threading.Lock()
+        self.primary = mongomock.MongoClient()
+        self.secondary = mongomock.MongoClient()
+        self.entries = []  # (cluster time, wall time, db, collection, [(_id, post-image or None)])
+        self.applied = 0
+        self.cluster_time = Timestamp(int(time.time()), 1)
+        self.applied_time = self.cluster_time
+        self.last_write = datetime.now(timezone.utc)
+        self.applied_write = self.last_write
+
+    def tick(self):
+        now = int(time.time())
+        if now > self.cluster_time.time:
+            self.cluster_time = Timestamp(now, 1)
+        else:
+            self.cluster_time = Timestamp(self.cluster_time.time, self.cluster_time.inc + 1)
+        return self.cluster_time
+
+    def record(self, db_name, coll_name, images):
+        ts = self.tick()
+        self.last_write = datetime.now(timezone.utc)
+        if images:
+            self.entries.append((ts, time.monotonic(), db_name, coll_name, images))
+        return ts
+
+    def catch_up(self):
+        """Apply every write older than lag to the secondary; call with the lock held"""
+        horizon = time.monotonic() - self.lag
+        while self.applied < len(self.entries) and self.entries[self.applied][1] <= horizon:
+            ts, _, db_name, coll_name, images = self.entries[self.applied]
+            collection = self.secondary[db_name][coll_name]
+            for _id, image in images:
+                if image is None:
+                    collection.delete_one({'_id': _id})
+                else:
+                    collection.replace_one({'_id': _id}, image, upsert=True)
+            self.applied += 1
+            self.applied_time = ts
+            self.applied_write = datetime.now(timezone.utc)
+        if self.applied == len(self.entries) and self.cluster_time > self.applied_time:
+            # Nothing left to replicate: the secondary is as current as the primary
+            self.applied_time = self.cluster_time
+
+
+class _Member:
+    """One replica set member answering on its own port"""
+
+    def __init__(self, replset, primary):
+        self.replset = replset
+        self.primary = primary
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.member = self
+        self.address = f'127.0.0.1:{self.server.server_address[1]}'
+        self.connections = 0
+
+    @property
+    def oplog(self):
+        return self.replset.oplog
+
+    def client(self):
+        return self.oplog.primary if self.primary else self.oplog.secondary
+
+    def hello(self):
+        oplog = self.oplog
+        with oplog.lock:
+            if not self.primary:
+                oplog.catch_up()
+            op_time = oplog.cluster_time if self.primary else oplog.applied_time
+            write_date = oplog.last_write if self.primary else oplog.applied_write
+            self.connections += 1
+        reply = {
+            'helloOk': True,
+            'ismaster': self.primary,
+            'isWritablePrimary': self.primary,
+            'secondary': not self.primary,
+            'setName': self.replset.set_name,
+            'setVersion': 1,
+            'hosts': [m.address for m in self.replset.members],
+            'primary': self.replset.members[0].address,
+            'me': self.address,
+            'lastWrite': {
+                'opTime': {'ts': op_time, 't': Int64(1)},
+                'lastWriteDate': write_date.replace(tzinfo=None),
+                'majorityOpTime': {'ts': op_time, 't': Int64(1)},
+                'majorityWriteDate': write_date.replace(tzinfo=None),
+            },
+            'maxBsonObjectSize': 16 * 1024 * 1024,
+            'maxMessageSizeBytes': 48000000,
+            'maxWriteBatchSize': 100000,
+            'localTime': datetime.now(timezone.utc).replace(tzinfo=None),
+            'logicalSessionTimeoutMinutes': 30,
+            'connectionId': self.connections,
+            'minWireVersion': 0,
+            'maxWireVersion': MAX_WIRE_VERSION,
+            'readOnly': False,
+        }
+        if self.primary:
+            reply['electionId'] = ObjectId('7fffffff0000000000000001')
+        return reply
+
+    def run_command(self, body):
+        name = next(iter(body))
+        try:
+            if name.lower() in ('hello', 'ismaster'):
+                reply = self.hello()
+            else:
+                reply = self._dispatch(name, body)
+            reply['ok'] = 1.0
+        except CommandError as e:
+            reply = {'ok': 0.0, 'errmsg': str(e), 'code': e.code, 'codeName': e.code_name}
+        except Exception as e:
+            reply = {'ok': 0.0, 'errmsg': f'{type(e).__name__}: {e}', 'code': 8, 'codeName': 'UnknownError'}
+        oplog = self.oplog
+        with oplog.lock:
+            reply.setdefault('operationTime', oplog.cluster_time if self.primary else oplog.applied_time)
+            reply['$clusterTime'] = {
+                'clusterTime': oplog.cluster_time,
+                'signature': {'hash': Binary(b'\0' * 20), 'keyId': Int64(0)}
+            }
+        return reply
+
+    def _dispatch(self, name, body):
+        handler = getattr(self, f'_cmd_{name.lower()}', None)
+        if handler is None:
+            raise CommandError(59, 'CommandNotFound', f"no such command: '{name}'")
+        if name in WRITE_COMMANDS and not self.primary:
+            raise CommandError(10107, 'NotWritablePrimary', 'not primary')
+        if not self.primary:
+            self._wait_for((body.get('readConcern') or {}).get('afterClusterTime'))
+        db = body.get('$db', 'test')
+        with self.oplog.lock:
+            return handler(self.client()[db], body)
+
+    def _wait_for(self, after, timeout=30):
+        """Block a secondary read until it has applied the given cluster time"""
+        oplog = self.oplog
+        deadline = time.monotonic() + timeout
+        while True:
+            with oplog.lock:
+                oplog.catch_up()
+                if after is None or oplog.applied_time >= after:
+                    return
+            if time.monotonic() > deadline:
+                raise CommandError(50, 'MaxTimeMSExpired', f'secondary did not reach {after}')
+            time.sleep(0.02)
+
+    # Housekeeping
+
+    def _cmd_ping(self, db, body):
+        return {}
+
+    def _cmd_buildinfo(self, db, body):
+        return {'version': '7.0.0', 'versionArray': [7, 0, 0, 0]}
+
+    def _cmd_endsessions(self, db, body):
+        return {}
+
+    def _cmd_killcursors(self, db, body):
+        return {'cursorsKilled': body.get('cursors', []), 'cursorsNotFound': [], 'cursorsAlive': [], 'cursorsUnknown': []}
+
+    def _cmd_listcollections(self, db, body):
+        names = db.list_collection_names()
+        return _cursor(db.name, '$cmd.listCollections', [{'name': n, 'type': 'collection'} for n in names])
+
+    def _cmd_listindexes(self, db, body):
+        info = db[body['listIndexes']].index_information()
+        indexes = [dict(spec, name=name, key=dict(spec['key'])) for name, spec in info.items()]
+        return _cursor(db.name, body['listIndexes'], indexes)
+
+    def _cmd_createindexes(self, db, body):
+        collection = db[body['createIndexes']]
+        for index in body['indexes']:
+            options = {k: v for k, v in index.items() if k not in ('key', 'v', 'background')}
+            try:
+                collection.create_index(list(index['key'].items()), **options)
+            except (TypeError, NotImplementedError):
+                # Options mongomock does not model (e.g. partial TTL) only matter to a real server
+                collection.create_index(list(index['key'].items()), name=index.get('name'))
+        self.oplog.tick()
+        return {'numIndexesBefore': 0, 'numIndexesAfter': len(body['indexes'])}
+
+    def _cmd_drop(self, db, body):
+        db.drop_collection(body['drop'])
+        return {}
+
+    # Reads
+
+    def _cmd_find(self, db, body):
+        collection = db[body['find']]
+        cursor = collection.find(body.get('filter') or {}, body.get('projection') or None)
+        if body.get('sort'):
+            cursor = cursor.sort(list(body['sort'].items()))
+        if body.get('skip'):
+            cursor = cursor.skip(body['skip'])
+        if body.get('limit'):
+            cursor = cursor.limit(abs(body['limit']))
+        return _cursor(db.name, body['find'], list(cursor))
+
+    def _cmd_aggregate(self, db, body):
+        return _cursor(db.name, body['aggregate'], list(db[body['aggregate']].aggregate(body['pipeline'])))
+
+    def _cmd_count(self, db, body):
+        return {'n': db[body['count']].count_documents(body.get('query') or {})}
+
+    def _cmd_distinct(self, db, body):
+        return {'values': db[body['distinct']].distinct(body['key'], body.get('query') or {})}
+
+    # Writes: each records the post-images of the documents it touched
+
+    def _write(self, db, coll_name, before_ids, extra_ids=()):
+        collection = db[coll_name]
+        images = []
+        for _id in list(before_ids) + [i for i in extra_ids if i not in before_ids]:
+            images.append((_id, collection.find_one({'_id': _id})))
+        return self.oplog.record(db.name, coll_name, images)
+
+    def _cmd_insert(self, db, body):
+        collection = db[body['insert']]
+        errors, ids = [], []
+        for index, doc in enumerate(body.get('documents', [])):
+            try:
+                ids.append(collection.insert_one(doc).inserted_id)
+            except mongomock.DuplicateKeyError as e:
+                errors.append({'index': index, 'code': 11000, 'errmsg': str(e)})
+                if body.get('ordered', True):
+                    break
+        ts = self._write(db, body['insert'], ids)
+        reply = {'n': len(ids), 'operationTime': ts}
+        if errors:
+            reply['writeErrors'] = errors
+        return reply
+
+    def _cmd_update(self, db, body):
+        collection = db[body['update']]
+        matched = modified = 0
+        upserted, touched, errors = [], [], []
+        for index, update in enumerate(body.get('updates', [])):
+            query, spec = update.get('q') or {}, update['u']
+            before = {doc['_id']: doc for doc in collection.find(query)}
+            try:
+                if isinstance(spec, dict) and spec and not next(iter(spec)).startswith('$'):
+                    result = collection.replace_one(query, spec, upsert=update.get('upsert', False))
+                else:
+                    method = collection.update_many if update.get('multi') else collection.update_one
+                    kwargs = {'array_filters': update['arrayFilters']} if update.get('arrayFilters') else {}
+                    result = method(query, spec, upsert=update.get('upsert', False), **kwargs)
+            except Exception as e:
+                errors.append({'index': index, 'code': 2, 'errmsg': str(e)})
+                continue
+            matched += result.matched_count
+            modified += result.modified_count
+            touched += [_id for _id, doc in before.items() if collection.find_one({'_id': _id}) != doc]
+            if result.upserted_id is not None:
+                upserted.append({'index': index, '_id': result.upserted_id})
+                touched.append(result.upserted_id)
+        ts = self._write(db, body['update'], touched)
+        reply = {'n': matched + len(upserted), 'nModified': modified, 'operationTime': ts}
+        if upserted:
+            reply['upserted'] = upserted
+        if errors:
+            reply['writeErrors'] = errors
+        return reply
+
+    def _cmd_delete(self, db, body):
+        collection = db[body['delete']]
+        removed = []
+        for delete in body.get('deletes', []):
+            query = delete.get('q') or {}
+            if delete.get('limit') == 1:
+                doc = collection.find_one(query, {'_id': 1})
+                if doc is not None:
+                    collection.delete_one({'_id': doc['_id']})
+                    removed.append(doc['_id'])
+            else:
+                ids = [doc['_id'] for doc in collection.find(query, {'_id': 1})]
+                collection.delete_many({'_id': {'$in': ids}})
+                removed += ids
+        ts = self._write(db, body['delete'], removed)
+        return {'n': len(removed), 'operationTime': ts}
+
+    def _cmd_findandmodify(self, db, body):
+        coll_name = body.get('findAndModify') or body.get('findandmodify')
+        collection = db[coll_name]
+        query = body.get('query') or {}
+        sort = list(body['sort'].items()) if body.get('sort') else None
+        fields = body.get('fields') or None
+        before = {doc['_id']: doc for doc in collection.find(query)}
+        if body.get('remove'):
+            value = collection.find_one_and_delete(query, projection=fields, sort=sort)
+        else:
+            update = body['update']
+            returned = ReturnDocument.AFTER if body.get('new') else ReturnDocument.BEFORE
+            upsert = body.get('upsert', False)
+            if isinstance(update, dict) and update and not next(iter(update)).startswith('$'):
+                value = collection.find_one_and_replace(
+                    query, update, projection=fields, sort=sort, upsert=upsert, return_document=returned
+                )
+            else:
+                value = collection.find_one_and_update(
+                    query, update, projection=fields, sort=sort, upsert=upsert, return_document=returned
+                )
+        touched = [_id for _id, doc in before.items() if collection.find_one({'_id': _id}) != doc]
+        new_ids = [doc['_id'] for doc in collection.find(query, {'_id': 1}) if doc['_id'] not in before]
+        ts = self._write(db, coll_name, touched, new_ids)
+        last_error = {'n': 1 if value is not None or new_ids else 0, 'updatedExisting': bool(before) and not new_ids}
+        if new_ids:
+            last_error['upserted'] = new_ids[0]
+        return {'value': value, 'lastErrorObject': last_error, 'operationTime': ts}
+
+
+def _cursor(db_name, coll_name, docs):
+    # Everything in the first batch; cursor id 0 tells the driver there is no getMore
+    return {'cursor': {'id': Int64(0), 'ns': f'{db_name}.{coll_name}', 'firstBatch': docs}}
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """One client connection: read a message, answer it, repeat"""
+
+    def handle(self):
+        member = self.server.member
+        while True:
+            header = self._read(16)
+            if header is None:
+                return
+            length, request_id, _, op_code = struct.unpack('<iiii', header)
+            payload = self._read(length - 16)
+            if payload is None:
+                return
+            if op_code == OP_MSG:
+                flags, body = _parse_op_msg(payload)
+                reply = member.run_command(body)
+                if flags & 0x2:
+                    # moreToCome: unacknowledged write, no reply
+                    continue
+                data = struct.pack('<I', 0) + b'\0' + bson.encode(reply)
+                self._send(request_id, OP_MSG, data)
+            elif op_code == OP_QUERY:
+                body = _parse_op_query(payload)
+                reply = member.run_command(body)
+                data = struct.pack('<iqii', 0, 0, 0, 1) + bson.encode(reply)
+                self._send(request_id, OP_REPLY, data)
+            else:
+                return
+
+    def _read(self, size):
+        chunks = []
+        while size:
+            chunk = self.request.recv(size)
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def _send(self, request_id, op_code, data):
+        self.request.sendall(struct.pack('<iiii', 16 + len(data), request_id + 1, request_id, op_code) + data)
+
+
+def _parse_op_msg(data):
+    flags = struct.unpack_from('<I', data, 0)[0]
+    end = len(data) - (4 if flags & 0x1 else 0)
+    pos = 4
+    body, sequences = {}, {}
+    while pos < end:
+        kind = data[pos]
+        pos += 1
+        size = struct.unpack_from('<i', data, pos)[0]
+        if kind == 0:
+            body = bson.decode(data[pos:pos + size], CODEC_OPTIONS)
+            pos += size
+            continue
+        section_end = pos + size
+        name_end = data.index(b'\0', pos + 4)
+        identifier = data[pos + 4:name_end].decode()
+        docs, cursor = [], name_end + 1
+        while cursor < section_end:
+            doc_size = struct.unpack_from('<i', data, cursor)[0]
+            docs.append(bson.decode(data[cursor:cursor + doc_size], CODEC_OPTIONS))
+            cursor += doc_size
+        sequences[identifier] = docs
+        pos = section_end
+    body.update(sequences)
+    return flags, body
+
+
+def _parse_op_query(data):
+    name_end = data.index(b'\0', 4)
+    database = data[4:name_end].decode().split('.', 1)[0]
+    pos = name_end + 1 + 8
+    size = struct.unpack_from('<i', data, pos)[0]
+    body = bson.decode(data[pos:pos + size], CODEC_OPTIONS)
+    # Legacy handshakes wrap the command as {$query: {...}}
+    body = body.get('$query', body)
+    body.setdefault('$db', database)
+    return body
+
+
+class StandInReplicaSet:
+    """A primary and a lagging secondary on local ports, sharing one write log"""
+
+    def __init__(self, lag=1.0, set_name='rs0'):
+        self.set_name = set_name
+        self.oplog = _Oplog(lag)
+        self.members = []
+        self.members = [_Member(self, primary=True), _Member(self, primary=False)]
+        self._threads = []
+
+    def uri(self, database='test', **options):
+        options = {'replicaSet': self.set_name, 'heartbeatFrequencyMS': 500, **options}
+        query = '&'.join(f'{k}={v}' for k, v in options.items())
+        return f"mongodb://{','.join(m.address for m in self.members)}/{database}?{query}"
+
+    def start(self):
+        for member in self.members:
+            thread = threading.Thread(target=member.server.serve_forever, name=f'replset-{member.address}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for member in self.members:
+            member.server.shutdown()
+            member.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
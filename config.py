@@ -12,6 +12,94 @@ class Config:
     SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')  # Sent as X-Admin-Token for admin-only features
+
+    # Request profiling
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or 'profiles'
+    PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 50))  # Oldest profiles are removed first
+    PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))  # Seconds between stack samples
+    PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # Profile 1-in-N requests, 0 disables
+
+    # MongoDB connection pool (per process)
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 20))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 2))  # Kept open so bursts skip the TCP/TLS handshake
+    MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 60000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))  # Fail fast instead of queueing forever
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+    MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')  # e.g. 'zstd,snappy,zlib'; zstd/snappy need extra packages
+
+    # Read routing: endpoint -> read preference; endpoints not listed read from the primary
+    MONGO_READ_PREFERENCES = {
+        'diagnosis.history': 'secondaryPreferred',
+        'diagnosis.export_csv': 'secondaryPreferred',
+        'diagnosis.comparison': 'secondaryPreferred',
+        'diagnosis.recommendations': 'secondaryPreferred',
+        'analytics_export': 'secondaryPreferred',
+    }
+    MONGO_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', 90))  # MongoDB minimum is 90
+
+    # Nearby hospitals on the emergency page
+    HOSPITALS_DATA_FILE = os.environ.get('HOSPITALS_DATA_FILE') or 'data/hospitals.csv'  # CSV or GeoJSON
+    HOSPITALS_GEOHASH_PRECISION = int(os.environ.get('HOSPITALS_GEOHASH_PRECISION', 6))  # Cache cell size, ~1.2 x 0.6 km
+    HOSPITALS_DEFAULT_COUNT = 5
+    HOSPITALS_MAX_COUNT = 20
+
+    # Prediction result cache (per process)
+    PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))  # 0 disables the cache
+    PREDICTION_CACHE_TTL = int(os.environ.get('PREDICTION_CACHE_TTL', 0)) or None  # Seconds; unset keeps entries until evicted
+
+    # Background jobs (run with: python worker.py)
+    JOB_RESULTS_FOLDER = os.environ.get('JOB_RESULTS_FOLDER') or 'job_results'
+    JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 3))
+    JOBS_RETRY_DELAY = int(os.environ.get('JOBS_RETRY_DELAY', 30))  # Seconds, doubled on each retry
+    JOBS_LEASE_SECONDS = int(os.environ.get('JOBS_LEASE_SECONDS', 300))  # Jobs of dead workers are retried after this
+    JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 1.0))
+    JOBS_ASYNC_IMAGE_ANALYSIS = os.environ.get('JOBS_ASYNC_IMAGE_ANALYSIS', 'false').lower() == 'true'  # Needs a running worker
+
+    # Orphaned upload sweeper (python manage.py sweep-uploads)
+    UPLOAD_QUARANTINE_FOLDER = os.environ.get('UPLOAD_QUARANTINE_FOLDER') or None  # Move orphans here instead of deleting
+    UPLOAD_SWEEP_MIN_AGE = int(os.environ.get('UPLOAD_SWEEP_MIN_AGE', 3600))  # Seconds; newer files may still be mid-submission
+    UPLOAD_SWEEP_BATCH_SIZE = int(os.environ.get('UPLOAD_SWEEP_BATCH_SIZE', 500))
+    UPLOAD_SWEEP_BATCH_PAUSE = float(os.environ.get('UPLOAD_SWEEP_BATCH_PAUSE', 0.5))  # Seconds between batches
+
+    # DICOM ingestion
+    DERIVATIVES_FOLDER = os.environ.get('DERIVATIVES_FOLDER', 'derivatives')  # Previews and other files generated from uploads
+    DICOM_MAX_FRAMES = int(os.environ.get('DICOM_MAX_FRAMES', 16))  # Frames sampled from a multi-frame study for analysis
+    DICOM_PREVIEW_SIZE = int(os.environ.get('DICOM_PREVIEW_SIZE', 256))  # Pixels
+
+    # Upload thumbnails (stored under DERIVATIVES_FOLDER/thumbs)
+    THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', 160))  # Longest edge in pixels
+    THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', 75))
+    THUMBNAILS_ASYNC = os.environ.get('THUMBNAILS_ASYNC', 'false').lower() in ('1', 'true', 'yes')  # Generate in the job worker
+
+    # Templates
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR', '.jinja_cache')  # Empty to compile from source
+    TEMPLATE_FRAGMENT_CACHE_SIZE = int(os.environ.get('TEMPLATE_FRAGMENT_CACHE_SIZE', 256))  # 0 disables {% cache %}
+
+    # Rate limiting: '<requests>/<seconds>' token buckets per endpoint, per user (or per IP when logged out)
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # 'memory' (per process) or 'mongo' (shared)
+    RATE_LIMITS = {
+        'chatbot': os.environ.get('RATE_LIMIT_CHATBOT', '30/60'),
+        'auth.login': os.environ.get('RATE_LIMIT_LOGIN', '10/300'),
+        'auth.forgot_password': os.environ.get('RATE_LIMIT_FORGOT_PASSWORD', '5/900'),
+        'diagnosis.input': os.environ.get('RATE_LIMIT_DIAGNOSIS', '20/300')
+    }
+
+    # Parquet export for analytics (python manage.py export-parquet)
+    ANALYTICS_EXPORT_FOLDER = os.environ.get('ANALYTICS_EXPORT_FOLDER', 'analytics/diagnoses')
+    ANALYTICS_EXPORT_BATCH_SIZE = int(os.environ.get('ANALYTICS_EXPORT_BATCH_SIZE', 10000))  # Rows per cursor batch and row group
+    ANALYTICS_EXPORT_SAFETY_SECONDS = int(os.environ.get('ANALYTICS_EXPORT_SAFETY_SECONDS', 600))  # Newer rows wait for the next run; keep above MONGO_MAX_STALENESS_SECONDS
+
+    # Live alerts at /events/alerts (Server-Sent Events)
+    EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'auto')  # 'auto', 'changestream' (replica set) or 'memory' (per process)
+    EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))  # Per subscriber; a subscriber that falls further behind is disconnected
+    EVENTS_REPLAY_SIZE = int(os.environ.get('EVENTS_REPLAY_SIZE', 500))  # Recent events replayed to reconnecting clients (Last-Event-ID)
+    EVENTS_MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 1000))  # Per process; under asgi.py a stream costs a socket and a queue
+    EVENTS_MAX_THREAD_STREAMS = int(os.environ.get('EVENTS_MAX_THREAD_STREAMS', 2))  # Streams served from WSGI threads (Gunicorn), each holding one; keep below GUNICORN_THREADS
+    EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15))
+    EVENTS_RETRY_MS = int(os.environ.get('EVENTS_RETRY_MS', 3000))  # Browser reconnect delay
 
 
 
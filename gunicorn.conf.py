@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for production serving
+
+Values can be overridden with the usual environment variables
+(WEB_CONCURRENCY, GUNICORN_THREADS, BIND, GUNICORN_TIMEOUT).
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Load the app (and wsgi.preload) once in the master before forking
+preload_app = True
+
+# Recycle workers occasionally; the preloaded pages make respawns cheap
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+
+def pre_fork(server, worker):
+    # Freeze anything the master allocated since wsgi.py was imported
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Open this worker's MongoDB connections before it takes traffic
+    from app import mongo
+    try:
+        mongo.cx.admin.command('ping')
+    except Exception as e:
+        server.log.warning(f"MongoDB warm-up failed in worker {worker.pid}: {e}")
@@ -0,0 +1,117 @@
+"""
+Maintenance commands
+
+    python manage.py sweep-uploads [--dry-run]
+    python manage.py migrate-uploads [--batch-size N] [--dry-run]
+    python manage.py build-assets
+    python manage.py export-parquet [--full] [--output DIR]
+    python manage.py backfill-condition-masks
+    python manage.py ensure-indexes
+"""
+
+import argparse
+import json
+from app import app, mongo, job_queue
+
+
+def sweep_uploads(args):
+    from services.uploads import sweep_orphaned_uploads
+    stats = sweep_orphaned_uploads(
+        mongo,
+        app.config['UPLOAD_FOLDER'],
+        quarantine_folder=app.config['UPLOAD_QUARANTINE_FOLDER'],
+        min_age_seconds=app.config['UPLOAD_SWEEP_MIN_AGE'] if args.min_age is None else args.min_age,
+        batch_size=app.config['UPLOAD_SWEEP_BATCH_SIZE'],
+        batch_pause=app.config['UPLOAD_SWEEP_BATCH_PAUSE'],
+        dry_run=args.dry_run
+    )
+    print(json.dumps(stats, indent=2))
+
+
+def migrate_uploads(args):
+    from services.uploads import migrate_upload_layout
+    stats = migrate_upload_layout(
+        mongo,
+        app.config['UPLOAD_FOLDER'],
+        batch_size=args.batch_size,
+        batch_pause=args.batch_pause,
+        dry_run=args.dry_run
+    )
+    print(json.dumps(stats, indent=2))
+
+
+def build_assets(args):
+    from services.assets import build_assets as build
+    manifest = build(app.static_folder)
+    print(json.dumps(manifest, indent=2))
+
+
+def export_parquet(args):
+    from services.analytics import export_diagnoses_parquet
+    with app.app_context():
+        stats = export_diagnoses_parquet(
+            mongo,
+            args.output or app.config['ANALYTICS_EXPORT_FOLDER'],
+            batch_size=args.batch_size or app.config['ANALYTICS_EXPORT_BATCH_SIZE'],
+            full=args.full,
+            safety_seconds=app.config['ANALYTICS_EXPORT_SAFETY_SECONDS']
+        )
+    print(json.dumps(stats, indent=2))
+
+
+def backfill_condition_masks(args):
+    from models.ml_models import condition_mask
+    # One update per distinct condition string rather than per record
+    missing = {'result.condition_mask': {'$exists': False}, 'result.condition': {'$type': 'string'}}
+    updated = 0
+    for condition in mongo.db.diagnoses.distinct('result.condition', missing):
+        updated += mongo.db.diagnoses.update_many(
+            dict(missing, **{'result.condition': condition}),
+            {'$set': {'result.condition_mask': condition_mask(condition)}}
+        ).modified_count
+    print(json.dumps({'updated': updated}, indent=2))
+
+
+def ensure_indexes(args):
+    from services.mongo import ensure_indexes as create_indexes
+    create_indexes(mongo)
+    job_queue.ensure_indexes()
+    print('Indexes created')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Maintenance commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sweep = commands.add_parser('sweep-uploads', help='delete or quarantine upload files no diagnosis references')
+    sweep.add_argument('--dry-run', action='store_true', help='only report what would be removed')
+    sweep.add_argument('--min-age', type=int, default=None, help='skip files newer than this many seconds')
+    sweep.set_defaults(func=sweep_uploads)
+
+    migrate = commands.add_parser('migrate-uploads', help='move flat uploads into the sharded layout (resumable)')
+    migrate.add_argument('--batch-size', type=int, default=500)
+    migrate.add_argument('--batch-pause', type=float, default=0.0, help='seconds to sleep between batches')
+    migrate.add_argument('--dry-run', action='store_true', help='only report what would be moved')
+    migrate.set_defaults(func=migrate_uploads)
+
+    assets = commands.add_parser('build-assets', help='minify, fingerprint and precompress static CSS/JS')
+    assets.set_defaults(func=build_assets)
+
+    export = commands.add_parser('export-parquet', help='export new diagnoses to the partitioned Parquet dataset')
+    export.add_argument('--full', action='store_true', help='ignore the watermark and rewrite the whole dataset')
+    export.add_argument('--output', default=None, help='dataset folder (default: ANALYTICS_EXPORT_FOLDER)')
+    export.add_argument('--batch-size', type=int, default=None)
+    export.set_defaults(func=export_parquet)
+
+    backfill = commands.add_parser('backfill-condition-masks', help='add result.condition_mask to diagnoses stored without one')
+    backfill.set_defaults(func=backfill_condition_masks)
+
+    indexes = commands.add_parser('ensure-indexes', help='create the diagnosis and job indexes')
+    indexes.set_defaults(func=ensure_indexes)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
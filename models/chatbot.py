@@ -0,0 +1,45 @@
+"""
+Rule-based chatbot (MJ)
+"""
+
+# Simple rule-based chatbot with MJ personality
+RESPONSES = {
+    'hello': 'Hello! I\'m MJ, your AI assistant. How can I help you today?',
+    'hi': 'Hi there! I\'m MJ, here to assist you with the medical diagnosis system. What can I do for you?',
+    'mj': 'Yes, that\'s me! I\'m MJ, your AI assistant. How can I help?',
+    'help': 'I\'m MJ and I can help you with: login, registration, diagnosis submission, viewing results, and more. What do you need help with?',
+    'diagnosis': 'To submit a diagnosis, go to the Diagnosis page, fill in your vital signs, upload medical images (optional), select an algorithm, and click Submit.',
+    'result': 'After submitting a diagnosis, you\'ll see results on the Result page with color-coded indicators (green=normal, yellow=moderate, red=critical).',
+    'emergency': 'If your diagnosis shows critical results, the Emergency Alert page will automatically open with nearby hospital information and emergency contacts.',
+    'history': 'You can view all your previous diagnosis records in the History page. You can filter by vital sign or date, and export them as CSV or PDF.',
+    'profile': 'Your profile page shows your personal information, age, gender, medical history, and emergency contact details. You can update it anytime.',
+    'settings': 'In Settings, you can change theme (dark/light mode), select language (English/Tamil), or delete your account if needed.',
+    'logout': 'Click on the Logout button in the navigation menu to safely log out of your account.',
+    'register': 'To create an account, go to the Registration page and fill in: Username (unique), Password (min 6 chars), Name, Age, Gender, Contact Number, School/College Name (max 10 chars), and Gmail ID.',
+    'forgot password': 'If you forgot your password, click "Forgot Password" on the login page and use your Gmail ID and School/College name to recover it.',
+    'algorithm': 'You can choose from 4 ML algorithms: Logistic Regression, SVM, CNN (for images), or LSTM. Each provides different analysis approaches.',
+    'normal': 'Normal results mean your vital signs are within healthy ranges. Continue monitoring and follow general health guidelines.',
+    'critical': 'Critical results require immediate medical attention. The Emergency Alert page will open automatically with hospital information.',
+    'thanks': 'You\'re welcome! I\'m always here to help. Is there anything else you need?',
+    'thank you': 'You\'re welcome! Feel free to ask me anything else.',
+    'bye': 'Goodbye! Take care of your health. I\'m here whenever you need me!'
+}
+
+def get_chatbot_response(message):
+    """Return MJ's reply for a lowercased, stripped message"""
+    if not message:
+        return 'Hi! I\'m MJ. Please ask me something.'
+    
+    # Check for matching keywords
+    for key, value in RESPONSES.items():
+        if key in message:
+            return value
+    
+    # Check for partial matches
+    if any(word in message for word in ['login', 'sign in', 'log in']):
+        return 'To login, enter your username and password on the login page. If you don\'t have an account, click "Register here" to create one.'
+    elif any(word in message for word in ['register', 'sign up', 'create account']):
+        return 'To register, click "Register here" on the login page and fill in all required fields: Username, Password, Name, Age, Gender, Contact, School/College Name, and Gmail ID.'
+    elif any(word in message for word in ['vital', 'signs', 'temperature', 'heart rate', 'blood pressure']):
+        return 'Vital signs include: Body Temperature, Heart Rate, Blood Pressure (systolic/diastolic), Respiratory Rate, and Oxygen Saturation. Enter these on the Diagnosis page.'
+    return "I'm MJ, and I'm here to help! Try asking me about: diagnosis, results, history, profile, settings, or how to use any feature of the system."
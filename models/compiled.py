@@ -0,0 +1,409 @@
+"""
+Compiled inference for fitted scikit-learn models
+
+sklearn's predict_proba spends most of a single-row call validating and
+dispatching the input. These classes export a fitted StandardScaler and
+LogisticRegression or SVC once into contiguous float32 arrays with the
+scaler folded in, and evaluate them with numpy ufuncs writing into
+per-thread buffers that are allocated on first use and then reused.
+Every intermediate, the SVM's pairwise coupling included, goes into those
+buffers; what is left per call is numpy's own bounded iteration buffer
+for broadcasting and dtype casts, and the label array predict returns.
+
+predict_proba_row(row) scores one sample, predict_proba(X) a batch. Both
+return a view of the calling thread's buffer, which the next call on that
+thread overwrites; copy the result if it has to outlive the call.
+"""
+
+import threading
+import numpy as np
+
+DTYPE = np.float32
+
+# libsvm clips pairwise Platt probabilities to this range
+MIN_PROB = 1e-7
+
+# Largest absolute probability difference accepted against sklearn
+PARITY_TOLERANCE = 1e-4
+
+
+class _Scratch(threading.local):
+    """Per-thread evaluation buffers, grown to the largest batch seen"""
+
+    def __init__(self):
+        self.capacity = 0
+        self.buffers = None
+
+
+class _CompiledModel:
+    """Buffer management shared by the compiled models"""
+
+    def __init__(self, classes, n_features):
+        self.classes_ = np.asarray(classes)
+        self.n_features = n_features
+        self.n_classes = len(self.classes_)
+        self._scratch = _Scratch()
+
+    def _allocate(self, rows):
+        raise NotImplementedError
+
+    def _buffers(self, rows):
+        scratch = self._scratch
+        if rows > scratch.capacity:
+            scratch.capacity = max(rows, 2 * scratch.capacity)
+            scratch.buffers = self._allocate(scratch.capacity)
+        return scratch.buffers
+
+    def _check_row(self, row):
+        if len(row) != self.n_features:
+            raise ValueError(f'Expected {self.n_features} features, got {len(row)}')
+
+    def _check_batch(self, X):
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f'Expected an array of shape (n, {self.n_features}), got {X.shape}')
+        return X
+
+    def predict_row(self, row):
+        """Class label for a single sample"""
+        return self.classes_[int(np.argmax(self.predict_proba_row(row)))]
+
+    def predict(self, X):
+        """Class labels for a batch"""
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+class CompiledLinearModel(_CompiledModel):
+    """StandardScaler + LogisticRegression as one float32 affine map"""
+
+    def __init__(self, weights, bias, classes):
+        super().__init__(classes, weights.shape[0])
+        # (n_features, n_outputs): one output for binary, one per class otherwise
+        self.weights = np.ascontiguousarray(weights, dtype=DTYPE)
+        self.bias = np.ascontiguousarray(bias, dtype=DTYPE)
+        self.n_outputs = self.weights.shape[1]
+
+    @classmethod
+    def from_sklearn(cls, scaler, model):
+        """Fold a fitted scaler into a fitted LogisticRegression"""
+        if not hasattr(model, 'coef_'):
+            raise ValueError('LogisticRegression is not fitted')
+        coef = np.asarray(model.coef_, dtype=np.float64)
+        intercept = np.asarray(model.intercept_, dtype=np.float64)
+        mean, scale = _scaler_params(scaler, coef.shape[1])
+        # coef @ ((x - mean) / scale) + b == (coef / scale) @ x + (b - coef @ (mean / scale))
+        weights = (coef / scale).T
+        bias = intercept - coef @ (mean / scale)
+        return cls(weights, bias, model.classes_)
+
+    def _allocate(self, rows):
+        return {
+            'x': np.empty((rows, self.n_features), dtype=DTYPE),
+            'z': np.empty((rows, self.n_outputs), dtype=DTYPE),
+            'max': np.empty((rows, 1), dtype=DTYPE),
+            'sum': np.empty((rows, 1), dtype=DTYPE),
+            'proba': np.empty((rows, self.n_classes), dtype=DTYPE),
+        }
+
+    def _evaluate(self, x, z, row_max, row_sum, proba):
+        np.dot(x, self.weights, out=z)
+        z += self.bias
+        if self.n_outputs == 1:
+            # Binary: sigmoid of the single decision value
+            positive = proba[:, 1:]
+            np.negative(z, out=z)
+            np.exp(z, out=z)
+            z += 1
+            np.reciprocal(z, out=positive)
+            np.subtract(1, positive, out=proba[:, :1])
+        else:
+            # Multinomial: softmax over the class scores
+            np.max(z, axis=1, keepdims=True, out=row_max)
+            z -= row_max
+            np.exp(z, out=proba)
+            np.sum(proba, axis=1, keepdims=True, out=row_sum)
+            proba /= row_sum
+        return proba
+
+    def predict_proba_row(self, row):
+        """Class probabilities for one sample, shape (n_classes,)"""
+        self._check_row(row)
+        b = self._buffers(1)
+        x = b['x'][:1]
+        x[0] = row
+        return self._evaluate(x, b['z'][:1], b['max'][:1], b['sum'][:1], b['proba'][:1])[0]
+
+    def predict_proba(self, X):
+        """Class probabilities for a batch, shape (n, n_classes)"""
+        X = self._check_batch(X)
+        n = X.shape[0]
+        b = self._buffers(n)
+        x = b['x'][:n]
+        x[...] = X
+        return self._evaluate(x, b['z'][:n], b['max'][:n], b['sum'][:n], b['proba'][:n])
+
+
+class CompiledSVC(_CompiledModel):
+    """StandardScaler + SVC(probability=True) with float32 support vectors"""
+
+    def __init__(self, scale, shift, support_vectors, pair_coef, intercept,
+                 prob_a, prob_b, classes, kernel, gamma, coef0, degree):
+        super().__init__(classes, support_vectors.shape[1])
+        # Scaling is x * scale + shift
+        self.scale = np.ascontiguousarray(scale, dtype=DTYPE)
+        self.shift = np.ascontiguousarray(shift, dtype=DTYPE)
+        # (n_features, n_support): a row or a batch times this gives every kernel dot product
+        self.support_vectors = np.ascontiguousarray(support_vectors.T, dtype=DTYPE)
+        self.support_norms = np.ascontiguousarray(np.einsum('ij,ij->i', support_vectors, support_vectors), dtype=DTYPE)
+        # (n_support, n_pairs): dual coefficient of each support vector in each one-vs-one problem
+        self.pair_coef = np.ascontiguousarray(pair_coef, dtype=DTYPE)
+        self.intercept = np.ascontiguousarray(intercept, dtype=DTYPE)
+        self.prob_a = np.asarray(prob_a, dtype=np.float64)
+        self.prob_b = np.asarray(prob_b, dtype=np.float64)
+        self.kernel = kernel
+        self.gamma = DTYPE(gamma)
+        self.coef0 = DTYPE(coef0)
+        self.degree = degree
+        self.n_support = support_vectors.shape[0]
+        self.n_pairs = self.pair_coef.shape[1]
+        pairs = [(i, j) for i in range(self.n_classes) for j in range(i + 1, self.n_classes)]
+        self._pair_i = np.array([i for i, _ in pairs], dtype=np.intp)
+        self._pair_j = np.array([j for _, j in pairs], dtype=np.intp)
+
+    @classmethod
+    def from_sklearn(cls, scaler, model):
+        """Export a fitted scaler and a fitted dense SVC(probability=True)"""
+        if not hasattr(model, 'support_vectors_'):
+            raise ValueError('SVC is not fitted')
+        if callable(model.kernel) or model.kernel not in ('linear', 'poly', 'rbf', 'sigmoid'):
+            raise ValueError(f'Unsupported SVC kernel: {model.kernel!r}')
+        if getattr(model, '_sparse', False):
+            raise ValueError('Sparse SVC models are not supported')
+        if not len(getattr(model, '_probA', ())):
+            raise ValueError('SVC was not fitted with probability=True')
+
+        support_vectors = np.asarray(model.support_vectors_, dtype=np.float64)
+        mean, scale = _scaler_params(scaler, support_vectors.shape[1])
+
+        # libsvm layout: for the pair (i, j), support vectors of class i use
+        # row j - 1 of _dual_coef_ and those of class j use row i
+        n_classes = len(model.classes_)
+        dual_coef = np.asarray(model._dual_coef_, dtype=np.float64)
+        starts = np.concatenate([[0], np.cumsum(model._n_support)])
+        pair_coef = np.zeros((support_vectors.shape[0], n_classes * (n_classes - 1) // 2))
+        pair = 0
+        for i in range(n_classes):
+            for j in range(i + 1, n_classes):
+                pair_coef[starts[i]:starts[i + 1], pair] = dual_coef[j - 1, starts[i]:starts[i + 1]]
+                pair_coef[starts[j]:starts[j + 1], pair] = dual_coef[i, starts[j]:starts[j + 1]]
+                pair += 1
+
+        return cls(
+            1.0 / scale, -mean / scale, support_vectors, pair_coef, model._intercept_,
+            model._probA, model._probB, model.classes_,
+            model.kernel, model._gamma, model.coef0, model.degree
+        )
+
+    def _allocate(self, rows):
+        return {
+            'x': np.empty((rows, self.n_features), dtype=DTYPE),
+            'norms': np.empty(rows, dtype=DTYPE),
+            'kernel': np.empty((rows, self.n_support), dtype=DTYPE),
+            'decision': np.empty((rows, self.n_pairs), dtype=DTYPE),
+            'pairwise': np.empty((rows, self.n_pairs), dtype=np.float64),
+            'q': np.empty((rows, self.n_classes, self.n_classes), dtype=np.float64),
+            'qp': np.empty((rows, self.n_classes), dtype=np.float64),
+            'pqp': np.empty(rows, dtype=np.float64),
+            'step': np.empty(rows, dtype=np.float64),
+            'tmp': np.empty(rows, dtype=np.float64),
+            'diff': np.empty((rows, self.n_classes), dtype=np.float64),
+            'active': np.empty(rows, dtype=bool),
+            'still': np.empty(rows, dtype=bool),
+            'proba': np.empty((rows, self.n_classes), dtype=np.float64),
+            'votes': np.empty((rows, self.n_classes), dtype=np.intp),
+            'labels': np.empty(rows, dtype=np.intp),
+        }
+
+    def _decision(self, x, norms, k, decision):
+        x *= self.scale
+        x += self.shift
+        np.dot(x, self.support_vectors, out=k)
+        if self.kernel == 'rbf':
+            # exp(-gamma * (|x|^2 - 2 x.sv + |sv|^2))
+            np.einsum('ij,ij->i', x, x, out=norms)
+            k *= -2
+            k += self.support_norms
+            k += norms[:, None]
+            np.maximum(k, 0, out=k)
+            k *= -self.gamma
+            np.exp(k, out=k)
+        elif self.kernel == 'poly':
+            k *= self.gamma
+            k += self.coef0
+            np.power(k, self.degree, out=k)
+        elif self.kernel == 'sigmoid':
+            k *= self.gamma
+            k += self.coef0
+            np.tanh(k, out=k)
+        np.dot(k, self.pair_coef, out=decision)
+        decision += self.intercept
+        return decision
+
+    @staticmethod
+    def _coupling_buffers(b, n):
+        return [b[name][:n] for name in ('pairwise', 'proba', 'q', 'qp', 'pqp', 'step', 'tmp', 'diff', 'active', 'still')]
+
+    def _proba(self, decision, pairwise, proba, q, qp, pqp, step, tmp, diff, active, still):
+        # Platt scaling of every one-vs-one decision value, as libsvm does
+        np.multiply(decision, self.prob_a, out=pairwise)
+        pairwise += self.prob_b
+        np.exp(pairwise, out=pairwise)
+        pairwise += 1
+        np.reciprocal(pairwise, out=pairwise)
+        np.clip(pairwise, MIN_PROB, 1 - MIN_PROB, out=pairwise)
+        # Pairwise coupling matrix Q for every row; sklearn's libsvm couples
+        # binary problems too, so there is no two-class shortcut
+        q.fill(0)
+        for pair, (i, j) in enumerate(zip(self._pair_i, self._pair_j)):
+            r = pairwise[:, pair]
+            # Q[i, j] = Q[j, i] = r (r - 1), Q[i, i] += (1 - r)^2, Q[j, j] += r^2
+            np.subtract(r, 1, out=tmp)
+            np.multiply(r, tmp, out=q[:, i, j])
+            q[:, j, i] = q[:, i, j]
+            np.subtract(1, r, out=tmp)
+            tmp *= tmp
+            q[:, i, i] += tmp
+            np.multiply(r, r, out=tmp)
+            q[:, j, j] += tmp
+        return _couple(q, proba, qp, pqp, step, tmp, diff, active, still)
+
+    def _vote(self, decision, votes, wins, labels):
+        # libsvm's one-vs-one vote: a positive decision for the pair (i, j)
+        # is a vote for i, anything else for j; ties go to the lower class
+        votes.fill(0)
+        for pair, (i, j) in enumerate(zip(self._pair_i, self._pair_j)):
+            np.greater(decision[:, pair], 0, out=wins)
+            votes[:, i] += wins
+            np.logical_not(wins, out=wins)
+            votes[:, j] += wins
+        return np.argmax(votes, axis=1, out=labels)
+
+    def decision_function_row(self, row):
+        """Raw one-vs-one decision values for one sample, in libsvm's sign convention"""
+        self._check_row(row)
+        b = self._buffers(1)
+        x = b['x'][:1]
+        x[0] = row
+        return self._decision(x, b['norms'][:1], b['kernel'][:1], b['decision'][:1])[0]
+
+    def predict_proba_row(self, row):
+        """Class probabilities for one sample, shape (n_classes,)"""
+        self._check_row(row)
+        b = self._buffers(1)
+        x = b['x'][:1]
+        x[0] = row
+        decision = self._decision(x, b['norms'][:1], b['kernel'][:1], b['decision'][:1])
+        return self._proba(decision, *self._coupling_buffers(b, 1))[0]
+
+    def predict_proba(self, X):
+        """Class probabilities for a batch, shape (n, n_classes)"""
+        X = self._check_batch(X)
+        n = X.shape[0]
+        b = self._buffers(n)
+        x = b['x'][:n]
+        x[...] = X
+        decision = self._decision(x, b['norms'][:n], b['kernel'][:n], b['decision'][:n])
+        return self._proba(decision, *self._coupling_buffers(b, n))
+
+    def predict_row(self, row):
+        """Class label for a single sample, by one-vs-one vote like SVC.predict"""
+        votes = [0] * self.n_classes
+        for i, j, value in zip(self._pair_i, self._pair_j, self.decision_function_row(row).tolist()):
+            votes[i if value > 0 else j] += 1
+        return self.classes_[votes.index(max(votes))]
+
+    def predict(self, X):
+        """Class labels for a batch, by one-vs-one vote like SVC.predict"""
+        X = self._check_batch(X)
+        n = X.shape[0]
+        b = self._buffers(n)
+        x = b['x'][:n]
+        x[...] = X
+        decision = self._decision(x, b['norms'][:n], b['kernel'][:n], b['decision'][:n])
+        return self.classes_[self._vote(decision, b['votes'][:n], b['still'][:n], b['labels'][:n])]
+
+
+def check_parity(compiled, scaler, model, X, rows=20):
+    """Compare a compiled model with sklearn on raw samples X
+
+    Returns (largest probability difference, label disagreements), covering
+    the batch path on all of X and the single-row path on its first rows.
+    """
+    X_scaled = scaler.transform(X) if scaler is not None else X
+    expected = model.predict_proba(X_scaled)
+    labels = model.predict(X_scaled)
+    diff = float(np.max(np.abs(compiled.predict_proba(X) - expected)))
+    mismatches = int(np.sum(compiled.predict(X) != labels))
+    for x, p, label in zip(X[:rows], expected[:rows], labels[:rows]):
+        diff = max(diff, float(np.max(np.abs(compiled.predict_proba_row(x) - p))))
+        mismatches += compiled.predict_row(x) != label
+    return diff, mismatches
+
+
+def _scaler_params(scaler, n_features):
+    """Mean and scale of a fitted StandardScaler, or the identity"""
+    mean = getattr(scaler, 'mean_', None)
+    scale = getattr(scaler, 'scale_', None)
+    if scaler is not None and not hasattr(scaler, 'n_features_in_'):
+        raise ValueError('StandardScaler is not fitted')
+    mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+    scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+    return mean, scale
+
+
+def _couple(q, p, qp, pqp, step, tmp, diff, active, still):
+    """Class probabilities from pairwise coupling matrices, one per row
+
+    Vectorised form of libsvm's multiclass_probability (Wu, Lin and Weng,
+    method 2). A row stops moving once it meets libsvm's stopping rule, so
+    every row gets the same answer it would get on its own. Every
+    intermediate is written into the given buffers.
+    """
+    k = p.shape[1]
+    eps = 0.005 / k
+    p.fill(1.0 / k)
+    active.fill(True)
+    for _ in range(max(100, k)):
+        np.einsum('ntj,nj->nt', q, p, out=qp)
+        np.einsum('nt,nt->n', p, qp, out=pqp)
+        # Converged once max |Qp - pQp| < eps
+        np.subtract(qp, pqp[:, None], out=diff)
+        np.abs(diff, out=diff)
+        np.max(diff, axis=1, out=tmp)
+        np.greater_equal(tmp, eps, out=still)
+        active &= still
+        if not active.any():
+            break
+        for t in range(k):
+            q_tt = q[:, t, t]
+            qp_t = qp[:, t]
+            np.subtract(pqp, qp_t, out=step)
+            step /= q_tt
+            step *= active
+            p[:, t] += step
+            # pQp += step (step Q[t, t] + 2 Qp[t])
+            np.multiply(step, q_tt, out=tmp)
+            tmp += qp_t
+            tmp += qp_t
+            tmp *= step
+            pqp += tmp
+            # Qp += step Q[:, t]
+            np.multiply(step[:, None], q[:, t], out=diff)
+            qp += diff
+            step += 1
+            pqp /= step
+            pqp /= step
+            qp /= step[:, None]
+            p /= step[:, None]
+    return p
+
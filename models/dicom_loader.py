@@ -0,0 +1,168 @@
+"""
+DICOM ingestion with bounded memory
+
+Headers are parsed without reading pixel data. For uncompressed transfer
+syntaxes the pixel buffer is memory-mapped and frames are downsampled one
+at a time, so a multi-frame study of any size never has to fit in memory.
+Compressed studies are decoded frame by frame where pydicom supports it;
+deflated ones are inflated and decoded whole.
+"""
+
+import os
+import numpy as np
+from PIL import Image
+
+# Optional import for DICOM support
+try:
+    import pydicom
+    from pydicom.uid import ExplicitVRBigEndian
+    PYDICOM_AVAILABLE = True
+except ImportError:
+    PYDICOM_AVAILABLE = False
+    print("Warning: pydicom not available. DICOM uploads cannot be analyzed.")
+
+PIXEL_DATA_TAG = 0x7FE00010
+
+# Elements larger than this are left on disk when the header is parsed
+DEFER_SIZE = 1024
+
+
+def is_dicom_path(path):
+    return bool(path) and path.lower().endswith('.dcm')
+
+
+def _read_dataset(path):
+    return pydicom.dcmread(path, defer_size=DEFER_SIZE)
+
+
+def read_dicom_header(path):
+    """Return summary metadata of a DICOM file without loading its pixels"""
+    ds = pydicom.dcmread(path, stop_before_pixels=True)
+    return {
+        'modality': str(ds.get('Modality', '')),
+        'study_description': str(ds.get('StudyDescription', '')),
+        'rows': int(ds.get('Rows', 0)),
+        'columns': int(ds.get('Columns', 0)),
+        'frames': int(ds.get('NumberOfFrames', 1) or 1),
+        'samples_per_pixel': int(ds.get('SamplesPerPixel', 1)),
+        'bits_allocated': int(ds.get('BitsAllocated', 0)),
+        'transfer_syntax': str(getattr(ds, 'file_meta', {}).get('TransferSyntaxUID', ''))
+    }
+
+
+def _transfer_syntax(ds):
+    return ds.file_meta.get('TransferSyntaxUID') if hasattr(ds, 'file_meta') else None
+
+
+def _memmap_frames(path, ds):
+    """Memory-map the pixel data as (frames, rows, cols[, samples]), or None if not possible"""
+    transfer_syntax = _transfer_syntax(ds)
+    # Deflated files store the dataset zlib-compressed, so offsets don't point into the file
+    if transfer_syntax is not None and (transfer_syntax.is_compressed or transfer_syntax.is_deflated):
+        return None
+    # YBR data has to go through pydicom's colour conversion
+    if not str(ds.get('PhotometricInterpretation', '')).startswith(('MONOCHROME', 'RGB')):
+        return None
+
+    element = ds.get_item(PIXEL_DATA_TAG, keep_deferred=True)
+    value_tell = getattr(element, 'value_tell', None)
+    if value_tell is None or element.length in (None, 0xFFFFFFFF):
+        return None
+
+    bits = int(ds.BitsAllocated)
+    if bits not in (8, 16, 32):
+        return None
+    signed = int(ds.get('PixelRepresentation', 0)) == 1
+    dtype = np.dtype(f"{'i' if signed else 'u'}{bits // 8}")
+    if transfer_syntax == ExplicitVRBigEndian:
+        dtype = dtype.newbyteorder('>')
+
+    frames = int(ds.get('NumberOfFrames', 1) or 1)
+    rows, cols = int(ds.Rows), int(ds.Columns)
+    samples = int(ds.get('SamplesPerPixel', 1))
+    planar = samples > 1 and int(ds.get('PlanarConfiguration', 0)) == 1
+    if samples == 1:
+        shape = (frames, rows, cols)
+    elif planar:
+        shape = (frames, samples, rows, cols)
+    else:
+        shape = (frames, rows, cols, samples)
+
+    if frames * rows * cols * samples * dtype.itemsize > element.length:
+        return None
+    pixels = np.memmap(path, dtype=dtype, mode='r', offset=value_tell, shape=shape)
+    if planar:
+        pixels = pixels.transpose(0, 2, 3, 1)
+    return pixels
+
+
+def iter_dicom_frames(path):
+    """Yield the frames of a DICOM file one at a time"""
+    ds = _read_dataset(path)
+    frames = _memmap_frames(path, ds)
+    if frames is not None:
+        for index in range(frames.shape[0]):
+            yield frames[index]
+        return
+
+    transfer_syntax = _transfer_syntax(ds)
+    deflated = transfer_syntax is not None and transfer_syntax.is_deflated
+    iter_pixels = getattr(getattr(pydicom, 'pixels', None), 'iter_pixels', None)
+    if iter_pixels is not None and not deflated:
+        yield from iter_pixels(path)
+        return
+
+    # Old pydicom without frame iteration, and deflated files (which can only
+    # be read by inflating the whole dataset), decode the whole buffer
+    if deflated:
+        ds = pydicom.dcmread(path)
+    array = ds.pixel_array
+    if int(ds.get('NumberOfFrames', 1) or 1) == 1:
+        array = array[np.newaxis]
+    for frame in array:
+        yield frame
+
+
+def frame_to_image(frame, size):
+    """Downsample one frame to an RGB PIL image of the given size"""
+    frame = np.asarray(frame)
+    # Cheap stride first so only about (2 * size)^2 samples are read from disk
+    step = max(1, min(frame.shape[0], frame.shape[1]) // (2 * size))
+    frame = np.asarray(frame[::step, ::step], dtype=np.float32)
+
+    low, high = float(frame.min()), float(frame.max())
+    scale = 255.0 / (high - low) if high > low else 0.0
+    frame = ((frame - low) * scale).astype(np.uint8)
+
+    mode = 'RGB' if frame.ndim == 3 and frame.shape[2] == 3 else 'L'
+    if frame.ndim == 3 and mode == 'L':
+        frame = frame[:, :, 0]
+    return Image.fromarray(frame, mode=mode).convert('RGB').resize((size, size))
+
+
+def load_dicom_for_cnn(path, size=224, max_frames=16):
+    """Return up to max_frames evenly spaced frames as a (n, size, size, 3) float32 array"""
+    total = read_dicom_header(path)['frames']
+    wanted = set(np.linspace(0, total - 1, num=min(total, max_frames), dtype=int).tolist())
+    batch = np.empty((len(wanted), size, size, 3), dtype=np.float32)
+    filled = 0
+    for index, frame in enumerate(iter_dicom_frames(path)):
+        if index in wanted:
+            batch[filled] = np.asarray(frame_to_image(frame, size), dtype=np.float32) / 255.0
+            filled += 1
+            if filled == len(wanted):
+                break
+    return batch[:filled]
+
+
+def save_dicom_preview(path, preview_path, size=256):
+    """Write a small PNG of the middle frame and return its path"""
+    total = read_dicom_header(path)['frames']
+    middle = total // 2
+    for index, frame in enumerate(iter_dicom_frames(path)):
+        if index == middle:
+            os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+            image = frame_to_image(frame, size)
+            image.save(preview_path, format='PNG', optimize=True)
+            return preview_path
+    return None
@@ -7,7 +7,14 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.svm import SVC
 from sklearn.preprocessing import StandardScaler
 from PIL import Image
+from collections import OrderedDict
+import math
 import os
+import threading
+import time
+from services import metrics
+from models.dicom_loader import PYDICOM_AVAILABLE, is_dicom_path, load_dicom_for_cnn
+from models.compiled import PARITY_TOLERANCE, CompiledLinearModel, CompiledSVC, check_parity
 
 # Optional imports for TensorFlow and PyTorch
 try:
@@ -25,12 +32,162 @@ except ImportError:
     PYTORCH_AVAILABLE = False
     print("Warning: PyTorch not available. LSTM features will be limited.")
 
+ALGORITHMS = ['logistic_regression', 'svm', 'cnn', 'lstm']
+
+# Vital sign fields in feature order, with the default used when one is missing
+VITAL_FIELDS = [
+    ('temperature', 98.6),
+    ('heart_rate', 72),
+    ('systolic_bp', 120),
+    ('diastolic_bp', 80),
+    ('respiratory_rate', 16),
+    ('oxygen_saturation', 98)
+]
+
+def vitals_key(vitals):
+    """Parse vitals into a hashable cache key of exact floats
+
+    The key holds the values the prediction is computed from, never a
+    rounded copy: rounding would move readings across the diagnosis
+    thresholds (e.g. 100.45 F to 100.4 F is no longer a fever). Returns
+    None for values that cannot be cached, such as NaN.
+    """
+    key = tuple(float(vitals.get(field, default)) for field, default in VITAL_FIELDS)
+    if not all(math.isfinite(value) for value in key):
+        return None
+    return key
+
+# Conditions are stored as a bitmask next to the display string, in this
+# order; 0 means Normal
+CONDITIONS = [
+    'Fever',
+    'Tachycardia',
+    'Bradycardia',
+    'Hypertension',
+    'Hypotension',
+    'Possible abnormality detected in image'
+]
+CONDITION_BITS = {name: 1 << index for index, name in enumerate(CONDITIONS)}
+FEVER, TACHYCARDIA, BRADYCARDIA, HYPERTENSION, HYPOTENSION, IMAGE_ABNORMALITY = (
+    CONDITION_BITS[name] for name in CONDITIONS
+)
+ALL_CONDITIONS_MASK = (1 << len(CONDITIONS)) - 1
+
+def assess_vitals(vitals):
+    """Apply the diagnosis rules and return (condition mask, severity)"""
+    temp = float(vitals.get('temperature', 98.6))
+    hr = float(vitals.get('heart_rate', 72))
+    bp_sys = float(vitals.get('systolic_bp', 120))
+    
+    mask = 0
+    severity = 'normal'
+    
+    if temp > 100.4:
+        mask |= FEVER
+        severity = 'critical' if temp > 103 else 'moderate'
+    if hr > 100:
+        mask |= TACHYCARDIA
+        severity = 'critical' if hr > 120 else 'moderate'
+    elif hr < 60:
+        mask |= BRADYCARDIA
+        severity = 'critical' if hr < 50 else 'moderate'
+    if bp_sys > 140:
+        mask |= HYPERTENSION
+        severity = 'critical' if bp_sys > 180 else 'moderate'
+    elif bp_sys < 90:
+        mask |= HYPOTENSION
+        severity = 'critical' if bp_sys < 70 else 'moderate'
+    
+    return mask, severity
+
+def condition_label(mask):
+    """Display string of a condition mask, e.g. 'Fever, Tachycardia'"""
+    if not mask:
+        return 'Normal'
+    return ', '.join(name for name in CONDITIONS if mask & CONDITION_BITS[name])
+
+def condition_mask(condition):
+    """Parse a stored display string back into a mask (for records without one)"""
+    mask = 0
+    for name in (condition or '').split(', '):
+        mask |= CONDITION_BITS.get(name.strip(), 0)
+    return mask
+
+def masks_with(bit):
+    """Every mask that has the given condition bit set, for indexed $in queries"""
+    return [mask for mask in range(ALL_CONDITIONS_MASK + 1) if mask & bit]
+
+class PredictionCache:
+    """Bounded LRU cache of prediction results with an optional TTL"""
+    
+    def __init__(self, max_size=4096, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+    
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def bypass(self):
+        with self._lock:
+            self.bypasses += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'bypasses': self.bypasses}
+    
+    def metric_values(self):
+        return [
+            ({'result': 'hit'}, self.hits),
+            ({'result': 'miss'}, self.misses),
+            ({'result': 'bypass'}, self.bypasses)
+        ]
+
 class MLDiagnosisEngine:
     """Main ML engine for diagnosis"""
     
-    def __init__(self):
+    # Part of every prediction cache key; bump when prediction logic changes
+    MODEL_VERSION = '2'
+    
+    def __init__(self, cache_size=4096, cache_ttl=None, dicom_max_frames=16):
         self.scaler = StandardScaler()
+        self.dicom_max_frames = dicom_max_frames
         self.models = {}
+        # Float32 exports of the fitted sklearn models, see compile_models()
+        self.compiled = {}
+        self.cache = PredictionCache(cache_size, cache_ttl) if cache_size else None
+        if self.cache is not None:
+            metrics.register_callback(
+                'prediction_cache_requests_total',
+                'Prediction cache lookups by result (hit/miss/bypass)',
+                self.cache.metric_values,
+                kind='counter'
+            )
         self._initialize_models()
     
     def _initialize_models(self):
@@ -47,6 +204,12 @@ class MLDiagnosisEngine:
         # LSTM (will be created as needed)
         self.models['lstm'] = None
     
+    def warm_up(self):
+        """Run every prediction path once so imports and lookup tables are loaded before workers fork"""
+        for algorithm in ALGORITHMS:
+            self.predict(algorithm, {})
+        Image.new('RGB', (224, 224)).convert('RGB').resize((224, 224))
+    
     def preprocess_vitals(self, vitals):
         """Preprocess vital signs for ML models"""
         # Extract vital signs
@@ -63,6 +226,11 @@ class MLDiagnosisEngine:
     def preprocess_image(self, image_path):
         """Preprocess medical image for CNN"""
         try:
+            if is_dicom_path(image_path):
+                if not PYDICOM_AVAILABLE:
+                    return None
+                # One (224, 224, 3) slice per sampled frame, read lazily from disk
+                return load_dicom_for_cnn(image_path, 224, self.dicom_max_frames)
             img = Image.open(image_path)
             img = img.convert('RGB')
             img = img.resize((224, 224))
@@ -82,216 +250,143 @@ class MLDiagnosisEngine:
         
         # Train SVM
         self.models['svm'].fit(X_scaled, y_train)
+        
+        self.compile_models(X_train[:200])
     
-    def predict_logistic_regression(self, vitals):
-        """Predict using Logistic Regression"""
+    def compile_models(self, X_check=None):
+        """Export the fitted scaler and sklearn models for fast single-row and batch scoring
+        
+        With X_check (raw vitals rows), the exports are checked against
+        sklearn's predict_proba and predict first, and a mismatch raises.
+        """
+        compiled = {
+            'logistic_regression': CompiledLinearModel.from_sklearn(self.scaler, self.models['logistic_regression']),
+            'svm': CompiledSVC.from_sklearn(self.scaler, self.models['svm'])
+        }
+        if X_check is not None and len(X_check):
+            X_check = np.asarray(X_check, dtype=np.float64)
+            for name, model in compiled.items():
+                diff, mismatches = check_parity(model, self.scaler, self.models[name], X_check)
+                if diff > PARITY_TOLERANCE or mismatches:
+                    raise ValueError(
+                        f'Compiled {name} disagrees with sklearn: probabilities differ by {diff:.2e}, '
+                        f'{mismatches} labels differ'
+                    )
+        self.compiled = compiled
+        return self.compiled
+    
+    def _compiled_model(self, algorithm):
+        model = self.compiled.get(algorithm)
+        if model is None:
+            raise ValueError(f'No compiled model for {algorithm}; train the models first')
+        return model
+    
+    def model_proba(self, algorithm, vitals):
+        """Class probabilities of a trained model for one set of vitals
+        
+        Returns a buffer the next call on this thread overwrites.
+        """
+        get = vitals.get
+        return self._compiled_model(algorithm).predict_proba_row((
+            float(get('temperature', 98.6)),
+            float(get('heart_rate', 72)),
+            float(get('systolic_bp', 120)),
+            float(get('diastolic_bp', 80)),
+            float(get('respiratory_rate', 16)),
+            float(get('oxygen_saturation', 98))
+        ))
+    
+    def model_proba_batch(self, algorithm, X):
+        """Class probabilities of a trained model for an (n, 6) array of raw vitals"""
+        return self._compiled_model(algorithm).predict_proba(X)
+    
+    def _rule_result(self, vitals, confidence, algorithm):
+        """Rule-based diagnosis shared by the demo models"""
         try:
             # For demo purposes, use rule-based prediction
             # In production, use trained model with scaling
-            temp = float(vitals.get('temperature', 98.6))
-            hr = float(vitals.get('heart_rate', 72))
-            bp_sys = float(vitals.get('systolic_bp', 120))
-            
-            # Simple rule-based diagnosis
-            conditions = []
-            severity = 'normal'
-            
-            if temp > 100.4:
-                conditions.append('Fever')
-                severity = 'critical' if temp > 103 else 'moderate'
-            if hr > 100:
-                conditions.append('Tachycardia')
-                severity = 'critical' if hr > 120 else 'moderate'
-            elif hr < 60:
-                conditions.append('Bradycardia')
-                severity = 'critical' if hr < 50 else 'moderate'
-            if bp_sys > 140:
-                conditions.append('Hypertension')
-                severity = 'critical' if bp_sys > 180 else 'moderate'
-            elif bp_sys < 90:
-                conditions.append('Hypotension')
-                severity = 'critical' if bp_sys < 70 else 'moderate'
-            
-            if not conditions:
-                conditions.append('Normal')
-                severity = 'normal'
-            
+            mask, severity = assess_vitals(vitals)
             return {
-                'condition': ', '.join(conditions),
+                'condition': condition_label(mask),
+                'condition_mask': mask,
                 'severity': severity,
-                'confidence': 0.85,
-                'algorithm': 'Logistic Regression'
+                'confidence': confidence,
+                'algorithm': algorithm
             }
         except Exception as e:
             return {
                 'condition': 'Error in diagnosis',
                 'severity': 'unknown',
                 'confidence': 0.0,
-                'algorithm': 'Logistic Regression',
+                'algorithm': algorithm,
                 'error': str(e)
             }
     
+    def predict_logistic_regression(self, vitals):
+        """Predict using Logistic Regression"""
+        return self._rule_result(vitals, 0.85, 'Logistic Regression')
+    
     def predict_svm(self, vitals):
         """Predict using SVM"""
-        try:
-            # Similar to logistic regression for demo
-            result = self.predict_logistic_regression(vitals)
-            if result.get('error'):
-                # If there was an error, create a new result
-                temp = float(vitals.get('temperature', 98.6))
-                hr = float(vitals.get('heart_rate', 72))
-                bp_sys = float(vitals.get('systolic_bp', 120))
-                
-                conditions = []
-                severity = 'normal'
-                
-                if temp > 100.4:
-                    conditions.append('Fever')
-                    severity = 'critical' if temp > 103 else 'moderate'
-                if hr > 100:
-                    conditions.append('Tachycardia')
-                    severity = 'critical' if hr > 120 else 'moderate'
-                elif hr < 60:
-                    conditions.append('Bradycardia')
-                    severity = 'critical' if hr < 50 else 'moderate'
-                if bp_sys > 140:
-                    conditions.append('Hypertension')
-                    severity = 'critical' if bp_sys > 180 else 'moderate'
-                elif bp_sys < 90:
-                    conditions.append('Hypotension')
-                    severity = 'critical' if bp_sys < 70 else 'moderate'
-                
-                if not conditions:
-                    conditions.append('Normal')
-                    severity = 'normal'
-                
-                result = {
-                    'condition': ', '.join(conditions),
-                    'severity': severity,
-                    'confidence': 0.82,
-                    'algorithm': 'SVM'
-                }
-            else:
-                result['algorithm'] = 'SVM'
-            return result
-        except Exception as e:
-            return {
-                'condition': 'Error in diagnosis',
-                'severity': 'unknown',
-                'confidence': 0.0,
-                'algorithm': 'SVM',
-                'error': str(e)
-            }
+        # Same rules as logistic regression for demo
+        return self._rule_result(vitals, 0.85, 'SVM')
     
     def predict_cnn(self, vitals, image_path=None):
         """Predict using CNN (for image analysis)"""
-        try:
-            # Base prediction from vitals
-            temp = float(vitals.get('temperature', 98.6))
-            hr = float(vitals.get('heart_rate', 72))
-            bp_sys = float(vitals.get('systolic_bp', 120))
-            
-            conditions = []
-            severity = 'normal'
-            
-            if temp > 100.4:
-                conditions.append('Fever')
-                severity = 'critical' if temp > 103 else 'moderate'
-            if hr > 100:
-                conditions.append('Tachycardia')
-                severity = 'critical' if hr > 120 else 'moderate'
-            elif hr < 60:
-                conditions.append('Bradycardia')
-                severity = 'critical' if hr < 50 else 'moderate'
-            if bp_sys > 140:
-                conditions.append('Hypertension')
-                severity = 'critical' if bp_sys > 180 else 'moderate'
-            elif bp_sys < 90:
-                conditions.append('Hypotension')
-                severity = 'critical' if bp_sys < 70 else 'moderate'
-            
-            if not conditions:
-                conditions.append('Normal')
-                severity = 'normal'
-            
-            base_result = {
-                'condition': ', '.join(conditions),
-                'severity': severity,
-                'confidence': 0.88,
-                'algorithm': 'CNN'
-            }
-            
-            # If image provided, analyze it
-            if image_path and os.path.exists(image_path):
-                try:
-                    img_array = self.preprocess_image(image_path)
-                    if img_array is not None:
-                        base_result['image_analysis'] = 'Image processed successfully'
-                        if 'Normal' in base_result['condition']:
-                            base_result['condition'] = 'Possible abnormality detected in image'
-                            base_result['severity'] = 'moderate'
-                except:
-                    pass  # Continue with vital signs only
-            
+        # Base prediction from vitals
+        base_result = self._rule_result(vitals, 0.88, 'CNN')
+        if base_result.get('error'):
             return base_result
-        except Exception as e:
-            return {
-                'condition': 'Error in diagnosis',
-                'severity': 'unknown',
-                'confidence': 0.0,
-                'algorithm': 'CNN',
-                'error': str(e)
-            }
+        
+        # If image provided, analyze it
+        if image_path and os.path.exists(image_path):
+            try:
+                img_array = self.preprocess_image(image_path)
+                if img_array is not None:
+                    base_result['image_analysis'] = 'Image processed successfully'
+                    if base_result['condition_mask'] == 0:
+                        base_result['condition_mask'] = IMAGE_ABNORMALITY
+                        base_result['condition'] = condition_label(IMAGE_ABNORMALITY)
+                        base_result['severity'] = 'moderate'
+            except:
+                pass  # Continue with vital signs only
+        
+        return base_result
     
     def predict_lstm(self, vitals):
         """Predict using LSTM (for time series data)"""
-        try:
-            temp = float(vitals.get('temperature', 98.6))
-            hr = float(vitals.get('heart_rate', 72))
-            bp_sys = float(vitals.get('systolic_bp', 120))
-            
-            conditions = []
-            severity = 'normal'
-            
-            if temp > 100.4:
-                conditions.append('Fever')
-                severity = 'critical' if temp > 103 else 'moderate'
-            if hr > 100:
-                conditions.append('Tachycardia')
-                severity = 'critical' if hr > 120 else 'moderate'
-            elif hr < 60:
-                conditions.append('Bradycardia')
-                severity = 'critical' if hr < 50 else 'moderate'
-            if bp_sys > 140:
-                conditions.append('Hypertension')
-                severity = 'critical' if bp_sys > 180 else 'moderate'
-            elif bp_sys < 90:
-                conditions.append('Hypotension')
-                severity = 'critical' if bp_sys < 70 else 'moderate'
-            
-            if not conditions:
-                conditions.append('Normal')
-                severity = 'normal'
-            
-            result = {
-                'condition': ', '.join(conditions),
-                'severity': severity,
-                'confidence': 0.80,
-                'algorithm': 'LSTM',
-                'note': 'LSTM optimized for sequential data analysis'
-            }
-            return result
-        except Exception as e:
-            return {
-                'condition': 'Error in diagnosis',
-                'severity': 'unknown',
-                'confidence': 0.0,
-                'algorithm': 'LSTM',
-                'error': str(e)
-            }
+        result = self._rule_result(vitals, 0.80, 'LSTM')
+        if not result.get('error'):
+            result['note'] = 'LSTM optimized for sequential data analysis'
+        return result
     
     def predict(self, algorithm, vitals, image_path=None):
         """Main prediction method"""
+        # Image-bearing requests and unknown algorithms bypass the cache
+        if self.cache is None or image_path or algorithm not in ALGORITHMS:
+            if self.cache is not None:
+                self.cache.bypass()
+            return self._predict(algorithm, vitals, image_path)
+        
+        try:
+            parsed = vitals_key(vitals)
+        except (TypeError, ValueError, OverflowError):
+            parsed = None
+        if parsed is None:
+            self.cache.bypass()
+            return self._predict(algorithm, vitals)
+        
+        key = (algorithm, self.MODEL_VERSION, parsed)
+        result = self.cache.get(key)
+        if result is None:
+            # Always from the submitted vitals, so cached and uncached answers agree
+            result = self._predict(algorithm, vitals)
+            if result.get('error'):
+                return result
+            self.cache.set(key, result)
+        return dict(result)
+    
+    def _predict(self, algorithm, vitals, image_path=None):
         if algorithm == 'logistic_regression':
             return self.predict_logistic_regression(vitals)
         elif algorithm == 'svm':
@@ -311,13 +406,11 @@ class MLDiagnosisEngine:
     def compare_algorithms(self, vitals, image_path=None):
         """Compare results from all algorithms"""
         results = {}
-        algorithms = ['logistic_regression', 'svm', 'cnn', 'lstm']
         
-        for algo in algorithms:
+        for algo in ALGORITHMS:
             if algo == 'cnn':
                 results[algo] = self.predict(algo, vitals, image_path)
             else:
                 results[algo] = self.predict(algo, vitals)
         
         return results
-
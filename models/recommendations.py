@@ -0,0 +1,57 @@
+"""
+Health recommendations by condition mask
+
+Every combination of condition bits is expanded into its recommendation
+lists once at import, so serving the recommendations page is a single
+list index.
+"""
+
+from models.ml_models import (
+    ALL_CONDITIONS_MASK, FEVER, TACHYCARDIA, BRADYCARDIA, HYPERTENSION, HYPOTENSION
+)
+
+# (condition bits that trigger the rule, recommendations it adds)
+RULES = [
+    (FEVER, {
+        'diet': ['Drink plenty of fluids and warm soups', 'Eat light, easily digestible foods'],
+        'lifestyle': ['Get adequate rest', 'Monitor temperature regularly']
+    }),
+    (TACHYCARDIA | BRADYCARDIA, {
+        'exercise': ['Avoid strenuous activities', 'Practice gentle breathing exercises'],
+        'lifestyle': ['Reduce stress and anxiety', 'Avoid caffeine and stimulants']
+    }),
+    (HYPERTENSION, {
+        'diet': ['Reduce sodium intake', 'Eat more fruits and vegetables'],
+        'exercise': ['Regular moderate exercise (30 min/day)'],
+        'lifestyle': ['Maintain healthy weight', 'Limit alcohol consumption']
+    }),
+    (HYPOTENSION, {
+        'diet': ['Increase fluid intake', 'Add moderate salt to diet'],
+        'lifestyle': ['Avoid sudden position changes', 'Wear compression stockings if needed']
+    }),
+]
+
+DEFAULT_RECOMMENDATIONS = {
+    'diet': ['Maintain a balanced diet', 'Stay hydrated'],
+    'exercise': ['Regular physical activity', '30 minutes daily'],
+    'lifestyle': ['Get 7-9 hours of sleep', 'Manage stress']
+}
+
+
+def _build(mask):
+    recommendations = {'diet': [], 'exercise': [], 'lifestyle': []}
+    for bits, additions in RULES:
+        if mask & bits:
+            for category, items in additions.items():
+                recommendations[category].extend(items)
+    if not any(recommendations.values()):
+        recommendations = {category: list(items) for category, items in DEFAULT_RECOMMENDATIONS.items()}
+    return {category: tuple(items) for category, items in recommendations.items()}
+
+
+RECOMMENDATION_TABLE = [_build(mask) for mask in range(ALL_CONDITIONS_MASK + 1)]
+
+
+def recommendations_for(mask):
+    """Diet, exercise and lifestyle recommendations for a condition mask"""
+    return RECOMMENDATION_TABLE[mask & ALL_CONDITIONS_MASK]
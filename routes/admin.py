@@ -0,0 +1,49 @@
+"""
+Admin routes
+"""
+
+from flask import Blueprint, jsonify, send_file, abort, Response, request
+from services.admin import admin_required
+from services.metrics import REGISTRY
+
+bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+def init_admin_routes(app, mongo_db, job_queue=None):
+    """Initialize admin routes"""
+    bp.mongo = mongo_db
+    bp.app = app
+    bp.job_queue = job_queue
+
+@bp.route('/profiles')
+@admin_required
+def profiles():
+    store = bp.app.extensions['profile_store']
+    return jsonify({'profiles': store.list()})
+
+@bp.route('/profiles/<filename>')
+@admin_required
+def profile_file(filename):
+    store = bp.app.extensions['profile_store']
+    path = store.path_for(filename)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=filename)
+
+@bp.route('/metrics')
+@admin_required
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/sweep-uploads', methods=['POST'])
+@admin_required
+def sweep_uploads():
+    dry_run = request.args.get('dry_run') == '1'
+    job_id = bp.job_queue.enqueue('sweep_uploads', {'dry_run': dry_run})
+    return jsonify({'job_id': str(job_id)}), 202
+
+@bp.route('/export-parquet', methods=['POST'])
+@admin_required
+def export_parquet():
+    full = request.args.get('full') == '1'
+    job_id = bp.job_queue.enqueue('export_parquet', {'full': full})
+    return jsonify({'job_id': str(job_id)}), 202
@@ -9,6 +9,7 @@ import bcrypt
 from bson import ObjectId
 from datetime import datetime
 from models.user_model import validate_user_data, create_user_dict
+from services.aio import run_sync
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -16,6 +17,7 @@ def init_auth_routes(app, mongo_db):
     """Initialize auth routes with app and mongo instances"""
     bp.mongo = mongo_db
     bp.app = app
+    bp.async_mongo = app.extensions['async_mongo']
 
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -33,15 +35,40 @@ def login():
         user = bp.mongo.db.users.find_one({'username': username})
         
         if user and bcrypt.checkpw(password.encode('utf-8'), user['password']):
-            session['user_id'] = str(user['_id'])
-            session['username'] = user['username']
-            flash('Login successful!', 'success')
-            return redirect(url_for('home'))
+            return logged_in(user)
         else:
             flash('Invalid username or password', 'error')
     
     return render_template('login.html')
 
+async def login_async():
+    """login() for asgi.py: the user lookup on the async client, bcrypt on the executor"""
+    if 'user_id' in session:
+        return redirect(url_for('home'))
+    
+    if request.method == 'POST':
+        username = request.form.get('username')
+        password = request.form.get('password')
+        
+        if not username or not password:
+            flash('Please enter both username and password', 'error')
+            return render_template('login.html')
+        
+        user = await bp.async_mongo.db.users.find_one({'username': username})
+        
+        if user and await run_sync(bcrypt.checkpw, password.encode('utf-8'), user['password']):
+            return logged_in(user)
+        else:
+            flash('Invalid username or password', 'error')
+    
+    return render_template('login.html')
+
+def logged_in(user):
+    session['user_id'] = str(user['_id'])
+    session['username'] = user['username']
+    flash('Login successful!', 'success')
+    return redirect(url_for('home'))
+
 @bp.route('/register', methods=['GET', 'POST'])
 def register():
     if 'user_id' in session:
@@ -82,6 +109,41 @@ def register():
     
     return render_template('login.html', register_mode=True)
 
+async def register_async():
+    """register() for asgi.py: lookups and insert on the async client, bcrypt on the executor"""
+    if 'user_id' in session:
+        return redirect(url_for('home'))
+    
+    if request.method == 'POST':
+        data = request.form.to_dict()
+        
+        errors = validate_user_data(data)
+        if errors:
+            for error in errors:
+                flash(error, 'error')
+            return render_template('login.html', register_mode=True)
+        
+        users = bp.async_mongo.db.users
+        if await users.find_one({'username': data['username']}):
+            flash('Username already exists. Please choose another.', 'error')
+            return render_template('login.html', register_mode=True)
+        
+        if await users.find_one({'gmail': data['gmail']}):
+            flash('Gmail ID already registered', 'error')
+            return render_template('login.html', register_mode=True)
+        
+        hashed_password = await run_sync(bcrypt.hashpw, data['password'].encode('utf-8'), bcrypt.gensalt())
+        
+        result = await users.insert_one(create_user_dict(data, hashed_password))
+        
+        if result.inserted_id:
+            flash('Registration successful! Please login.', 'success')
+            return redirect(url_for('auth.login'))
+        else:
+            flash('Registration failed. Please try again.', 'error')
+    
+    return render_template('login.html', register_mode=True)
+
 @bp.route('/forgot-password', methods=['GET', 'POST'])
 def forgot_password():
     if request.method == 'POST':
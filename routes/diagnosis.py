@@ -8,7 +8,16 @@ from werkzeug.utils import secure_filename
 from bson import ObjectId
 from datetime import datetime
 import os
-from models.ml_models import MLDiagnosisEngine
+from models.ml_models import MLDiagnosisEngine, condition_mask
+from models.recommendations import recommendations_for
+from models.dicom_loader import PYDICOM_AVAILABLE, is_dicom_path, read_dicom_header, save_dicom_preview
+from services.aio import run_sync
+from services.mongo import read_collection, causal_read_session, causal_write_session, async_causal_read_session
+from services.conditional import async_conditional_on_diagnoses, conditional_on_diagnoses, touch_diagnoses
+from services.uploads import delete_upload_files, resolve_upload_path, sharded_upload_path
+from services.thumbnails import (
+    THUMBNAIL_MIMETYPE, delete_unreferenced_thumbnails, generate_thumbnail, is_content_hash, thumbnail_path
+)
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 import csv
@@ -16,11 +25,131 @@ import io
 
 bp = Blueprint('diagnosis', __name__, url_prefix='/diagnosis')
 
-def init_diagnosis_routes(app, mongo_db, ml_engine):
+# Normal values for comparison (rendered once per process in result.html)
+NORMAL_VALUES = {
+    'temperature': 98.6,
+    'heart_rate': 72,
+    'systolic_bp': 120,
+    'diastolic_bp': 80,
+    'respiratory_rate': 16,
+    'oxygen_saturation': 98
+}
+
+def init_diagnosis_routes(app, mongo_db, ml_engine, job_queue=None):
     """Initialize diagnosis routes"""
     bp.mongo = mongo_db
     bp.app = app
     bp.ml_engine = ml_engine
+    bp.job_queue = job_queue
+    bp.async_mongo = app.extensions['async_mongo']
+
+def build_csv(diagnoses):
+    """Render diagnosis records as CSV bytes"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    
+    # Write header
+    writer.writerow(['Date', 'Name', 'Age', 'Condition', 'Severity', 'Algorithm', 'Temperature', 
+                    'Heart Rate', 'Systolic BP', 'Diastolic BP', 'Respiratory Rate', 
+                    'Oxygen Saturation'])
+    
+    # Write data
+    for diag in diagnoses:
+        vitals = diag.get('vitals', {})
+        result = diag.get('result', {})
+        writer.writerow([
+            diag['created_at'].strftime('%Y-%m-%d %H:%M:%S'),
+            diag.get('patient_name', 'N/A'),
+            diag.get('patient_age', 'N/A'),
+            result.get('condition', 'N/A'),
+            result.get('severity', 'N/A'),
+            diag.get('algorithm', 'N/A'),
+            vitals.get('temperature', 'N/A'),
+            vitals.get('heart_rate', 'N/A'),
+            vitals.get('systolic_bp', 'N/A'),
+            vitals.get('diastolic_bp', 'N/A'),
+            vitals.get('respiratory_rate', 'N/A'),
+            vitals.get('oxygen_saturation', 'N/A')
+        ])
+    
+    return output.getvalue().encode('utf-8')
+
+def build_pdf(diagnosis, user):
+    """Render a diagnosis report as a PDF buffer"""
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    
+    # Title
+    p.setFont("Helvetica-Bold", 18)
+    p.drawString(100, height - 50, "Medical Diagnosis Report")
+    
+    # Patient Information
+    y = height - 90
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(100, y, "Patient Information:")
+    y -= 30
+    p.setFont("Helvetica", 12)
+    
+    # Get patient name and age from diagnosis record or user profile
+    patient_name = diagnosis.get('patient_name', '')
+    patient_age = diagnosis.get('patient_age', '')
+    
+    # If not in diagnosis, try to get from user profile
+    if not patient_name and user:
+        patient_name = user.get('name', 'N/A')
+    if not patient_age and user:
+        patient_age = str(user.get('age', 'N/A'))
+    
+    p.drawString(100, y, f"Name: {patient_name if patient_name else 'N/A'}")
+    y -= 25
+    p.drawString(100, y, f"Age: {patient_age if patient_age else 'N/A'}")
+    y -= 25
+    if user:
+        p.drawString(100, y, f"Gender: {user.get('gender', 'N/A')}")
+        y -= 25
+    
+    # Date
+    y -= 10
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(100, y, f"Report Date: {diagnosis['created_at'].strftime('%Y-%m-%d %H:%M:%S')}")
+    
+    # Results
+    y -= 40
+    result = diagnosis.get('result', {})
+    vitals = diagnosis.get('vitals', {})
+    
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(100, y, "Diagnosis Results:")
+    y -= 30
+    p.setFont("Helvetica", 12)
+    p.drawString(100, y, f"Condition: {result.get('condition', 'N/A')}")
+    y -= 25
+    p.drawString(100, y, f"Severity: {result.get('severity', 'N/A')}")
+    y -= 25
+    p.drawString(100, y, f"Algorithm: {diagnosis.get('algorithm', 'N/A')}")
+    y -= 25
+    p.drawString(100, y, f"Confidence: {result.get('confidence', 0.0):.2%}")
+    
+    # Vital Signs
+    y -= 50
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(100, y, "Vital Signs:")
+    y -= 30
+    p.setFont("Helvetica", 12)
+    p.drawString(100, y, f"Temperature: {vitals.get('temperature', 'N/A')}°F")
+    y -= 25
+    p.drawString(100, y, f"Heart Rate: {vitals.get('heart_rate', 'N/A')} bpm")
+    y -= 25
+    p.drawString(100, y, f"Blood Pressure: {vitals.get('systolic_bp', 'N/A')}/{vitals.get('diastolic_bp', 'N/A')} mmHg")
+    y -= 25
+    p.drawString(100, y, f"Respiratory Rate: {vitals.get('respiratory_rate', 'N/A')} /min")
+    y -= 25
+    p.drawString(100, y, f"Oxygen Saturation: {vitals.get('oxygen_saturation', 'N/A')}%")
+    
+    p.save()
+    buffer.seek(0)
+    return buffer
 
 @bp.route('/input', methods=['GET', 'POST'])
 def input():
@@ -46,32 +175,100 @@ def input():
         
         # Handle file upload
         image_path = None
+        dicom_header = None
+        preview_path = None
         if 'medical_image' in request.files:
             file = request.files['medical_image']
             if file.filename:
                 filename = secure_filename(file.filename)
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 filename = f"{session['user_id']}_{timestamp}_{filename}"
-                image_path = os.path.join(bp.app.config['UPLOAD_FOLDER'], filename)
+                image_path = sharded_upload_path(bp.app.config['UPLOAD_FOLDER'], filename, create=True)
                 file.save(image_path)
+                
+                if is_dicom_path(image_path) and PYDICOM_AVAILABLE:
+                    # Header only; pixels stay on disk until the study is analyzed
+                    try:
+                        dicom_header = read_dicom_header(image_path)
+                        preview_path = save_dicom_preview(
+                            image_path,
+                            sharded_upload_path(
+                                os.path.join(bp.app.config['DERIVATIVES_FOLDER'], 'previews'),
+                                filename + '.png',
+                                create=True
+                            ),
+                            bp.app.config['DICOM_PREVIEW_SIZE']
+                        )
+                    except Exception as e:
+                        print(f"DICOM read error: {e}")
+                        delete_upload_files([image_path])
+                        flash('The uploaded DICOM file could not be read', 'error')
+                        return render_template('diagnosis.html')
         
-        # Get diagnosis
-        result = bp.ml_engine.predict(algorithm, vitals, image_path)
+        # CNN image analysis can run in a background worker; the vitals-only
+        # result is shown first and replaced when the job finishes
+        analyze_later = (
+            image_path and algorithm == 'cnn' and bp.job_queue is not None
+            and bp.app.config['JOBS_ASYNC_IMAGE_ANALYSIS']
+        )
+        thumbnail_later = image_path and bp.job_queue is not None and bp.app.config['THUMBNAILS_ASYNC']
         
-        # Save diagnosis to database with patient information
-        diagnosis_record = {
-            'user_id': ObjectId(session['user_id']),
-            'patient_name': patient_name,
-            'patient_age': patient_age,
-            'patient_contact': patient_contact,
-            'vitals': vitals,
-            'algorithm': algorithm,
-            'result': result,
-            'image_path': image_path,
-            'created_at': datetime.now()
-        }
+        thumbnail = None
+        if image_path and not thumbnail_later:
+            try:
+                thumbnail = generate_thumbnail(
+                    image_path,
+                    bp.app.config['DERIVATIVES_FOLDER'],
+                    bp.app.config['THUMBNAIL_SIZE'],
+                    bp.app.config['THUMBNAIL_QUALITY']
+                )
+            except Exception as e:
+                print(f"Thumbnail generation error: {e}")
+        
+        try:
+            # Get diagnosis
+            if analyze_later:
+                result = bp.ml_engine.predict(algorithm, vitals)
+            else:
+                result = bp.ml_engine.predict(algorithm, vitals, image_path)
+            
+            # Save diagnosis to database with patient information
+            diagnosis_record = {
+                'user_id': ObjectId(session['user_id']),
+                'patient_name': patient_name,
+                'patient_age': patient_age,
+                'patient_contact': patient_contact,
+                'vitals': vitals,
+                'algorithm': algorithm,
+                'result': result,
+                'image_path': image_path,
+                'dicom': dicom_header,
+                'preview_path': preview_path,
+                'thumbnail': thumbnail,
+                'image_analysis_status': 'pending' if analyze_later else None,
+                'created_at': datetime.now()
+            }
+            
+            with causal_write_session(bp.mongo) as mongo_session:
+                bp.mongo.db.diagnoses.insert_one(diagnosis_record, session=mongo_session)
+                touch_diagnoses(bp.mongo, session['user_id'], session=mongo_session)
+        except Exception:
+            # Don't leave an unreferenced upload behind for a failed submission
+            delete_upload_files([image_path, preview_path])
+            if thumbnail:
+                # Thumbnails are shared by content hash; keep it if another diagnosis uses it
+                try:
+                    delete_unreferenced_thumbnails(
+                        bp.mongo, [thumbnail], bp.app.config['DERIVATIVES_FOLDER'], bp.app.config['THUMBNAIL_SIZE']
+                    )
+                except Exception as e:
+                    print(f"Thumbnail cleanup error: {e}")
+            raise
         
-        bp.mongo.db.diagnoses.insert_one(diagnosis_record)
+        # Push the result to live alert subscribers (/events/alerts)
+        alert_hub = bp.app.extensions.get('events')
+        if alert_hub is not None:
+            alert_hub.publish_diagnosis(diagnosis_record)
         
         # Store result in session for result page
         session['last_diagnosis'] = {
@@ -81,14 +278,52 @@ def input():
             'algorithm': result['algorithm'],
             'vitals': vitals,
             'patient_name': patient_name,
-            'patient_age': patient_age
+            'patient_age': patient_age,
+            'thumbnail': thumbnail
         }
         
+        if thumbnail_later:
+            bp.job_queue.enqueue(
+                'generate_thumbnail',
+                {'diagnosis_id': str(diagnosis_record['_id'])},
+                user_id=session['user_id']
+            )
+        
+        if analyze_later:
+            job_id = bp.job_queue.enqueue(
+                'analyze_image',
+                {'diagnosis_id': str(diagnosis_record['_id'])},
+                user_id=session['user_id']
+            )
+            session['last_diagnosis']['image_job_id'] = str(job_id)
+        
         # Redirect to result page
         return redirect(url_for('diagnosis.result'))
     
     return render_template('diagnosis.html')
 
+@bp.route('/thumbnail/<digest>')
+def thumbnail_image(digest):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if not is_content_hash(digest):
+        return jsonify({'error': 'Not found'}), 404
+    
+    # Thumbnails are content-addressed, so a cached copy is always current
+    if request.if_none_match.contains(digest):
+        return '', 304, {'ETag': f'"{digest}"'}
+    
+    owned = read_collection(bp.mongo, 'diagnoses').count_documents(
+        {'user_id': ObjectId(session['user_id']), 'thumbnail': digest}, limit=1
+    )
+    path = thumbnail_path(bp.app.config['DERIVATIVES_FOLDER'], digest, bp.app.config['THUMBNAIL_SIZE'])
+    if not owned or not os.path.exists(path):
+        return jsonify({'error': 'Not found'}), 404
+    
+    response = send_file(path, mimetype=THUMBNAIL_MIMETYPE, etag=digest, conditional=True)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
 @bp.route('/result')
 def result():
     if 'user_id' not in session:
@@ -99,54 +334,90 @@ def result():
     
     result_data = session['last_diagnosis']
     
-    # Normal values for comparison
-    normal_values = {
-        'temperature': 98.6,
-        'heart_rate': 72,
-        'systolic_bp': 120,
-        'diastolic_bp': 80,
-        'respiratory_rate': 16,
-        'oxygen_saturation': 98
-    }
-    
     # Check if critical - trigger emergency
     is_critical = result_data['severity'] == 'critical'
     
     return render_template('result.html', 
                          result=result_data, 
-                         normal_values=normal_values,
+                         normal_values=NORMAL_VALUES,
                          is_critical=is_critical)
 
 @bp.route('/comparison')
+@conditional_on_diagnoses(MLDiagnosisEngine.MODEL_VERSION)
 def comparison():
     if 'user_id' not in session:
         return redirect(url_for('auth.login'))
     
     # Get last diagnosis vitals
-    last_diagnosis = bp.mongo.db.diagnoses.find_one(
-        {'user_id': ObjectId(session['user_id'])},
-        sort=[('created_at', -1)]
-    )
+    with causal_read_session(bp.mongo) as mongo_session:
+        last_diagnosis = read_collection(bp.mongo, 'diagnoses').find_one(
+            {'user_id': ObjectId(session['user_id'])},
+            sort=[('created_at', -1)],
+            session=mongo_session
+        )
     
     if not last_diagnosis:
-        flash('No diagnosis found. Please submit a diagnosis first.', 'info')
-        return redirect(url_for('diagnosis.input'))
+        return no_diagnosis()
     
     vitals = last_diagnosis['vitals']
-    image_path = last_diagnosis.get('image_path')
+    return render_template('comparison.html', results=compare_algorithms(last_diagnosis), vitals=vitals)
+
+@async_conditional_on_diagnoses(MLDiagnosisEngine.MODEL_VERSION)
+async def comparison_async():
+    """comparison() for asgi.py: the read on the async client, the algorithms on the executor"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
     
-    # Compare all algorithms
-    comparison_results = bp.ml_engine.compare_algorithms(vitals, image_path)
+    async with async_causal_read_session(bp.async_mongo) as mongo_session:
+        last_diagnosis = await read_collection(bp.async_mongo, 'diagnoses').find_one(
+            {'user_id': ObjectId(session['user_id'])},
+            sort=[('created_at', -1)],
+            session=mongo_session
+        )
+    
+    if not last_diagnosis:
+        return no_diagnosis()
     
-    return render_template('comparison.html', results=comparison_results, vitals=vitals)
+    results = await run_sync(compare_algorithms, last_diagnosis)
+    return render_template('comparison.html', results=results, vitals=last_diagnosis['vitals'])
+
+def compare_algorithms(last_diagnosis):
+    """Run every algorithm on a stored diagnosis (CPU-bound)"""
+    image_path = resolve_upload_path(last_diagnosis.get('image_path'), bp.app.config['UPLOAD_FOLDER'])
+    return bp.ml_engine.compare_algorithms(last_diagnosis['vitals'], image_path)
+
+def no_diagnosis():
+    flash('No diagnosis found. Please submit a diagnosis first.', 'info')
+    return redirect(url_for('diagnosis.input'))
 
 @bp.route('/history')
+@conditional_on_diagnoses()
 def history():
     if 'user_id' not in session:
         return redirect(url_for('auth.login'))
     
-    # Get filter parameters
-    filter_vital = request.args.get('filter_vital')
+    with causal_read_session(bp.mongo) as mongo_session:
+        diagnoses = list(read_collection(bp.mongo, 'diagnoses').find(
+            history_query(), session=mongo_session
+        ).sort('created_at', -1))
+    
+    return render_template('history.html', diagnoses=with_filter_vital(diagnoses))
+
+@async_conditional_on_diagnoses()
+async def history_async():
+    """history() for asgi.py, reading through the async client"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    async with async_causal_read_session(bp.async_mongo) as mongo_session:
+        diagnoses = await read_collection(bp.async_mongo, 'diagnoses').find(
+            history_query(), session=mongo_session
+        ).sort('created_at', -1).to_list()
+    
+    return render_template('history.html', diagnoses=with_filter_vital(diagnoses))
+
+def history_query():
+    """Query for the user's diagnoses, from ?filter_date"""
     filter_date = request.args.get('filter_date')
     
     query = {'user_id': ObjectId(session['user_id'])}
@@ -157,58 +428,31 @@ def history():
             query['created_at'] = {'$gte': date_obj}
         except:
             pass
-    
-    diagnoses = list(bp.mongo.db.diagnoses.find(query).sort('created_at', -1))
-    
-    # Filter by vital sign if specified
+    return query
+
+def with_filter_vital(diagnoses):
+    """Keep the diagnoses recording the vital sign in ?filter_vital, if given"""
+    filter_vital = request.args.get('filter_vital')
     if filter_vital:
         filtered = []
         for diag in diagnoses:
             if filter_vital in diag.get('vitals', {}):
                 filtered.append(diag)
         diagnoses = filtered
-    
-    return render_template('history.html', diagnoses=diagnoses)
+    return diagnoses
 
 @bp.route('/export/csv')
 def export_csv():
     if 'user_id' not in session:
         return redirect(url_for('auth.login'))
     
-    diagnoses = list(bp.mongo.db.diagnoses.find(
-        {'user_id': ObjectId(session['user_id'])}
-    ).sort('created_at', -1))
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['Date', 'Name', 'Age', 'Condition', 'Severity', 'Algorithm', 'Temperature', 
-                    'Heart Rate', 'Systolic BP', 'Diastolic BP', 'Respiratory Rate', 
-                    'Oxygen Saturation'])
-    
-    # Write data
-    for diag in diagnoses:
-        vitals = diag.get('vitals', {})
-        result = diag.get('result', {})
-        writer.writerow([
-            diag['created_at'].strftime('%Y-%m-%d %H:%M:%S'),
-            diag.get('patient_name', 'N/A'),
-            diag.get('patient_age', 'N/A'),
-            result.get('condition', 'N/A'),
-            result.get('severity', 'N/A'),
-            diag.get('algorithm', 'N/A'),
-            vitals.get('temperature', 'N/A'),
-            vitals.get('heart_rate', 'N/A'),
-            vitals.get('systolic_bp', 'N/A'),
-            vitals.get('diastolic_bp', 'N/A'),
-            vitals.get('respiratory_rate', 'N/A'),
-            vitals.get('oxygen_saturation', 'N/A')
-        ])
+    with causal_read_session(bp.mongo) as mongo_session:
+        diagnoses = list(read_collection(bp.mongo, 'diagnoses').find(
+            {'user_id': ObjectId(session['user_id'])}, session=mongo_session
+        ).sort('created_at', -1))
     
-    output.seek(0)
     return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
+        io.BytesIO(build_csv(diagnoses)),
         mimetype='text/csv',
         as_attachment=True,
         download_name=f'diagnosis_history_{datetime.now().strftime("%Y%m%d")}.csv'
@@ -238,81 +482,34 @@ def export_pdf(diagnosis_id):
     # Get user information
     user = bp.mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
     
-    # Create PDF
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    # Title
-    p.setFont("Helvetica-Bold", 18)
-    p.drawString(100, height - 50, "Medical Diagnosis Report")
-    
-    # Patient Information
-    y = height - 90
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(100, y, "Patient Information:")
-    y -= 30
-    p.setFont("Helvetica", 12)
-    
-    # Get patient name and age from diagnosis record or user profile
-    patient_name = diagnosis.get('patient_name', '')
-    patient_age = diagnosis.get('patient_age', '')
-    
-    # If not in diagnosis, try to get from user profile
-    if not patient_name and user:
-        patient_name = user.get('name', 'N/A')
-    if not patient_age and user:
-        patient_age = str(user.get('age', 'N/A'))
-    
-    p.drawString(100, y, f"Name: {patient_name if patient_name else 'N/A'}")
-    y -= 25
-    p.drawString(100, y, f"Age: {patient_age if patient_age else 'N/A'}")
-    y -= 25
-    if user:
-        p.drawString(100, y, f"Gender: {user.get('gender', 'N/A')}")
-        y -= 25
-    
-    # Date
-    y -= 10
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(100, y, f"Report Date: {diagnosis['created_at'].strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    # Results
-    y -= 40
-    result = diagnosis.get('result', {})
-    vitals = diagnosis.get('vitals', {})
+    return pdf_response(build_pdf(diagnosis, user), diagnosis_id)
+
+async def export_pdf_async(diagnosis_id):
+    """export_pdf() for asgi.py: reads on the async client, ReportLab on the executor"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
     
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(100, y, "Diagnosis Results:")
-    y -= 30
-    p.setFont("Helvetica", 12)
-    p.drawString(100, y, f"Condition: {result.get('condition', 'N/A')}")
-    y -= 25
-    p.drawString(100, y, f"Severity: {result.get('severity', 'N/A')}")
-    y -= 25
-    p.drawString(100, y, f"Algorithm: {diagnosis.get('algorithm', 'N/A')}")
-    y -= 25
-    p.drawString(100, y, f"Confidence: {result.get('confidence', 0.0):.2%}")
+    db = bp.async_mongo.db
+    if diagnosis_id == 'latest':
+        diagnosis = await db.diagnoses.find_one(
+            {'user_id': ObjectId(session['user_id'])},
+            sort=[('created_at', -1)]
+        )
+    else:
+        diagnosis = await db.diagnoses.find_one({
+            '_id': ObjectId(diagnosis_id),
+            'user_id': ObjectId(session['user_id'])
+        })
     
-    # Vital Signs
-    y -= 50
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(100, y, "Vital Signs:")
-    y -= 30
-    p.setFont("Helvetica", 12)
-    p.drawString(100, y, f"Temperature: {vitals.get('temperature', 'N/A')}°F")
-    y -= 25
-    p.drawString(100, y, f"Heart Rate: {vitals.get('heart_rate', 'N/A')} bpm")
-    y -= 25
-    p.drawString(100, y, f"Blood Pressure: {vitals.get('systolic_bp', 'N/A')}/{vitals.get('diastolic_bp', 'N/A')} mmHg")
-    y -= 25
-    p.drawString(100, y, f"Respiratory Rate: {vitals.get('respiratory_rate', 'N/A')} /min")
-    y -= 25
-    p.drawString(100, y, f"Oxygen Saturation: {vitals.get('oxygen_saturation', 'N/A')}%")
+    if not diagnosis:
+        flash('Diagnosis not found', 'error')
+        return redirect(url_for('diagnosis.history'))
     
-    p.save()
-    buffer.seek(0)
+    user = await db.users.find_one({'_id': ObjectId(session['user_id'])})
     
+    return pdf_response(await run_sync(build_pdf, diagnosis, user), diagnosis_id)
+
+def pdf_response(buffer, diagnosis_id):
     return send_file(
         buffer,
         mimetype='application/pdf',
@@ -321,61 +518,51 @@ def export_pdf(diagnosis_id):
     )
 
 @bp.route('/recommendations')
+@conditional_on_diagnoses()
 def recommendations():
     if 'user_id' not in session:
         return redirect(url_for('auth.login'))
     
     # Get last diagnosis
-    last_diagnosis = bp.mongo.db.diagnoses.find_one(
-        {'user_id': ObjectId(session['user_id'])},
-        sort=[('created_at', -1)]
-    )
+    with causal_read_session(bp.mongo) as mongo_session:
+        last_diagnosis = read_collection(bp.mongo, 'diagnoses').find_one(
+            {'user_id': ObjectId(session['user_id'])},
+            sort=[('created_at', -1)],
+            session=mongo_session
+        )
     
     if not last_diagnosis:
-        flash('No diagnosis found. Please submit a diagnosis first.', 'info')
-        return redirect(url_for('diagnosis.input'))
+        return no_diagnosis()
     
+    return render_recommendations(last_diagnosis)
+
+@async_conditional_on_diagnoses()
+async def recommendations_async():
+    """recommendations() for asgi.py, reading through the async client"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    async with async_causal_read_session(bp.async_mongo) as mongo_session:
+        last_diagnosis = await read_collection(bp.async_mongo, 'diagnoses').find_one(
+            {'user_id': ObjectId(session['user_id'])},
+            sort=[('created_at', -1)],
+            session=mongo_session
+        )
+    
+    if not last_diagnosis:
+        return no_diagnosis()
+    
+    return render_recommendations(last_diagnosis)
+
+def render_recommendations(last_diagnosis):
     result = last_diagnosis.get('result', {})
-    condition = result.get('condition', '').lower()
     severity = result.get('severity', 'normal')
     
-    # Generate recommendations based on condition
-    recommendations = {
-        'diet': [],
-        'exercise': [],
-        'lifestyle': []
-    }
-    
-    if 'fever' in condition:
-        recommendations['diet'].append('Drink plenty of fluids and warm soups')
-        recommendations['diet'].append('Eat light, easily digestible foods')
-        recommendations['lifestyle'].append('Get adequate rest')
-        recommendations['lifestyle'].append('Monitor temperature regularly')
-    
-    if 'tachycardia' in condition or 'bradycardia' in condition:
-        recommendations['exercise'].append('Avoid strenuous activities')
-        recommendations['exercise'].append('Practice gentle breathing exercises')
-        recommendations['lifestyle'].append('Reduce stress and anxiety')
-        recommendations['lifestyle'].append('Avoid caffeine and stimulants')
-    
-    if 'hypertension' in condition:
-        recommendations['diet'].append('Reduce sodium intake')
-        recommendations['diet'].append('Eat more fruits and vegetables')
-        recommendations['exercise'].append('Regular moderate exercise (30 min/day)')
-        recommendations['lifestyle'].append('Maintain healthy weight')
-        recommendations['lifestyle'].append('Limit alcohol consumption')
-    
-    if 'hypotension' in condition:
-        recommendations['diet'].append('Increase fluid intake')
-        recommendations['diet'].append('Add moderate salt to diet')
-        recommendations['lifestyle'].append('Avoid sudden position changes')
-        recommendations['lifestyle'].append('Wear compression stockings if needed')
-    
-    # Default recommendations
-    if not any(recommendations.values()):
-        recommendations['diet'] = ['Maintain a balanced diet', 'Stay hydrated']
-        recommendations['exercise'] = ['Regular physical activity', '30 minutes daily']
-        recommendations['lifestyle'] = ['Get 7-9 hours of sleep', 'Manage stress']
+    # Records written before condition masks existed carry only the display string
+    mask = result.get('condition_mask')
+    if mask is None:
+        mask = condition_mask(result.get('condition', ''))
+    recommendations = recommendations_for(mask)
     
     return render_template('recommendations.html', 
                          recommendations=recommendations,
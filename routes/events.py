@@ -0,0 +1,127 @@
+"""
+Live alert routes (Server-Sent Events)
+"""
+
+import json
+import threading
+from flask import Blueprint, Response, request, session, jsonify
+from services.admin import is_admin_request
+from services.aio import EventStream, run_sync
+from services.events import SEVERITIES
+
+bp = Blueprint('events', __name__, url_prefix='/events')
+
+STREAM_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+def init_event_routes(app, mongo_db, hub):
+    """Initialize event routes"""
+    bp.mongo = mongo_db
+    bp.app = app
+    bp.hub = hub
+    bp.thread_streams = threading.BoundedSemaphore(app.config['EVENTS_MAX_THREAD_STREAMS'])
+
+def _sse(event_id=None, event=None, data=None):
+    lines = []
+    if event_id:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data if data is not None else {})}')
+    return '\n'.join(lines) + '\n\n'
+
+def _subscribe():
+    """Subscribe the current request, or return the error response"""
+    if is_admin_request():
+        user_id = None
+    elif 'user_id' in session:
+        user_id = session['user_id']
+    else:
+        return None, (jsonify({'error': 'Not authenticated'}), 401)
+
+    severities = [s.strip() for s in request.args.get('severity', 'critical').split(',') if s.strip()]
+    if not severities or any(s not in SEVERITIES for s in severities):
+        return None, (jsonify({'error': f"severity must be a comma-separated list of {', '.join(SEVERITIES)}"}), 400)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    subscription = bp.hub.subscribe(user_id, severities, last_event_id)
+    if subscription is None:
+        return None, _too_many_streams()
+    return subscription, None
+
+def _too_many_streams():
+    return jsonify({'error': 'Too many alert subscribers, try again shortly'}), 503, {'Retry-After': '5'}
+
+def _opening(subscription):
+    yield f'retry: {bp.app.config["EVENTS_RETRY_MS"]}\n\n'
+    if not subscription.replayed:
+        # The client missed more than the replay buffer holds; it should reload its view
+        yield _sse(event='resync')
+
+def _chunk(subscription, event):
+    """SSE text for what the subscription returned, and whether the stream ends with it"""
+    if subscription.overflowed:
+        # Fell behind: end the stream, the browser reconnects with Last-Event-ID
+        return _sse(event='overflow'), True
+    if event is None:
+        # Comment line keeps proxies from timing out and detects closed clients
+        return ': keep-alive\n\n', False
+    bp.hub.delivered(event)
+    return _sse(event['id'], 'diagnosis', event['data']), False
+
+@bp.route('/alerts')
+def alerts():
+    """Stream diagnosis alerts: the user's own, or everyone's with the admin token (clinic dashboards)
+
+    ?severity=critical,moderate picks the severities (default: critical).
+    Served here, each stream holds a WSGI thread, so at most
+    EVENTS_MAX_THREAD_STREAMS are open per process; asgi.py serves the
+    same stream from alerts_async without one.
+    """
+    if not bp.thread_streams.acquire(blocking=False):
+        return _too_many_streams()
+    subscription, error = _subscribe()
+    if error is not None:
+        bp.thread_streams.release()
+        return error
+
+    heartbeat = bp.app.config['EVENTS_HEARTBEAT_SECONDS']
+
+    def stream():
+        yield from _opening(subscription)
+        while True:
+            chunk, last = _chunk(subscription, subscription.get(heartbeat))
+            yield chunk
+            if last:
+                return
+
+    def close():
+        subscription.close()
+        bp.thread_streams.release()
+
+    response = Response(stream(), mimetype='text/event-stream', headers=STREAM_HEADERS)
+    # Called by the WSGI server however the stream ends, even before its first chunk
+    response.call_on_close(close)
+    return response
+
+async def alerts_async():
+    """alerts() for asgi.py: the stream waits for events on the event loop"""
+    # Subscribing may check the deployment for change streams once
+    subscription, error = await run_sync(_subscribe)
+    if error is not None:
+        return error
+
+    heartbeat = bp.app.config['EVENTS_HEARTBEAT_SECONDS']
+
+    async def stream():
+        for chunk in _opening(subscription):
+            yield chunk
+        while True:
+            chunk, last = _chunk(subscription, await subscription.get_async(heartbeat))
+            yield chunk
+            if last:
+                return
+
+    return EventStream(stream(), headers=STREAM_HEADERS, close=subscription.close)
@@ -0,0 +1,69 @@
+"""
+Background job routes
+"""
+
+import os
+from flask import Blueprint, session, jsonify, send_file, url_for, abort
+from bson.errors import InvalidId
+from services.jobs import job_status
+
+bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+def init_job_routes(app, mongo_db, job_queue):
+    """Initialize job routes"""
+    bp.mongo = mongo_db
+    bp.app = app
+    bp.job_queue = job_queue
+
+def _enqueued(job_id):
+    return jsonify({
+        'job_id': str(job_id),
+        'status_url': url_for('jobs.status', job_id=str(job_id))
+    }), 202
+
+def _user_job(job_id):
+    try:
+        return bp.job_queue.get(job_id, user_id=session['user_id'])
+    except InvalidId:
+        return None
+
+@bp.route('/export-pdf', methods=['POST'])
+def export_pdf():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    return _enqueued(bp.job_queue.enqueue('export_pdf_batch', user_id=session['user_id']))
+
+@bp.route('/rescore', methods=['POST'])
+def rescore():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    return _enqueued(bp.job_queue.enqueue('rescore_history', user_id=session['user_id']))
+
+@bp.route('/<job_id>')
+def status(job_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    job = _user_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    data = job_status(job)
+    if job['status'] == 'done' and (job.get('result') or {}).get('file'):
+        data['download_url'] = url_for('jobs.download', job_id=job_id)
+    return jsonify(data)
+
+@bp.route('/<job_id>/download')
+def download(job_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    job = _user_job(job_id)
+    if not job or job['status'] != 'done' or not (job.get('result') or {}).get('file'):
+        abort(404)
+    
+    result = job['result']
+    path = os.path.abspath(os.path.join(bp.app.config['JOB_RESULTS_FOLDER'], result['file']))
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(path, mimetype=result['mimetype'], as_attachment=True, download_name=result['download_name'])
@@ -13,6 +13,7 @@ def init_profile_routes(app, mongo_db):
     """Initialize profile routes"""
     bp.mongo = mongo_db
     bp.app = app
+    bp.async_mongo = app.extensions['async_mongo']
 
 @bp.route('/view')
 def view():
@@ -26,6 +27,18 @@ def view():
     
     return render_template('profile.html', user=user)
 
+async def view_async():
+    """view() for asgi.py, reading through the async client"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    user = await bp.async_mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
+    if not user:
+        session.clear()
+        return redirect(url_for('auth.login'))
+    
+    return render_template('profile.html', user=user)
+
 @bp.route('/update', methods=['POST'])
 def update():
     if 'user_id' not in session:
@@ -37,7 +50,35 @@ def update():
         return redirect(url_for('auth.login'))
     
     # Update user profile
-    update_data = {
+    bp.mongo.db.users.update_one(
+        {'_id': ObjectId(session['user_id'])},
+        {'$set': profile_update()}
+    )
+    
+    flash('Profile updated successfully', 'success')
+    return redirect(url_for('profile.view'))
+
+async def update_async():
+    """update() for asgi.py, writing through the async client"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    user = await bp.async_mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
+    if not user:
+        session.clear()
+        return redirect(url_for('auth.login'))
+    
+    await bp.async_mongo.db.users.update_one(
+        {'_id': ObjectId(session['user_id'])},
+        {'$set': profile_update()}
+    )
+    
+    flash('Profile updated successfully', 'success')
+    return redirect(url_for('profile.view'))
+
+def profile_update():
+    """Fields set by a profile form submission"""
+    return {
         'name': request.form.get('name'),
         'age': int(request.form.get('age', 0)),
         'gender': request.form.get('gender'),
@@ -46,14 +87,6 @@ def update():
         'emergency_contact': request.form.get('emergency_contact', ''),
         'updated_at': datetime.now()
     }
-    
-    bp.mongo.db.users.update_one(
-        {'_id': ObjectId(session['user_id'])},
-        {'$set': update_data}
-    )
-    
-    flash('Profile updated successfully', 'success')
-    return redirect(url_for('profile.view'))
 
 
 
@@ -0,0 +1,32 @@
+"""
+Admin access helpers
+"""
+
+import hmac
+from functools import wraps
+from flask import current_app, request, jsonify
+
+
+def is_admin_request():
+    """Check the admin token sent with the current request"""
+    token = current_app.config.get('ADMIN_TOKEN')
+    if not token:
+        return False
+
+    supplied = request.headers.get('X-Admin-Token', '')
+    if not supplied:
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            supplied = auth_header[len('Bearer '):]
+
+    return hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8'))
+
+
+def admin_required(view):
+    """Reject requests that do not carry the admin token"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapped
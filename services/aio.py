@@ -0,0 +1,176 @@
+"""
+Async views for the ASGI entry point
+
+asgi.py serves a few endpoints from coroutines on the event loop instead
+of the WSGI thread pool. A coroutine view runs inside the endpoint's
+Flask request context, pushed in the request's own task (Flask keeps it
+in context variables), so session, url_for, flash, jsonify and
+render_template work as in a sync view and the session cookie is saved
+the same way. It returns what a Flask view returns, or an EventStream
+whose chunks are sent as its async iterator produces them. Blocking work
+goes through run_sync, which runs it on the loop's executor with the
+request context attached.
+
+Of the before-request hooks only the rate limit applies to coroutine
+views. The sampling profiler samples one thread, so it only covers WSGI
+requests.
+"""
+
+import asyncio
+import contextvars
+import functools
+import io
+from a2wsgi.wsgi import build_environ
+from flask import request
+from werkzeug.exceptions import HTTPException
+from services.ratelimit import SAFE_METHODS, limit_response
+
+
+class EventStream:
+    """A streamed response whose str chunks come from an async iterator
+
+    close is called once the stream ends, however it ends (including a
+    client that disconnects before the first chunk).
+    """
+
+    def __init__(self, chunks, mimetype='text/event-stream', headers=None, close=None):
+        self.chunks = chunks
+        self.mimetype = mimetype
+        self.headers = headers or {}
+        self.close = close
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run blocking func on the loop's executor, inside the current request context"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+def _asgi_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+async def _until_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class AsyncViews:
+    """ASGI app serving the given endpoints from coroutine views, every other request from fallback
+
+    views maps Flask endpoint names (e.g. 'diagnosis.history') to coroutine
+    functions taking the view arguments, like the sync views they replace.
+    """
+
+    def __init__(self, flask_app, views, fallback):
+        self.flask_app = flask_app
+        self.views = views
+        self.fallback = fallback
+
+    def _match(self, environ):
+        adapter = self.flask_app.url_map.bind_to_environ(environ, server_name=self.flask_app.config['SERVER_NAME'])
+        try:
+            endpoint, _ = adapter.match()
+        except HTTPException:
+            # 404, 405 and slash redirects are answered by the Flask app as usual
+            return None
+        return self.views.get(endpoint)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.fallback(scope, receive, send)
+        environ = build_environ(scope, io.BytesIO())
+        view = self._match(environ)
+        if view is None:
+            return await self.fallback(scope, receive, send)
+
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        environ['wsgi.input'] = io.BytesIO(b''.join(chunks))
+        environ['CONTENT_LENGTH'] = str(environ['wsgi.input'].getbuffer().nbytes)
+
+        app = self.flask_app
+        ctx = app.request_context(environ)
+        error = None
+        try:
+            ctx.push()
+            try:
+                try:
+                    rv = await self._limit()
+                    if rv is None:
+                        rv = await view(**ctx.request.view_args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                if not isinstance(rv, EventStream):
+                    response = app.process_response(app.make_response(rv))
+            except Exception as e:
+                error = e
+                rv = None
+                response = app.handle_exception(e)
+            if isinstance(rv, EventStream):
+                await self._stream(rv, receive, send, environ)
+            else:
+                await self._send(response, send, environ)
+        finally:
+            ctx.pop(error)
+
+    async def _limit(self):
+        limiter = self.flask_app.extensions.get('rate_limiter')
+        if limiter is None or request.method in SAFE_METHODS:
+            return None
+        # The MongoDB backend is synchronous: one short round trip on the executor
+        return await run_sync(limit_response, limiter)
+
+    @staticmethod
+    async def _send(response, send, environ):
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        try:
+            body = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                    'headers': _asgi_headers(headers)})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _stream(self, stream, receive, send, environ):
+        app = self.flask_app
+        try:
+            # Headers (and the session cookie) go through the usual after-request processing
+            # An iterator body, so no Content-Length: the server chunks the stream
+            response = app.process_response(
+                app.response_class(iter(()), mimetype=stream.mimetype, headers=stream.headers)
+            )
+            _, status, headers = response.get_wsgi_response(environ)
+
+            async def pump():
+                await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                            'headers': _asgi_headers(headers)})
+                async for chunk in stream.chunks:
+                    await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+
+            # Stop as soon as the client goes away rather than at the next chunk
+            tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(_until_disconnect(receive))]
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            if tasks[0] in done and not tasks[0].cancelled() and tasks[0].exception() is not None:
+                # Headers are already out; let the server log it and drop the connection
+                raise tasks[0].exception()
+        finally:
+            if hasattr(stream.chunks, 'aclose'):
+                await stream.chunks.aclose()
+            if stream.close is not None:
+                stream.close()
@@ -0,0 +1,224 @@
+"""
+Columnar export of diagnoses for offline analytics
+
+Diagnoses are streamed through a projected, batched cursor into a Parquet
+dataset partitioned Hive-style by month and severity:
+
+    ANALYTICS_EXPORT_FOLDER/month=2026-10/severity=critical/part-<run>-0.parquet
+
+Vitals are typed float32 columns; patient names and contact details are
+not exported. Each run records the last exported (created_at, _id) in
+``_watermark.json`` and the next run only reads newer rows. Rows younger
+than ``safety_seconds`` are left for a later run: created_at is stamped
+before the insert commits, and the export reads from a secondary that may
+still be catching up, so a row newer than the watermark could otherwise
+become visible only after the watermark had passed it. A run writes
+into a staging directory first, so an interrupted export leaves neither
+partial files nor an advanced watermark behind. Runs hold an exclusive
+lock on ``_export.lock`` in the dataset folder, so exports started from
+manage.py and from queued jobs run one after another.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ASCENDING
+from services.mongo import read_collection
+
+# Optional import for Parquet output
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+VITAL_COLUMNS = ('temperature', 'heart_rate', 'systolic_bp', 'diastolic_bp', 'respiratory_rate', 'oxygen_saturation')
+
+WATERMARK_FILE = '_watermark.json'
+LOCK_FILE = '_export.lock'
+STAGING_PREFIX = '_staging-'
+
+PROJECTION = {
+    'user_id': 1, 'created_at': 1, 'algorithm': 1, 'patient_age': 1, 'image_path': 1,
+    'vitals': 1, 'result.condition': 1, 'result.condition_mask': 1, 'result.severity': 1, 'result.confidence': 1
+}
+
+
+def export_schema():
+    return pa.schema(
+        [
+            ('diagnosis_id', pa.string()),
+            ('user_id', pa.string()),
+            ('created_at', pa.timestamp('ms')),
+            ('algorithm', pa.string()),
+            ('condition', pa.string()),
+            ('condition_mask', pa.uint8()),
+            ('confidence', pa.float32()),
+            ('patient_age', pa.int16()),
+            ('has_image', pa.bool_()),
+        ]
+        + [(name, pa.float32()) for name in VITAL_COLUMNS]
+        + [('month', pa.string()), ('severity', pa.string())]
+    )
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _record_batches(cursor, schema, batch_size, progress):
+    columns = {name: [] for name in schema.names}
+    for doc in cursor:
+        vitals = doc.get('vitals') or {}
+        result = doc.get('result') or {}
+        created_at = doc['created_at']
+        columns['diagnosis_id'].append(str(doc['_id']))
+        columns['user_id'].append(str(doc['user_id']) if doc.get('user_id') else None)
+        columns['created_at'].append(created_at)
+        columns['algorithm'].append(doc.get('algorithm'))
+        columns['condition'].append(result.get('condition'))
+        columns['condition_mask'].append(result.get('condition_mask'))
+        columns['confidence'].append(_number(result.get('confidence')))
+        age = _number(doc.get('patient_age'), int)
+        columns['patient_age'].append(age if age is not None and 0 <= age < 32768 else None)
+        columns['has_image'].append(bool(doc.get('image_path')))
+        for name in VITAL_COLUMNS:
+            columns[name].append(_number(vitals.get(name)))
+        columns['month'].append(created_at.strftime('%Y-%m'))
+        columns['severity'].append(result.get('severity') or 'unknown')
+
+        progress['rows'] += 1
+        progress['last'] = (created_at, doc['_id'])
+        if len(columns['diagnosis_id']) >= batch_size:
+            yield pa.RecordBatch.from_pydict(columns, schema=schema)
+            columns = {name: [] for name in schema.names}
+    if columns['diagnosis_id']:
+        yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def read_watermark(folder):
+    try:
+        with open(os.path.join(folder, WATERMARK_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_watermark(folder, watermark):
+    path = os.path.join(folder, WATERMARK_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(watermark, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+@contextmanager
+def _export_lock(folder):
+    """Wait for and hold the folder's export lock; the OS releases it if the process dies"""
+    with open(os.path.join(folder, LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def export_diagnoses_parquet(mongo, folder, batch_size=10000, full=False, safety_seconds=600):
+    """Export new diagnoses (all of them with full=True) and return run statistics
+
+    Only rows created more than safety_seconds ago are exported. Waits for
+    any other export into the same folder to finish first.
+    """
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError('pyarrow is required for the Parquet export')
+
+    os.makedirs(folder, exist_ok=True)
+    with _export_lock(folder):
+        return _export(mongo, folder, batch_size, full, safety_seconds)
+
+
+def _export(mongo, folder, batch_size, full, safety_seconds):
+    # Under the lock, any staging directory belongs to a run that is gone
+    for name in os.listdir(folder):
+        if name.startswith(STAGING_PREFIX):
+            shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+
+    watermark = None if full else read_watermark(folder)
+    cutoff = datetime.now() - timedelta(seconds=safety_seconds)
+    query = {'created_at': {'$lt': cutoff}}
+    if watermark:
+        since = datetime.fromisoformat(watermark['created_at'])
+        last_id = ObjectId(watermark['diagnosis_id'])
+        query['$or'] = [
+            {'created_at': {'$gt': since}},
+            {'created_at': since, '_id': {'$gt': last_id}}
+        ]
+
+    # Lets the watermark query and sort walk an index instead of sorting in memory
+    mongo.db.diagnoses.create_index([('created_at', ASCENDING), ('_id', ASCENDING)])
+    cursor = read_collection(mongo, 'diagnoses', endpoint='analytics_export').find(
+        query, PROJECTION
+    ).sort([('created_at', 1), ('_id', 1)]).batch_size(batch_size)
+
+    run_id = datetime.now().strftime('%Y%m%d%H%M%S') + '-' + uuid.uuid4().hex[:6]
+    staging = os.path.join(folder, STAGING_PREFIX + run_id)
+    schema = export_schema()
+    progress = {'rows': 0, 'last': None}
+    ds.write_dataset(
+        _record_batches(cursor, schema, batch_size, progress),
+        staging,
+        schema=schema,
+        format='parquet',
+        partitioning=ds.partitioning(pa.schema([('month', pa.string()), ('severity', pa.string())]), flavor='hive'),
+        basename_template=f'part-{run_id}-{{i}}.parquet',
+        max_rows_per_group=batch_size
+    )
+
+    if full:
+        # A full export replaces the dataset instead of appending to it
+        for name in os.listdir(folder):
+            if name.startswith('month='):
+                shutil.rmtree(os.path.join(folder, name))
+
+    files = 0
+    if os.path.isdir(staging):
+        for root, dirs, names in os.walk(staging):
+            target_dir = os.path.join(folder, os.path.relpath(root, staging))
+            for name in names:
+                os.makedirs(target_dir, exist_ok=True)
+                os.replace(os.path.join(root, name), os.path.join(target_dir, name))
+                files += 1
+        shutil.rmtree(staging, ignore_errors=True)
+
+    if progress['last'] is not None:
+        created_at, diagnosis_id = progress['last']
+        watermark = {
+            'created_at': created_at.isoformat(),
+            'diagnosis_id': str(diagnosis_id),
+            'exported_at': datetime.now().isoformat(),
+            'run_id': run_id
+        }
+        _write_watermark(folder, watermark)
+    elif full:
+        # The dataset was emptied, so an older watermark would skip those rows next time
+        try:
+            os.remove(os.path.join(folder, WATERMARK_FILE))
+        except FileNotFoundError:
+            pass
+
+    return {
+        'run_id': run_id,
+        'rows': progress['rows'],
+        'files': files,
+        'full': full,
+        'cutoff': cutoff.isoformat(),
+        'watermark': watermark['created_at'] if watermark else None
+    }
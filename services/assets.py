@@ -0,0 +1,146 @@
+"""
+Fingerprinted, precompressed static assets
+
+``python manage.py build-assets`` minifies the CSS and JS under static/,
+writes each one as ``static/dist/<name>.<hash>.<ext>`` together with
+``.gz`` (and ``.br`` when the brotli package is installed) siblings, and
+records the mapping in ``static/dist/manifest.json``. Templates call
+``asset_url('css/style.css')``, which resolves through the manifest and
+falls back to the plain static file when no build exists. Built files are
+served from /assets/ with immutable caching since their names change
+whenever their content does.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from flask import abort, request, send_file, url_for
+from werkzeug.security import safe_join
+
+# Optional import for Brotli output
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+ASSET_EXTENSIONS = ('.css', '.js')
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    # Only after the colon: a space before one is a descendant selector
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """Drop indentation, blank lines and whole-line comments
+
+    Line breaks are kept so automatic semicolon insertion behaves exactly
+    as in the source; nothing inside a line is touched.
+    """
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def _write(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def build_assets(static_folder):
+    """Build every CSS/JS asset under static_folder and return the manifest"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    if not BROTLI_AVAILABLE:
+        print("Warning: brotli not available. Only .gz assets will be written.")
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist)
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext not in ASSET_EXTENSIONS:
+                continue
+            source = os.path.join(root, name)
+            relpath = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, encoding='utf-8') as f:
+                data = MINIFIERS[ext](f.read()).encode('utf-8')
+
+            fingerprint = hashlib.sha256(data).hexdigest()[:12]
+            hashed = f'{os.path.dirname(relpath)}/{stem}.{fingerprint}{ext}'.lstrip('/')
+            target = os.path.join(dist, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write(target, data)
+            # mtime=0 keeps the .gz byte-identical across builds
+            _write(target + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if BROTLI_AVAILABLE:
+                _write(target + '.br', brotli.compress(data, quality=11))
+            manifest[relpath] = hashed
+
+    os.makedirs(dist, exist_ok=True)
+    _write(os.path.join(dist, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def init_assets(app):
+    """Register the asset_url template helper and the /assets/ route"""
+    manifest = load_manifest(app.static_folder)
+    dist = os.path.join(app.static_folder, DIST_DIR)
+    app.extensions['asset_manifest'] = manifest
+
+    @app.template_global()
+    def asset_url(filename):
+        hashed = manifest.get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('serve_asset', filename=hashed)
+
+    @app.route('/assets/<path:filename>')
+    def serve_asset(filename):
+        path = safe_join(dist, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for name, suffix in ENCODINGS:
+            if request.accept_encodings[name] and os.path.isfile(path + suffix):
+                encoding, path = name, path + suffix
+                break
+
+        response = send_file(path, mimetype=mimetype, conditional=True, max_age=31536000)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+    return manifest
@@ -0,0 +1,184 @@
+"""
+Conditional GET for pages built from a user's diagnoses
+
+Every write that changes what history, comparison or recommendations
+show calls ``touch_diagnoses``, which bumps ``diagnoses_version`` and
+``diagnoses_updated_at`` on the user document, after the diagnosis write
+itself. ``conditional_on_diagnoses`` reads those two fields with a
+primary-key lookup before the view runs. It answers If-None-Match /
+If-Modified-Since with 304, so an unchanged page costs neither its
+queries, nor rerunning the algorithms, nor a template render. Users with
+no version yet fall back to their latest diagnosis, read through the
+(user_id, created_at) index.
+
+The version is read with the page's read preference, in a causal session
+that the view's own reads then join. Whichever secondary serves the page
+has applied at least everything the version read saw, so a page is never
+older than the version in its ETag, whether the write came from this
+browser, another one, or a background job.
+
+The ETag also covers the page URL, the template sources and the asset
+manifest, so a deploy invalidates cached pages without any data change.
+
+async_conditional_on_diagnoses does the same for the coroutine views in
+asgi.py, reading through the AsyncMongoClient.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+from bson import ObjectId
+from flask import current_app, make_response, request, session
+from services import metrics
+from services.mongo import async_causal_read_session, causal_read_session, read_collection
+
+CONDITIONAL_REQUESTS = metrics.counter(
+    'conditional_requests_total', 'Conditional page requests by endpoint and result (not_modified/rendered)'
+)
+
+
+def touch_diagnoses(mongo, user_id, session=None):
+    """Mark a user's diagnosis pages as changed"""
+    mongo.db.users.update_one(
+        {'_id': ObjectId(user_id)},
+        {'$inc': {'diagnoses_version': 1}, '$set': {'diagnoses_updated_at': datetime.now()}},
+        session=session
+    )
+
+
+VERSION_FIELDS = {'diagnoses_version': 1, 'diagnoses_updated_at': 1}
+
+
+def diagnoses_version(mongo, user_id, mongo_session=None):
+    """(version, last modified) of a user's diagnoses, read like the current endpoint's pages"""
+    user_id = ObjectId(user_id)
+    user = read_collection(mongo, 'users').find_one({'_id': user_id}, VERSION_FIELDS, session=mongo_session)
+    if user and user.get('diagnoses_updated_at'):
+        return _user_version(user)
+    latest = read_collection(mongo, 'diagnoses').find_one(
+        {'user_id': user_id}, {'created_at': 1}, sort=[('created_at', -1)], session=mongo_session
+    )
+    return _latest_version(latest)
+
+
+async def async_diagnoses_version(mongo, user_id, mongo_session=None):
+    """diagnoses_version on an AsyncMongo"""
+    user_id = ObjectId(user_id)
+    user = await read_collection(mongo, 'users').find_one({'_id': user_id}, VERSION_FIELDS, session=mongo_session)
+    if user and user.get('diagnoses_updated_at'):
+        return _user_version(user)
+    latest = await read_collection(mongo, 'diagnoses').find_one(
+        {'user_id': user_id}, {'created_at': 1}, sort=[('created_at', -1)], session=mongo_session
+    )
+    return _latest_version(latest)
+
+
+def _user_version(user):
+    return f"v{user.get('diagnoses_version', 0)}", user['diagnoses_updated_at']
+
+
+def _latest_version(latest):
+    # Users with no version yet: their newest diagnosis stands in for it
+    if latest is None:
+        return 'empty', None
+    return f"d{latest['_id']}", latest.get('created_at')
+
+
+def render_version(app):
+    """Hash and newest modification time of the templates and asset manifest, computed once"""
+    cached = app.extensions.get('render_version')
+    if cached is None:
+        digest = hashlib.sha1()
+        newest = 0.0
+        for name in sorted(app.jinja_env.list_templates()):
+            source, filename, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+            digest.update(name.encode('utf-8') + b'\0' + source.encode('utf-8'))
+            if filename and os.path.exists(filename):
+                newest = max(newest, os.path.getmtime(filename))
+        manifest = app.extensions.get('asset_manifest') or {}
+        digest.update(repr(sorted(manifest.items())).encode('utf-8'))
+        cached = app.extensions['render_version'] = (digest.hexdigest()[:12], datetime.fromtimestamp(newest))
+    return cached
+
+
+def _as_utc(value):
+    # Stored times are naive local times
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _validators(version, modified, extra):
+    """(etag, last_modified) of the current page"""
+    templates, templates_modified = render_version(current_app)
+    key = '\0'.join([session['user_id'], version, templates, request.full_path] + [str(e) for e in extra])
+    etag = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+    return etag, _as_utc(max(modified, templates_modified) if modified else templates_modified)
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = bool(request.if_modified_since) and last_modified <= request.if_modified_since
+    CONDITIONAL_REQUESTS.inc(endpoint=request.endpoint, result='not_modified' if not_modified else 'rendered')
+    return not_modified
+
+
+def _mark(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    # Revalidate on every view; the page is per user
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional_on_diagnoses(*extra):
+    """Serve 304 for a logged-in user's page while their diagnoses have not changed
+
+    extra values (e.g. the model version) become part of the ETag.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            # Pending flash messages are part of the page
+            if 'user_id' not in session or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            mongo = current_app.extensions['mongo']
+            # The view's reads join this session, so they see at least the version read here
+            with causal_read_session(mongo, always=True) as mongo_session:
+                version, modified = diagnoses_version(mongo, session['user_id'], mongo_session)
+                etag, last_modified = _validators(version, modified, extra)
+                if _not_modified(etag, last_modified):
+                    response = make_response('', 304)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+            return _mark(response, etag, last_modified)
+        return wrapped
+    return decorator
+
+
+def async_conditional_on_diagnoses(*extra):
+    """conditional_on_diagnoses for coroutine views"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(*args, **kwargs):
+            if 'user_id' not in session or '_flashes' in session:
+                return await view(*args, **kwargs)
+
+            mongo = current_app.extensions['async_mongo']
+            async with async_causal_read_session(mongo, always=True) as mongo_session:
+                version, modified = await async_diagnoses_version(mongo, session['user_id'], mongo_session)
+                etag, last_modified = _validators(version, modified, extra)
+                if _not_modified(etag, last_modified):
+                    response = make_response('', 304)
+                else:
+                    response = make_response(await view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+            return _mark(response, etag, last_modified)
+        return wrapped
+    return decorator
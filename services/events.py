@@ -0,0 +1,336 @@
+"""
+Live diagnosis alerts
+
+Every stored diagnosis becomes an event on an in-process bus. Subscribers
+(the Server-Sent Events stream at /events/alerts) each get a bounded
+queue. Publishing never blocks: a subscriber whose queue is full is cut
+off and reconnects, picking up what it missed from a short replay buffer
+keyed by event id (the SSE Last-Event-ID), so one slow dashboard cannot
+hold up diagnosis submissions or the other subscribers. A subscriber is
+read either from a thread (get) or from a coroutine (get_async, used by
+asgi.py, where an open stream costs a socket and a queue but no thread).
+
+With a replica set or sharded cluster, each web process instead tails a
+MongoDB change stream on ``diagnoses`` (EVENTS_BACKEND 'auto' or
+'changestream'). Alerts then reach subscribers connected to any worker,
+and results updated later by background image analysis are published too.
+The relay thread starts with a process's first subscriber. On a
+standalone server, events only reach subscribers of the process that
+stored the diagnosis.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pymongo.errors import OperationFailure, PyMongoError
+from services import metrics
+
+PUBLISHED = metrics.counter('events_published_total', 'Diagnosis events published, by source (local/changestream)')
+SUBSCRIBERS = metrics.gauge('event_subscribers', 'Open event subscriptions')
+OVERFLOWS = metrics.counter('event_subscriber_overflows_total', 'Subscribers disconnected because their queue was full')
+DELIVERY_LATENCY = metrics.histogram(
+    'event_delivery_seconds', 'Time from storing a diagnosis to handing its event to a subscriber'
+)
+
+SEVERITIES = ('normal', 'moderate', 'critical')
+
+# Only the fields an alert needs are read from the change stream
+CHANGE_STREAM_PIPELINE = [
+    {'$match': {'$or': [
+        {'operationType': 'insert'},
+        {'operationType': 'update', 'updateDescription.updatedFields.result': {'$exists': True}}
+    ]}},
+    {'$project': {
+        'operationType': 1,
+        'fullDocument._id': 1,
+        'fullDocument.user_id': 1,
+        'fullDocument.patient_name': 1,
+        'fullDocument.algorithm': 1,
+        'fullDocument.result': 1,
+        'fullDocument.created_at': 1
+    }}
+]
+
+
+def diagnosis_event(diagnosis, event_id=None, kind='created'):
+    """Build the event published for a stored diagnosis document"""
+    result = diagnosis.get('result') or {}
+    created_at = diagnosis.get('created_at')
+    return {
+        'id': event_id or str(diagnosis['_id']),
+        'user_id': str(diagnosis.get('user_id')),
+        'severity': result.get('severity', 'unknown'),
+        'created_at': created_at,
+        'data': {
+            'kind': kind,
+            'diagnosis_id': str(diagnosis['_id']),
+            'patient_name': diagnosis.get('patient_name', ''),
+            'condition': result.get('condition'),
+            'condition_mask': result.get('condition_mask'),
+            'severity': result.get('severity', 'unknown'),
+            'confidence': result.get('confidence'),
+            'algorithm': result.get('algorithm') or diagnosis.get('algorithm'),
+            'created_at': created_at.isoformat() if created_at else None
+        }
+    }
+
+
+class Subscription:
+    """A subscriber's bounded queue of events"""
+
+    def __init__(self, bus, predicate, max_queue):
+        self.bus = bus
+        self.predicate = predicate
+        self.queue = queue.Queue(max_queue)
+        self.overflowed = False
+        # False when the events after the requested Last-Event-ID were not replayed:
+        # the id had left the replay buffer, or more were missed than the queue holds
+        self.replayed = True
+        # (loop, future) of a coroutine waiting in get_async
+        self._waiter = None
+
+    def offer(self, event):
+        """Queue an event without blocking; return False once the subscriber has fallen behind"""
+        if self.overflowed:
+            return False
+        if self.predicate is not None and not self.predicate(event):
+            return True
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+            OVERFLOWS.inc()
+            self._wake()
+            return False
+        self._wake()
+        return True
+
+    def _wake(self):
+        # Publishers run on request and relay threads; the waiter's future belongs to its loop
+        waiter = self._waiter
+        if waiter is not None:
+            loop, future = waiter
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def get(self, timeout):
+        """Next event, or None after timeout seconds without one"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def get_async(self, timeout):
+        """Like get, but waits on the running event loop instead of blocking a thread"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            if self.overflowed:
+                return None
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            future = loop.create_future()
+            self._waiter = (loop, future)
+            try:
+                # An offer between the check above and setting the waiter did not wake us
+                if self.queue.empty() and not self.overflowed:
+                    await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self._waiter = None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class EventBus:
+    """In-process fan-out to bounded subscriber queues"""
+
+    def __init__(self, max_queue=100, replay_size=500, max_subscribers=1000):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._recent = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, predicate=None, last_event_id=None):
+        """Open a subscription, or return None when max_subscribers are connected
+
+        With last_event_id, the subscriber's events published after it are
+        queued first. When the id has left the replay buffer, or more events
+        were missed than the queue holds, nothing is queued and replayed is
+        False, so the client resyncs instead of overflowing straight away.
+        """
+        subscription = Subscription(self, predicate, self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if last_event_id:
+                ids = [event['id'] for event in self._recent]
+                missed = None
+                if last_event_id in ids:
+                    missed = [
+                        event for event in list(self._recent)[ids.index(last_event_id) + 1:]
+                        if predicate is None or predicate(event)
+                    ]
+                if missed is not None and len(missed) <= self.max_queue:
+                    for event in missed:
+                        subscription.offer(event)
+                else:
+                    subscription.replayed = False
+            self._subscribers.add(subscription)
+        SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription not in self._subscribers:
+                return
+            self._subscribers.discard(subscription)
+        SUBSCRIBERS.dec()
+
+    def publish(self, event):
+        with self._lock:
+            self._recent.append(event)
+            lagging = [s for s in self._subscribers if not s.offer(event)]
+            self._subscribers.difference_update(lagging)
+        if lagging:
+            SUBSCRIBERS.dec(len(lagging))
+
+
+class ChangeStreamRelay:
+    """Publishes diagnosis inserts and result updates from a MongoDB change stream"""
+
+    def __init__(self, mongo, bus, max_await_ms=500):
+        self.mongo = mongo
+        self.bus = bus
+        self.max_await_ms = max_await_ms
+        self.resume_token = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # Threads do not survive fork, so each worker starts its own
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='change-stream-relay', daemon=True).start()
+
+    def _run(self):
+        delay = 1
+        while True:
+            try:
+                with self.mongo.db.diagnoses.watch(
+                    CHANGE_STREAM_PIPELINE,
+                    full_document='updateLookup',
+                    resume_after=self.resume_token,
+                    max_await_time_ms=self.max_await_ms
+                ) as stream:
+                    delay = 1
+                    for change in stream:
+                        self.resume_token = stream.resume_token
+                        self._publish(change)
+            except PyMongoError as e:
+                print(f"Change stream relay error, retrying in {delay}s: {e}")
+                if isinstance(e, OperationFailure) and e.code == 286:
+                    # ChangeStreamHistoryLost: start again from now
+                    self.resume_token = None
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _publish(self, change):
+        diagnosis = change.get('fullDocument')
+        if not diagnosis:
+            return
+        kind = 'created' if change['operationType'] == 'insert' else 'updated'
+        self.bus.publish(diagnosis_event(diagnosis, event_id=change['_id']['_data'], kind=kind))
+        PUBLISHED.inc(source='changestream')
+
+
+def change_streams_supported(mongo):
+    """Change streams need a replica set or a mongos"""
+    try:
+        hello = mongo.db.command('hello')
+    except (PyMongoError, NotImplementedError):
+        return False
+    return bool(hello.get('setName')) or hello.get('msg') == 'isdbgrid'
+
+
+class AlertHub:
+    """Entry point used by the routes: publish stored diagnoses, subscribe to alerts"""
+
+    def __init__(self, mongo, backend='auto', max_queue=100, replay_size=500, max_subscribers=1000):
+        self.mongo = mongo
+        self.backend = backend
+        self.bus = EventBus(max_queue, replay_size, max_subscribers)
+        self.relay = ChangeStreamRelay(mongo, self.bus)
+        self._use_change_stream = None
+
+    @property
+    def uses_change_stream(self):
+        if self._use_change_stream is None:
+            if self.backend == 'changestream':
+                self._use_change_stream = True
+            elif self.backend == 'auto':
+                self._use_change_stream = change_streams_supported(self.mongo)
+            else:
+                self._use_change_stream = False
+        return self._use_change_stream
+
+    def publish_diagnosis(self, diagnosis):
+        """Announce a newly stored diagnosis to this process's subscribers
+
+        With a change stream the relay publishes it instead, in every process.
+        """
+        if self.uses_change_stream:
+            return
+        self.bus.publish(diagnosis_event(diagnosis))
+        PUBLISHED.inc(source='local')
+
+    def subscribe(self, user_id=None, severities=SEVERITIES, last_event_id=None):
+        """Subscribe to one user's diagnoses (or everyone's with user_id=None) of the given severities"""
+        if self.uses_change_stream:
+            self.relay.ensure_started()
+        severities = frozenset(severities)
+
+        def wanted(event):
+            return event['severity'] in severities and (user_id is None or event['user_id'] == user_id)
+
+        return self.bus.subscribe(wanted, last_event_id)
+
+    @staticmethod
+    def delivered(event):
+        """Record how long an event took from storage to a subscriber"""
+        if event.get('created_at'):
+            DELIVERY_LATENCY.observe(max(0.0, (datetime.now() - event['created_at']).total_seconds()))
+
+
+def init_events(app, mongo):
+    """Create the AlertHub for this app"""
+    hub = AlertHub(
+        mongo,
+        backend=app.config['EVENTS_BACKEND'],
+        max_queue=app.config['EVENTS_QUEUE_SIZE'],
+        replay_size=app.config['EVENTS_REPLAY_SIZE'],
+        max_subscribers=app.config['EVENTS_MAX_SUBSCRIBERS']
+    )
+    app.extensions['events'] = hub
+    return hub
@@ -0,0 +1,252 @@
+"""
+Nearest-hospital lookup
+
+Hospitals are loaded once from CSV or GeoJSON into a k-d tree over unit
+vectors on the sphere, where straight-line (chord) distance orders points
+the same way as great-circle distance. Queries are cached per geohash
+cell: the cache keeps every hospital that could be among the k nearest to
+any point in the cell, and results are re-ranked for the exact location.
+"""
+
+import csv
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def to_unit_vector(lat, lon):
+    lat_r = math.radians(lat)
+    lon_r = math.radians(lon)
+    cos_lat = math.cos(lat_r)
+    return (cos_lat * math.cos(lon_r), cos_lat * math.sin(lon_r), math.sin(lat_r))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def km_to_chord(km):
+    """Convert a great-circle distance to chord length on the unit sphere"""
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+def geohash_encode(lat, lon, precision=6):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash):
+    """Return (min_lat, min_lon, max_lat, max_lon) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+class KDTree:
+    """Static 3-d tree over (point, payload) pairs"""
+
+    def __init__(self, points):
+        self.root = self._build(list(points), 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda item: item[0][axis])
+        median = len(items) // 2
+        return (
+            items[median],
+            axis,
+            self._build(items[:median], depth + 1),
+            self._build(items[median + 1:], depth + 1),
+        )
+
+    def within(self, target, radius):
+        """Return payloads whose point lies within radius of target"""
+        found = []
+        radius_sq = radius * radius
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            (point, payload), axis, left, right = node
+            dist_sq = sum((a - b) ** 2 for a, b in zip(point, target))
+            if dist_sq <= radius_sq:
+                found.append(payload)
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append(near)
+            if diff * diff <= radius_sq:
+                stack.append(far)
+        return found
+
+    def nearest(self, target, k):
+        """Return the k nearest (squared distance, payload) pairs"""
+        best = []  # sorted list of (dist_sq, order, payload), at most k long
+        order = 0
+
+        def visit(node):
+            nonlocal order
+            if node is None:
+                return
+            (point, payload), axis, left, right = node
+            dist_sq = sum((a - b) ** 2 for a, b in zip(point, target))
+            if len(best) < k or dist_sq < best[-1][0]:
+                order += 1
+                best.append((dist_sq, order, payload))
+                best.sort(key=lambda item: item[:2])
+                del best[k:]
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if len(best) < k or diff * diff < best[-1][0]:
+                visit(far)
+
+        visit(self.root)
+        return [(dist_sq, payload) for dist_sq, _, payload in best]
+
+
+class HospitalIndex:
+    """In-memory spatial index of hospitals with a per-geohash-cell cache"""
+
+    def __init__(self, hospitals, geohash_precision=6, cache_size=4096):
+        self.hospitals = list(hospitals)
+        self.geohash_precision = geohash_precision
+        self.cache_size = cache_size
+        self._tree = KDTree(
+            (to_unit_vector(h['latitude'], h['longitude']), index)
+            for index, h in enumerate(self.hospitals)
+        )
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Load hospitals from a CSV or GeoJSON file"""
+        if not path or not os.path.exists(path):
+            print(f"Warning: hospitals data file not found: {path}. Nearby hospital lookup is disabled.")
+            return cls([], **kwargs)
+        if path.endswith(('.geojson', '.json')):
+            hospitals = _load_geojson(path)
+        else:
+            hospitals = _load_csv(path)
+        return cls(hospitals, **kwargs)
+
+    def __len__(self):
+        return len(self.hospitals)
+
+    def nearest(self, lat, lon, k=5):
+        """Return the k nearest hospitals to (lat, lon), closest first"""
+        if not self.hospitals or k <= 0:
+            return []
+        k = min(k, len(self.hospitals))
+        candidates = self._cell_candidates(geohash_encode(lat, lon, self.geohash_precision), k)
+        ranked = sorted(
+            (haversine_km(lat, lon, self.hospitals[i]['latitude'], self.hospitals[i]['longitude']), i)
+            for i in candidates
+        )
+        return [dict(self.hospitals[i], distance_km=round(distance, 2)) for distance, i in ranked[:k]]
+
+    def _cell_candidates(self, cell, k):
+        key = (cell, k)
+        with self._lock:
+            candidates = self._cache.get(key)
+            if candidates is not None:
+                self._cache.move_to_end(key)
+                return candidates
+
+        # Any of the k nearest to a point q in the cell is within
+        # d_k(center) + 2 * half_diagonal of the cell center.
+        min_lat, min_lon, max_lat, max_lon = geohash_bounds(cell)
+        center_lat = (min_lat + max_lat) / 2
+        center_lon = (min_lon + max_lon) / 2
+        half_diagonal = max(
+            haversine_km(center_lat, center_lon, corner_lat, corner_lon)
+            for corner_lat in (min_lat, max_lat)
+            for corner_lon in (min_lon, max_lon)
+        )
+        center = to_unit_vector(center_lat, center_lon)
+        kth_chord = math.sqrt(self._tree.nearest(center, k)[-1][0])
+        kth_km = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, kth_chord / 2))
+        candidates = tuple(self._tree.within(center, km_to_chord(kth_km + 2 * half_diagonal) + 1e-12))
+
+        with self._lock:
+            self._cache[key] = candidates
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return candidates
+
+
+def _hospital(name, address, phone, lat, lon):
+    return {
+        'name': name,
+        'address': address or '',
+        'phone': phone or '',
+        'latitude': float(lat),
+        'longitude': float(lon),
+    }
+
+
+def _load_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [
+            _hospital(row['name'], row.get('address'), row.get('phone'), row['latitude'], row['longitude'])
+            for row in csv.DictReader(f)
+            if row.get('latitude') and row.get('longitude')
+        ]
+
+
+def _load_geojson(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    hospitals = []
+    for feature in data.get('features', []):
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            continue
+        lon, lat = geometry['coordinates'][:2]
+        props = feature.get('properties') or {}
+        hospitals.append(_hospital(props.get('name', 'Hospital'), props.get('address'), props.get('phone'), lat, lon))
+    return hospitals
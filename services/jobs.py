@@ -0,0 +1,226 @@
+"""
+MongoDB-backed background job queue
+
+Jobs are documents in the ``jobs`` collection. Workers claim them with an
+atomic find_one_and_update and hold a lease while running; a job whose
+worker died is picked up again once the lease expires. Failed jobs are
+retried with exponential backoff up to ``max_attempts``. While a handler
+runs, its worker renews the lease every third of ``lease_seconds``, so
+long jobs are not handed to a second worker; a job whose lease ran out
+``max_attempts`` times (e.g. it keeps crashing its worker) is failed.
+"""
+
+import os
+import socket
+import threading
+import time
+import traceback
+from collections import namedtuple
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+# Handlers receive (job, context) and return a JSON-serialisable result dict
+HANDLERS = {}
+
+JobContext = namedtuple('JobContext', ['app', 'mongo', 'ml_engine', 'queue'])
+
+
+def job_handler(job_type):
+    """Register a function as the handler for a job type"""
+    def decorator(func):
+        HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+class JobQueue:
+    """Enqueue, claim and settle background jobs"""
+
+    def __init__(self, mongo, max_attempts=3, retry_delay=30, lease_seconds=300):
+        self.mongo = mongo
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+
+    @property
+    def collection(self):
+        return self.mongo.db.jobs
+
+    def ensure_indexes(self):
+        self.collection.create_index([('status', ASCENDING), ('run_at', ASCENDING)])
+        self.collection.create_index([('user_id', ASCENDING), ('created_at', ASCENDING)])
+
+    def enqueue(self, job_type, payload=None, user_id=None, max_attempts=None, delay=0):
+        """Add a job and return its id"""
+        if job_type not in HANDLERS:
+            raise ValueError(f'Unknown job type: {job_type}')
+        now = datetime.now()
+        job = {
+            'type': job_type,
+            'payload': payload or {},
+            'user_id': ObjectId(user_id) if user_id else None,
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': max_attempts or self.max_attempts,
+            'run_at': now + timedelta(seconds=delay),
+            'created_at': now,
+            'updated_at': now,
+            'result': None,
+            'error': None
+        }
+        return self.collection.insert_one(job).inserted_id
+
+    def get(self, job_id, user_id=None):
+        query = {'_id': ObjectId(job_id)}
+        if user_id is not None:
+            query['user_id'] = ObjectId(user_id)
+        return self.collection.find_one(query)
+
+    def fail_expired(self):
+        """Fail running jobs whose lease expired with no attempts left"""
+        now = datetime.now()
+        return self.collection.update_many(
+            {'status': 'running', 'lease_expires_at': {'$lte': now},
+             '$expr': {'$gte': ['$attempts', '$max_attempts']}},
+            {'$set': {'status': 'failed', 'error': 'Lease expired on the last attempt (worker died or stalled)',
+                      'finished_at': now, 'updated_at': now},
+             '$unset': {'lease_expires_at': ''}}
+        ).modified_count
+
+    def claim(self, worker_id, job_types=None):
+        """Atomically take the next runnable job, or return None"""
+        self.fail_expired()
+        now = datetime.now()
+        query = {'$or': [
+            {'status': 'queued', 'run_at': {'$lte': now}},
+            {'status': 'running', 'lease_expires_at': {'$lte': now},
+             '$expr': {'$lt': ['$attempts', '$max_attempts']}}
+        ]}
+        if job_types:
+            query['type'] = {'$in': list(job_types)}
+        return self.collection.find_one_and_update(
+            query,
+            {
+                '$set': {
+                    'status': 'running',
+                    'worker': worker_id,
+                    'started_at': now,
+                    'updated_at': now,
+                    'lease_expires_at': now + timedelta(seconds=self.lease_seconds)
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('run_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def renew_lease(self, job):
+        """Extend the lease of a running job; False if another worker has taken it over"""
+        now = datetime.now()
+        return self.collection.update_one(
+            {'_id': job['_id'], 'worker': job.get('worker'), 'status': 'running'},
+            {'$set': {'lease_expires_at': now + timedelta(seconds=self.lease_seconds), 'updated_at': now}}
+        ).matched_count == 1
+
+    def complete(self, job, result=None):
+        now = datetime.now()
+        self.collection.update_one(
+            {'_id': job['_id'], 'worker': job.get('worker')},
+            {'$set': {'status': 'done', 'result': result, 'error': None,
+                      'finished_at': now, 'updated_at': now},
+             '$unset': {'lease_expires_at': ''}}
+        )
+
+    def fail(self, job, error):
+        """Reschedule the job with backoff, or mark it failed when out of attempts"""
+        now = datetime.now()
+        update = {'error': error, 'updated_at': now}
+        if job['attempts'] < job['max_attempts']:
+            update['status'] = 'queued'
+            update['run_at'] = now + timedelta(seconds=self.retry_delay * 2 ** (job['attempts'] - 1))
+        else:
+            update['status'] = 'failed'
+            update['finished_at'] = now
+        self.collection.update_one(
+            {'_id': job['_id'], 'worker': job.get('worker')},
+            {'$set': update, '$unset': {'lease_expires_at': ''}}
+        )
+
+
+class LeaseHeartbeat:
+    """Renews a job's lease in a background thread while its handler runs"""
+
+    def __init__(self, queue, job):
+        self.queue = queue
+        self.job = job
+        self.interval = max(1.0, queue.lease_seconds / 3)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{job['_id']}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.queue.renew_lease(self.job):
+                    print(f"Job {self.job['_id']} lease was lost to another worker")
+                    return
+            except Exception as e:
+                # Keep trying; the lease only lapses if renewals keep failing
+                print(f"Job {self.job['_id']} lease renewal failed: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_job(job, context):
+    handler = HANDLERS.get(job['type'])
+    if handler is None:
+        raise ValueError(f"No handler registered for job type {job['type']}")
+    with context.app.app_context():
+        return handler(job, context)
+
+
+def run_worker(context, poll_interval=1.0, stop_event=None, job_types=None, once=False):
+    """Claim and run jobs until stop_event is set (or the queue is empty, with once=True)"""
+    queue = context.queue
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    stop_event = stop_event or threading.Event()
+
+    while not stop_event.is_set():
+        job = queue.claim(worker_id, job_types)
+        if job is None:
+            if once:
+                return
+            stop_event.wait(poll_interval)
+            continue
+
+        started = time.perf_counter()
+        try:
+            with LeaseHeartbeat(queue, job):
+                result = run_job(job, context)
+        except Exception as e:
+            print(f"Job {job['_id']} ({job['type']}) failed on attempt {job['attempts']}: {e}")
+            traceback.print_exc()
+            queue.fail(job, str(e))
+        else:
+            queue.complete(job, result)
+            print(f"Job {job['_id']} ({job['type']}) done in {time.perf_counter() - started:.2f}s")
+
+
+def job_status(job):
+    """Public view of a job document"""
+    return {
+        'id': str(job['_id']),
+        'type': job['type'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'error': job.get('error'),
+        'result': job.get('result'),
+        'created_at': job['created_at'].isoformat(),
+        'finished_at': job['finished_at'].isoformat() if job.get('finished_at') else None
+    }
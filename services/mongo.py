@@ -0,0 +1,305 @@
+"""
+MongoDB client setup: pool options, pool metrics, fork safety and
+read routing
+
+Coroutine views served by asgi.py use an AsyncMongoClient with the same
+options (AsyncMongo, mirroring flask_pymongo's cx/db), so read_collection
+routes their reads too; async_causal_read_session is their
+causal_read_session.
+"""
+
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from bson import Timestamp, json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS
+from flask import current_app, g, request, session
+from flask_pymongo import PyMongo
+from pymongo import ASCENDING, AsyncMongoClient, monitoring
+from pymongo.errors import ConfigurationError, InvalidOperation
+from pymongo.read_preferences import Nearest, PrimaryPreferred, Secondary, SecondaryPreferred
+from services import metrics
+
+READ_PREFERENCE_MODES = {
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+CHECKOUT_WAIT = metrics.histogram(
+    'mongo_pool_checkout_wait_seconds', 'Time spent waiting for a pooled MongoDB connection'
+)
+CHECKOUT_FAILURES = metrics.counter(
+    'mongo_pool_checkout_failures_total', 'Connection checkouts that failed, by reason'
+)
+CHECKOUTS_WAITING = metrics.gauge(
+    'mongo_pool_checkouts_waiting', 'Operations currently waiting for a pooled connection'
+)
+CONNECTIONS_OPEN = metrics.gauge(
+    'mongo_pool_connections_open', 'Open connections in the MongoDB pool'
+)
+CONNECTIONS_IN_USE = metrics.gauge(
+    'mongo_pool_connections_in_use', 'Connections currently checked out of the MongoDB pool'
+)
+POOL_CLEARED = metrics.counter(
+    'mongo_pool_cleared_total', 'Times the MongoDB pool was cleared after an error'
+)
+
+
+def _address(event):
+    host, port = event.address
+    return f'{host}:{port}'
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Exports connection pool events as metrics"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _start_wait(self):
+        self._local.started = time.perf_counter()
+
+    def _wait_duration(self, event):
+        duration = getattr(event, 'duration', None)
+        if duration is None:
+            duration = time.perf_counter() - getattr(self._local, 'started', time.perf_counter())
+        return duration
+
+    def connection_check_out_started(self, event):
+        self._start_wait()
+        CHECKOUTS_WAITING.inc(address=_address(event))
+
+    def connection_checked_out(self, event):
+        address = _address(event)
+        CHECKOUTS_WAITING.dec(address=address)
+        CHECKOUT_WAIT.observe(self._wait_duration(event), address=address)
+        CONNECTIONS_IN_USE.inc(address=address)
+
+    def connection_check_out_failed(self, event):
+        address = _address(event)
+        CHECKOUTS_WAITING.dec(address=address)
+        CHECKOUT_WAIT.observe(self._wait_duration(event), address=address)
+        CHECKOUT_FAILURES.inc(address=address, reason=str(event.reason))
+
+    def connection_checked_in(self, event):
+        CONNECTIONS_IN_USE.dec(address=_address(event))
+
+    def connection_created(self, event):
+        CONNECTIONS_OPEN.inc(address=_address(event))
+
+    def connection_closed(self, event):
+        CONNECTIONS_OPEN.dec(address=_address(event))
+
+    def pool_cleared(self, event):
+        POOL_CLEARED.inc(address=_address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        CONNECTIONS_OPEN.set(0, address=_address(event))
+        CONNECTIONS_IN_USE.set(0, address=_address(event))
+
+
+def mongo_client_options(config):
+    """Build MongoClient keyword arguments from the app config"""
+    options = {
+        'maxPoolSize': config['MONGO_MAX_POOL_SIZE'],
+        'minPoolSize': config['MONGO_MIN_POOL_SIZE'],
+        'maxIdleTimeMS': config['MONGO_MAX_IDLE_TIME_MS'],
+        'waitQueueTimeoutMS': config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+        'serverSelectionTimeoutMS': config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+        'connectTimeoutMS': config['MONGO_CONNECT_TIMEOUT_MS'],
+        'event_listeners': [PoolMetricsListener()],
+    }
+    if config.get('MONGO_COMPRESSORS'):
+        options['compressors'] = config['MONGO_COMPRESSORS']
+    return options
+
+
+def init_mongo(app):
+    """Create the PyMongo extension and re-create its client in forked children"""
+    options = mongo_client_options(app.config)
+    mongo = PyMongo(app, **options)
+    app.extensions['mongo'] = mongo
+
+    def reconnect_in_child():
+        # MongoClient is not fork-safe: sockets and monitor threads belong to
+        # the parent. Drop the inherited client without closing it (closing
+        # would talk over the parent's sockets) and build a fresh one.
+        mongo.init_app(app, **mongo_client_options(app.config))
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=reconnect_in_child)
+    return mongo
+
+
+class AsyncMongo:
+    """This process's AsyncMongoClient, with the cx/db attributes of flask_pymongo's PyMongo
+
+    The client is created on first use, from the event loop that serves
+    the process, and has a pool of its own next to the synchronous one.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._client = None
+
+    @property
+    def cx(self):
+        if self._client is None:
+            self._client = AsyncMongoClient(self.app.config['MONGO_URI'], **mongo_client_options(self.app.config))
+        return self._client
+
+    @property
+    def db(self):
+        return self.cx.get_default_database()
+
+    def forget_client(self):
+        # A client inherited over fork belongs to the parent's event loop
+        self._client = None
+
+
+def init_async_mongo(app):
+    """Create the AsyncMongo used by coroutine views"""
+    mongo = AsyncMongo(app)
+    app.extensions['async_mongo'] = mongo
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=mongo.forget_client)
+    return mongo
+
+
+def ensure_indexes(mongo):
+    """Create the diagnosis indexes the pages and queries rely on"""
+    # History, comparison, recommendations and conditional-GET versions: one user's newest first
+    mongo.db.diagnoses.create_index([('user_id', ASCENDING), ('created_at', ASCENDING)])
+    # Condition queries: {'result.condition_mask': {'$in': masks_with(...)}}
+    mongo.db.diagnoses.create_index('result.condition_mask')
+
+
+def read_preference_for(endpoint, config):
+    """Return the configured read preference for an endpoint, or None for the primary"""
+    mode = config['MONGO_READ_PREFERENCES'].get(endpoint)
+    if not mode or mode == 'primary':
+        return None
+    return READ_PREFERENCE_MODES[mode](max_staleness=config['MONGO_MAX_STALENESS_SECONDS'])
+
+
+def read_collection(mongo, name, endpoint=None):
+    """Return a collection routed by the read preference of the current endpoint"""
+    collection = mongo.db[name]
+    preference = read_preference_for(endpoint or request.endpoint, current_app.config)
+    if preference is None:
+        return collection
+    return collection.with_options(read_preference=preference)
+
+
+_warned_no_sessions = False
+
+
+def _start_causal_session(mongo):
+    """A causal session on mongo's client (PyMongo or AsyncMongo), or None"""
+    global _warned_no_sessions
+    try:
+        return mongo.db.client.start_session(causal_consistency=True)
+    except (NotImplementedError, ConfigurationError, InvalidOperation) as e:
+        # Stand-ins such as mongomock have no sessions; reads then go unguarded.
+        # python -m checks.causal verifies the real path on a replica set.
+        if not _warned_no_sessions:
+            _warned_no_sessions = True
+            print(f"Warning: causal sessions unavailable, reads are not ordered after writes: {e!r}")
+        return None
+
+
+@contextmanager
+def causal_write_session(mongo):
+    """Session for a write whose effects the user must see on later reads
+
+    The operation and cluster times are kept in the Flask session, so the
+    next request from this user can wait for a secondary to catch up.
+    """
+    mongo_session = _start_causal_session(mongo)
+    if mongo_session is None:
+        yield None
+        return
+    with mongo_session:
+        yield mongo_session
+        if mongo_session.operation_time is not None:
+            operation_time = mongo_session.operation_time
+            session['mongo_operation_time'] = [operation_time.time, operation_time.inc]
+        if mongo_session.cluster_time is not None:
+            session['mongo_cluster_time'] = json_util.dumps(
+                mongo_session.cluster_time, json_options=CANONICAL_JSON_OPTIONS
+            )
+
+
+@contextmanager
+def causal_read_session(mongo, always=False):
+    """Session for reads that must observe this user's last write
+
+    Reads issued with it carry afterClusterTime, so a lagging secondary
+    waits until it has applied the user's own write before answering.
+    Without a write to wait for, no session is used unless always=True;
+    then each read in the session sees at least what the earlier ones saw.
+    Nested uses within a request share the outer session.
+    """
+    outer = g.get('causal_read_session')
+    if outer is not None:
+        yield outer
+        return
+    operation_time = session.get('mongo_operation_time')
+    if not operation_time and not always:
+        yield None
+        return
+    mongo_session = _start_causal_session(mongo)
+    if mongo_session is None:
+        yield None
+        return
+    with mongo_session:
+        _advance_to_last_write(mongo_session, operation_time)
+        g.causal_read_session = mongo_session
+        try:
+            yield mongo_session
+        finally:
+            g.pop('causal_read_session', None)
+
+
+@asynccontextmanager
+async def async_causal_read_session(mongo, always=False):
+    """causal_read_session for coroutine views, on an AsyncMongo"""
+    outer = g.get('causal_read_session')
+    if outer is not None:
+        yield outer
+        return
+    operation_time = session.get('mongo_operation_time')
+    if not operation_time and not always:
+        yield None
+        return
+    mongo_session = _start_causal_session(mongo)
+    if mongo_session is None:
+        yield None
+        return
+    async with mongo_session:
+        _advance_to_last_write(mongo_session, operation_time)
+        g.causal_read_session = mongo_session
+        try:
+            yield mongo_session
+        finally:
+            g.pop('causal_read_session', None)
+
+
+def _advance_to_last_write(mongo_session, operation_time):
+    cluster_time = session.get('mongo_cluster_time')
+    if cluster_time:
+        mongo_session.advance_cluster_time(json_util.loads(cluster_time))
+    if operation_time:
+        mongo_session.advance_operation_time(Timestamp(*operation_time))
@@ -0,0 +1,143 @@
+"""
+Sampling profiler for individual requests
+
+A request is profiled when an admin sends ``X-Profile: 1`` or when it is
+picked by ``PROFILE_SAMPLE_RATE``. Stacks are written in collapsed format
+(``frame;frame;frame count``), which flamegraph.pl and speedscope both read.
+"""
+
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from flask import g, request
+from services.admin import is_admin_request
+
+
+class SamplingProfiler:
+    """Samples the call stack of a single thread at a fixed interval"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.started_at = None
+        self.duration = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return self
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[';'.join(stack)] += 1
+
+    def collapsed(self):
+        """Return the samples as collapsed stack lines"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common()) + '\n'
+
+
+class ProfileStore:
+    """Bounded on-disk ring buffer of profile files"""
+
+    def __init__(self, directory, max_files=50):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def save(self, label, content):
+        os.makedirs(self.directory, exist_ok=True)
+        safe_label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'request'
+        filename = f"{time.time_ns()}_{os.getpid()}_{safe_label}.collapsed"
+        with open(os.path.join(self.directory, filename), 'w', encoding='utf-8') as f:
+            f.write(content)
+        self._prune()
+        return filename
+
+    def list(self):
+        try:
+            return sorted(
+                (entry.name for entry in os.scandir(self.directory)
+                 if entry.is_file() and entry.name.endswith('.collapsed')),
+                reverse=True
+            )
+        except FileNotFoundError:
+            return []
+
+    def path_for(self, filename):
+        if os.path.basename(filename) != filename or filename not in self.list():
+            return None
+        return os.path.abspath(os.path.join(self.directory, filename))
+
+    def _prune(self):
+        with self._lock:
+            names = self.list()
+            for name in names[self.max_files:]:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+def _should_profile(app):
+    if request.headers.get('X-Profile') == '1' and is_admin_request():
+        return True
+    rate = app.config.get('PROFILE_SAMPLE_RATE', 0)
+    return rate > 0 and random.randrange(rate) == 0
+
+
+def init_profiler(app):
+    """Register request hooks that profile selected requests"""
+    store = ProfileStore(app.config['PROFILE_DIR'], app.config['PROFILE_MAX_FILES'])
+    app.extensions['profile_store'] = store
+
+    @app.before_request
+    def start_request_profile():
+        if _should_profile(app):
+            g.request_profiler = SamplingProfiler(
+                threading.get_ident(), app.config['PROFILE_INTERVAL']
+            ).start()
+
+    @app.after_request
+    def save_request_profile(response):
+        profiler = g.pop('request_profiler', None)
+        if profiler is None:
+            return response
+        profiler.stop()
+        label = f"{request.endpoint or 'unknown'}_{int(profiler.duration * 1000)}ms"
+        filename = store.save(label, profiler.collapsed())
+        response.headers['X-Profile-File'] = filename
+        return response
+
+    @app.teardown_request
+    def stop_request_profile(exc):
+        profiler = g.pop('request_profiler', None)
+        if profiler is not None:
+            profiler.stop()
+
+    return store
@@ -0,0 +1,180 @@
+"""
+Token-bucket rate limiting
+
+Budgets are set per endpoint in ``Config.RATE_LIMITS`` as
+``'<requests>/<seconds>'``: a bucket holds up to ``requests`` tokens and
+refills at ``requests / seconds`` tokens per second. Logged-in users get a
+bucket per user, everyone else a bucket per client IP. Only state-changing
+requests (POST and friends) are counted, so page views stay free.
+
+The memory backend keeps buckets in each process. The mongo backend keeps
+them in the ``rate_limits`` collection and updates a bucket with a single
+atomic pipeline update, so every worker shares the same budget.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+from flask import jsonify, request, session
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from werkzeug.exceptions import TooManyRequests
+from services import metrics
+
+DECISIONS = metrics.counter('rate_limit_decisions_total', 'Rate limiter decisions by endpoint and decision (allowed/limited/error)')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+Budget = namedtuple('Budget', ['capacity', 'refill_rate'])
+Decision = namedtuple('Decision', ['allowed', 'remaining', 'retry_after'])
+
+
+def parse_budget(spec):
+    """'10/60' -> Budget(capacity=10, refill_rate=10/60 tokens per second)"""
+    requests, seconds = spec.split('/')
+    requests, seconds = float(requests), float(seconds)
+    if requests <= 0 or seconds <= 0:
+        raise ValueError(f'Invalid rate limit: {spec}')
+    return Budget(requests, requests / seconds)
+
+
+def _decision(allowed, tokens, budget, cost):
+    if allowed:
+        return Decision(True, int(tokens), 0)
+    return Decision(False, 0, max(1, math.ceil((cost - tokens) / budget.refill_rate)))
+
+
+class MemoryBackend:
+    """Buckets in a bounded in-process LRU"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, budget, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (budget.capacity, now))
+            tokens = min(budget.capacity, tokens + (now - updated) * budget.refill_rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return _decision(allowed, tokens, budget, cost)
+
+
+class MongoBackend:
+    """Buckets shared by all workers through MongoDB"""
+
+    def __init__(self, mongo):
+        self.mongo = mongo
+
+    @property
+    def collection(self):
+        return self.mongo.db.rate_limits
+
+    def ensure_indexes(self):
+        # Idle buckets are full again after their window; let MongoDB drop them
+        self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    def consume(self, key, budget, cost=1):
+        now = time.time()
+        refilled = {'$min': [
+            budget.capacity,
+            {'$add': [
+                {'$ifNull': ['$tokens', budget.capacity]},
+                {'$multiply': [{'$max': [0, {'$subtract': [now, {'$ifNull': ['$updated', now]}]}]}, budget.refill_rate]}
+            ]}
+        ]}
+        doc = self.collection.find_one_and_update(
+            {'_id': key},
+            [
+                {'$set': {'tokens': refilled, 'updated': now}},
+                {'$set': {
+                    'allowed': {'$gte': ['$tokens', cost]},
+                    'tokens': {'$cond': [{'$gte': ['$tokens', cost]}, {'$subtract': ['$tokens', cost]}, '$tokens']},
+                    # TTL indexes compare against UTC
+                    'expires_at': datetime.now(timezone.utc) + timedelta(seconds=budget.capacity / budget.refill_rate)
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return _decision(doc['allowed'], doc['tokens'], budget, cost)
+
+
+class RateLimiter:
+    """Check requests against the per-endpoint budgets"""
+
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.budgets = {endpoint: parse_budget(spec) for endpoint, spec in limits.items()}
+
+    def client_key(self, endpoint):
+        if 'user_id' in session:
+            return f"{endpoint}:user:{session['user_id']}"
+        return f'{endpoint}:ip:{request.remote_addr}'
+
+    def check(self, endpoint):
+        """Return a Decision for the current request, or None if the endpoint is not limited"""
+        budget = self.budgets.get(endpoint)
+        if budget is None:
+            return None
+        try:
+            decision = self.backend.consume(self.client_key(endpoint), budget)
+        except PyMongoError as e:
+            # Fail open: a limiter outage must not take the site down with it
+            print(f"Rate limiter error on {endpoint}: {e}")
+            DECISIONS.inc(endpoint=endpoint, decision='error')
+            return None
+        DECISIONS.inc(endpoint=endpoint, decision='allowed' if decision.allowed else 'limited')
+        return decision
+
+
+def init_rate_limiter(app, mongo):
+    """Register a before_request hook enforcing Config.RATE_LIMITS"""
+    if not app.config['RATE_LIMIT_ENABLED']:
+        return None
+
+    if app.config['RATE_LIMIT_BACKEND'] == 'mongo':
+        backend = MongoBackend(mongo)
+        try:
+            backend.ensure_indexes()
+        except PyMongoError as e:
+            print(f"Warning: could not create rate limit indexes: {e}")
+    else:
+        backend = MemoryBackend()
+    limiter = RateLimiter(backend, app.config['RATE_LIMITS'])
+    app.extensions['rate_limiter'] = limiter
+
+    @app.before_request
+    def enforce_rate_limit():
+        return limit_response(limiter)
+
+    return limiter
+
+
+def limit_response(limiter):
+    """429 response when the current request is over its budget, else None
+
+    Also called by services.aio for coroutine views, which skip before_request hooks.
+    """
+    if request.method in SAFE_METHODS:
+        return None
+    decision = limiter.check(request.endpoint)
+    if decision is None or decision.allowed:
+        return None
+    if request.is_json:
+        response = jsonify({'error': 'Too many requests', 'retry_after': decision.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(decision.retry_after)
+        return response
+    return TooManyRequests(
+        'Too many requests. Please wait a moment and try again.', retry_after=decision.retry_after
+    ).get_response()
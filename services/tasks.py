@@ -0,0 +1,146 @@
+"""
+Background job handlers for heavy diagnosis work
+"""
+
+import os
+import zipfile
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from services.analytics import export_diagnoses_parquet
+from services.conditional import touch_diagnoses
+from services.jobs import job_handler
+from services.thumbnails import generate_thumbnail
+from services.uploads import resolve_upload_path, sweep_orphaned_uploads
+
+
+def _results_path(context, job, extension):
+    folder = context.app.config['JOB_RESULTS_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{job['_id']}.{extension}")
+
+
+@job_handler('export_pdf_batch')
+def export_pdf_batch(job, context):
+    """Render a PDF report for every diagnosis of a user into one ZIP file"""
+    from routes.diagnosis import build_pdf
+
+    user_id = job['user_id']
+    user = context.mongo.db.users.find_one({'_id': user_id})
+    diagnoses = context.mongo.db.diagnoses.find({'user_id': user_id}).sort('created_at', -1)
+
+    path = _results_path(context, job, 'zip')
+    count = 0
+    with zipfile.ZipFile(path + '.tmp', 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for diagnosis in diagnoses:
+            name = f"diagnosis_report_{diagnosis['created_at'].strftime('%Y%m%d_%H%M%S')}_{diagnosis['_id']}.pdf"
+            archive.writestr(name, build_pdf(diagnosis, user).getvalue())
+            count += 1
+    os.replace(path + '.tmp', path)
+
+    return {
+        'file': os.path.basename(path),
+        'download_name': f"diagnosis_reports_{datetime.now().strftime('%Y%m%d')}.zip",
+        'mimetype': 'application/zip',
+        'count': count
+    }
+
+
+@job_handler('rescore_history')
+def rescore_history(job, context, batch_size=500):
+    """Re-run the current engine over a user's stored diagnoses"""
+    diagnoses = context.mongo.db.diagnoses.find(
+        {'user_id': job['user_id']},
+        {'vitals': 1, 'algorithm': 1, 'image_path': 1}
+    )
+    operations = []
+    rescored = 0
+    for diagnosis in diagnoses:
+        image_path = None
+        if diagnosis.get('algorithm') == 'cnn':
+            image_path = resolve_upload_path(diagnosis.get('image_path'), context.app.config['UPLOAD_FOLDER'])
+        result = context.ml_engine.predict(diagnosis.get('algorithm'), diagnosis.get('vitals', {}), image_path)
+        operations.append(UpdateOne(
+            {'_id': diagnosis['_id']},
+            {'$set': {'result': result, 'rescored_at': datetime.now()}}
+        ))
+        if len(operations) >= batch_size:
+            rescored += context.mongo.db.diagnoses.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        rescored += context.mongo.db.diagnoses.bulk_write(operations, ordered=False).modified_count
+    if rescored:
+        touch_diagnoses(context.mongo, job['user_id'])
+    return {'rescored': rescored}
+
+
+@job_handler('analyze_image')
+def analyze_image(job, context):
+    """Run CNN image analysis for a stored diagnosis and update its result"""
+    diagnosis = context.mongo.db.diagnoses.find_one({'_id': ObjectId(job['payload']['diagnosis_id'])})
+    if diagnosis is None:
+        return {'skipped': 'diagnosis not found'}
+
+    image_path = resolve_upload_path(diagnosis.get('image_path'), context.app.config['UPLOAD_FOLDER'])
+    result = context.ml_engine.predict('cnn', diagnosis.get('vitals', {}), image_path)
+    if result.get('error'):
+        raise RuntimeError(result['error'])
+
+    context.mongo.db.diagnoses.update_one(
+        {'_id': diagnosis['_id']},
+        {'$set': {'result': result, 'image_analysis_status': 'done'}}
+    )
+    touch_diagnoses(context.mongo, diagnosis['user_id'])
+    return {
+        'diagnosis_id': str(diagnosis['_id']),
+        'condition': result['condition'],
+        'severity': result['severity'],
+        'confidence': result.get('confidence', 0.0)
+    }
+
+
+@job_handler('generate_thumbnail')
+def generate_thumbnail_job(job, context):
+    """Create the thumbnail of a diagnosis image and link it to the record"""
+    config = context.app.config
+    diagnosis = context.mongo.db.diagnoses.find_one({'_id': ObjectId(job['payload']['diagnosis_id'])})
+    if diagnosis is None:
+        return {'skipped': 'diagnosis not found'}
+
+    image_path = resolve_upload_path(diagnosis.get('image_path'), config['UPLOAD_FOLDER'])
+    if image_path is None:
+        return {'skipped': 'image not found'}
+    digest = generate_thumbnail(
+        image_path, config['DERIVATIVES_FOLDER'], config['THUMBNAIL_SIZE'], config['THUMBNAIL_QUALITY']
+    )
+    context.mongo.db.diagnoses.update_one({'_id': diagnosis['_id']}, {'$set': {'thumbnail': digest}})
+    touch_diagnoses(context.mongo, diagnosis['user_id'])
+    return {'diagnosis_id': str(diagnosis['_id']), 'thumbnail': digest}
+
+
+@job_handler('export_parquet')
+def export_parquet(job, context):
+    """Append new diagnoses to the analytics Parquet dataset"""
+    config = context.app.config
+    return export_diagnoses_parquet(
+        context.mongo,
+        config['ANALYTICS_EXPORT_FOLDER'],
+        batch_size=config['ANALYTICS_EXPORT_BATCH_SIZE'],
+        full=job['payload'].get('full', False),
+        safety_seconds=config['ANALYTICS_EXPORT_SAFETY_SECONDS']
+    )
+
+
+@job_handler('sweep_uploads')
+def sweep_uploads(job, context):
+    """Remove upload files that no diagnosis references"""
+    config = context.app.config
+    return sweep_orphaned_uploads(
+        context.mongo,
+        config['UPLOAD_FOLDER'],
+        quarantine_folder=config['UPLOAD_QUARANTINE_FOLDER'],
+        min_age_seconds=config['UPLOAD_SWEEP_MIN_AGE'],
+        batch_size=config['UPLOAD_SWEEP_BATCH_SIZE'],
+        batch_pause=config['UPLOAD_SWEEP_BATCH_PAUSE'],
+        dry_run=job['payload'].get('dry_run', False)
+    )
@@ -0,0 +1,114 @@
+"""
+Jinja bytecode cache, render timings and fragment caching
+
+Compiled templates are written to ``JINJA_BYTECODE_CACHE_DIR`` so new or
+restarted workers load bytecode instead of compiling from source. Every
+render_template call is timed into ``template_render_seconds``. Templates
+can wrap output that does not depend on the request in
+
+    {% cache 'help_page' %} ... {% endcache %}
+
+to render it once per process; extra arguments after the name become part
+of the key, e.g. ``{% cache 'greeting', user.language %}``.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from services import metrics
+
+RENDER_TIME = metrics.histogram('template_render_seconds', 'Time spent rendering templates, by template')
+FRAGMENT_LOOKUPS = metrics.counter('template_fragment_cache_total', 'Template fragment cache lookups by result (hit/miss)')
+
+_render_starts = threading.local()
+
+
+class FragmentCache:
+    """Small LRU of rendered template fragments"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FragmentCacheExtension(Extension):
+    """Adds the {% cache key[, vary...] %}...{% endcache %} tag"""
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render_cached', [nodes.List(key_parts)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, key_parts, caller):
+        cache = self.environment.fragment_cache
+        if not cache.max_size:
+            return caller()
+        key = tuple(key_parts)
+        value = cache.get(key)
+        if value is None:
+            FRAGMENT_LOOKUPS.inc(result='miss')
+            value = caller()
+            cache.set(key, value)
+        else:
+            FRAGMENT_LOOKUPS.inc(result='hit')
+        return value
+
+
+def _start_render(sender, template, context, **extra):
+    stack = getattr(_render_starts, 'stack', None)
+    if stack is None:
+        stack = _render_starts.stack = []
+    stack.append(time.perf_counter())
+
+
+def _finish_render(sender, template, context, **extra):
+    stack = getattr(_render_starts, 'stack', None)
+    if stack:
+        RENDER_TIME.observe(time.perf_counter() - stack.pop(), template=template.name or 'string')
+
+
+def init_templating(app):
+    """Install the bytecode cache, fragment cache tag and render timing"""
+    cache_dir = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache.max_size = app.config['TEMPLATE_FRAGMENT_CACHE_SIZE']
+
+    before_render_template.connect(_start_render, app)
+    template_rendered.connect(_finish_render, app)
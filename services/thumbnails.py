@@ -0,0 +1,78 @@
+"""
+Thumbnail derivatives of uploaded images
+
+Thumbnails are keyed by the SHA-256 of the source file, so identical
+uploads share one derivative, and stored as
+``DERIVATIVES_FOLDER/thumbs/ab/<digest>_<size>.<ext>``. The digest doubles
+as the ETag: a thumbnail never changes once written.
+"""
+
+import hashlib
+import os
+from PIL import Image, features
+from models.dicom_loader import PYDICOM_AVAILABLE, is_dicom_path, iter_dicom_frames, frame_to_image
+
+THUMBNAIL_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+THUMBNAIL_EXTENSION = 'webp' if THUMBNAIL_FORMAT == 'WEBP' else 'jpg'
+THUMBNAIL_MIMETYPE = 'image/webp' if THUMBNAIL_FORMAT == 'WEBP' else 'image/jpeg'
+
+
+def content_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_content_hash(value):
+    return len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+def thumbnail_path(derivatives_folder, digest, size):
+    return os.path.join(derivatives_folder, 'thumbs', digest[:2], f'{digest}_{size}.{THUMBNAIL_EXTENSION}')
+
+
+def _open_source(image_path, size):
+    if is_dicom_path(image_path):
+        if not PYDICOM_AVAILABLE:
+            return None
+        return frame_to_image(next(iter_dicom_frames(image_path)), size)
+    img = Image.open(image_path)
+    # Let the JPEG decoder scale down while decoding instead of after
+    img.draft('RGB', (size, size))
+    return img
+
+
+def generate_thumbnail(image_path, derivatives_folder, size=160, quality=75):
+    """Create the thumbnail of an upload if it does not exist yet; returns its content hash"""
+    digest = content_hash(image_path)
+    path = thumbnail_path(derivatives_folder, digest, size)
+    if os.path.exists(path):
+        return digest
+
+    img = _open_source(image_path, size)
+    if img is None:
+        return None
+    img = img.convert('RGB')
+    img.thumbnail((size, size))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    img.save(tmp_path, format=THUMBNAIL_FORMAT, quality=quality)
+    os.replace(tmp_path, path)
+    return digest
+
+
+def delete_unreferenced_thumbnails(mongo, digests, derivatives_folder, size):
+    """Remove thumbnails that no remaining diagnosis points at"""
+    removed = 0
+    for digest in set(digests):
+        if mongo.db.diagnoses.count_documents({'thumbnail': digest}, limit=1):
+            continue
+        try:
+            os.remove(thumbnail_path(derivatives_folder, digest, size))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -0,0 +1,233 @@
+"""
+Upload storage: sharded layout, path resolution, cascade deletes, the
+orphan sweeper and the flat-to-sharded migration
+
+Uploads are stored as ``UPLOAD_FOLDER/ab/cd/<filename>`` where ``abcd`` are
+the first hex digits of the SHA-1 of the file name, so no directory grows
+beyond a few thousand entries. Records written before the sharded layout
+point at ``UPLOAD_FOLDER/<filename>``; resolve_upload_path handles both.
+"""
+
+import hashlib
+import ntpath
+import os
+import shutil
+import time
+from pymongo import UpdateMany, UpdateOne
+from services import metrics
+
+SWEPT_FILES = metrics.counter('upload_sweeper_files_total', 'Files handled by the orphan upload sweeper, by action')
+
+
+def _name_key(path):
+    """Compact 8-byte key of an upload's file name"""
+    return int.from_bytes(hashlib.blake2b(_basename(path).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _basename(image_path):
+    # Records created on Windows store backslash-separated paths
+    return ntpath.basename(image_path)
+
+
+def shard_relpath(filename):
+    """Relative sharded location of an upload file name"""
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return os.path.join(digest[:2], digest[2:4], filename)
+
+
+def sharded_upload_path(upload_folder, filename, create=False):
+    """Absolute-or-relative sharded path for a new upload"""
+    path = os.path.join(upload_folder, shard_relpath(filename))
+    if create:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def resolve_upload_path(image_path, upload_folder):
+    """Map a stored image_path (flat or sharded layout) to an existing file, or None"""
+    if not image_path:
+        return None
+    if os.path.exists(image_path):
+        return image_path
+    filename = _basename(image_path)
+    for candidate in (sharded_upload_path(upload_folder, filename), os.path.join(upload_folder, filename)):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def delete_upload_files(paths, upload_folder=None):
+    """Remove upload files, ignoring ones that are already gone; returns the count removed"""
+    removed = 0
+    for path in paths:
+        if upload_folder:
+            path = resolve_upload_path(path, upload_folder)
+        if not path:
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def user_upload_paths(mongo, user_id):
+    """Image and derived preview paths referenced by a user's diagnoses"""
+    cursor = mongo.db.diagnoses.find(
+        {'user_id': user_id, 'image_path': {'$nin': [None, '']}},
+        {'image_path': 1, 'preview_path': 1, '_id': 0}
+    )
+    paths = []
+    for doc in cursor:
+        paths.append(doc['image_path'])
+        if doc.get('preview_path'):
+            paths.append(doc['preview_path'])
+    return paths
+
+
+def live_upload_keys(mongo, batch_size=1000):
+    """Stream diagnoses.image_path and return the set of live file-name keys
+
+    Keys are 8-byte hashes of the file name rather than the paths
+    themselves, which keeps the set small for millions of records. A hash
+    collision can only make the sweeper keep an orphan, never delete a
+    live file.
+    """
+    cursor = mongo.db.diagnoses.find(
+        {'image_path': {'$nin': [None, '']}},
+        {'image_path': 1, '_id': 0}
+    ).batch_size(batch_size)
+    return {_name_key(doc['image_path']) for doc in cursor}
+
+
+def iter_upload_files(folder):
+    """Yield DirEntry objects for every file below folder"""
+    stack = [folder]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def sweep_orphaned_uploads(mongo, upload_folder, quarantine_folder=None, min_age_seconds=3600,
+                           batch_size=500, batch_pause=0.5, dry_run=False):
+    """Delete (or quarantine) upload files that no diagnosis references
+
+    Files younger than min_age_seconds are skipped, since an upload is
+    saved before its diagnosis record is inserted. Work is done in batches
+    with a pause between them to limit I/O pressure.
+    """
+    live = live_upload_keys(mongo)
+    cutoff = time.time() - min_age_seconds
+    stats = {'scanned': 0, 'live': 0, 'too_new': 0, 'orphaned': 0, 'removed': 0, 'bytes': 0}
+    batch = []
+
+    def flush():
+        for entry_path, size in batch:
+            if dry_run:
+                continue
+            try:
+                if quarantine_folder:
+                    target = os.path.join(quarantine_folder, os.path.relpath(entry_path, upload_folder))
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.move(entry_path, target)
+                    SWEPT_FILES.inc(action='quarantined')
+                else:
+                    os.remove(entry_path)
+                    SWEPT_FILES.inc(action='deleted')
+            except FileNotFoundError:
+                continue
+            stats['removed'] += 1
+            stats['bytes'] += size
+        batch.clear()
+        if not dry_run:
+            time.sleep(batch_pause)
+
+    for entry in iter_upload_files(upload_folder):
+        stats['scanned'] += 1
+        if _name_key(entry.name) in live:
+            stats['live'] += 1
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime > cutoff:
+            stats['too_new'] += 1
+            continue
+        stats['orphaned'] += 1
+        batch.append((entry.path, stat.st_size))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return stats
+
+
+def _legacy_paths(upload_folder, filename):
+    """image_path values a flat-layout record may hold for filename"""
+    return list(dict.fromkeys([
+        os.path.join(upload_folder, filename), f'{upload_folder}\\{filename}', f'{upload_folder}/{filename}'
+    ]))
+
+
+def migrate_upload_layout(mongo, upload_folder, batch_size=500, batch_pause=0.0, dry_run=False):
+    """Move flat uploads into the sharded layout and rewrite diagnoses.image_path
+
+    Safe to interrupt and re-run. Pass one moves the files left in the top
+    level of upload_folder and rewrites their records in bulk, one batch
+    at a time. Pass two repairs records that still hold a flat path for a
+    file that was already moved, e.g. when the previous run stopped
+    between a move and its bulk_write.
+    """
+    stats = {'moved': 0, 'records_updated': 0, 'records_repaired': 0}
+    moves = []
+
+    def flush_moves():
+        if moves and not dry_run:
+            result = mongo.db.diagnoses.bulk_write([
+                UpdateMany({'image_path': {'$in': _legacy_paths(upload_folder, filename)}},
+                           {'$set': {'image_path': new_path}})
+                for filename, new_path in moves
+            ], ordered=False)
+            stats['records_updated'] += result.modified_count
+            time.sleep(batch_pause)
+        moves.clear()
+
+    with os.scandir(upload_folder) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            new_path = sharded_upload_path(upload_folder, entry.name, create=not dry_run)
+            if not dry_run:
+                os.replace(entry.path, new_path)
+            stats['moved'] += 1
+            moves.append((entry.name, new_path))
+            if len(moves) >= batch_size:
+                flush_moves()
+    flush_moves()
+
+    repairs = []
+    cursor = mongo.db.diagnoses.find(
+        {'image_path': {'$nin': [None, '']}},
+        {'image_path': 1}
+    ).batch_size(batch_size)
+    for doc in cursor:
+        filename = _basename(doc['image_path'])
+        new_path = sharded_upload_path(upload_folder, filename)
+        if doc['image_path'] == new_path or doc['image_path'] not in _legacy_paths(upload_folder, filename):
+            continue
+        if not os.path.exists(new_path):
+            continue
+        repairs.append(UpdateOne({'_id': doc['_id']}, {'$set': {'image_path': new_path}}))
+        if len(repairs) >= batch_size:
+            if not dry_run:
+                stats['records_repaired'] += mongo.db.diagnoses.bulk_write(repairs, ordered=False).modified_count
+            repairs = []
+    if repairs and not dry_run:
+        stats['records_repaired'] += mongo.db.diagnoses.bulk_write(repairs, ordered=False).modified_count
+    return stats
@@ -0,0 +1,61 @@
+"""
+Background job worker
+
+    python worker.py                 # one worker process
+    python worker.py --processes 4   # four worker processes
+
+Workers poll the MongoDB ``jobs`` collection, so no broker is needed.
+"""
+
+import argparse
+import multiprocessing
+import signal
+import threading
+from app import app, mongo, ml_engine, job_queue
+from services.jobs import JobContext, run_worker
+from services.mongo import ensure_indexes
+
+
+def work(poll_interval, job_types):
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    context = JobContext(app=app, mongo=mongo, ml_engine=ml_engine, queue=job_queue)
+    run_worker(context, poll_interval=poll_interval, stop_event=stop_event, job_types=job_types)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run background job workers')
+    parser.add_argument('--processes', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--poll-interval', type=float, default=app.config['JOBS_POLL_INTERVAL'])
+    parser.add_argument('--types', nargs='*', help='only run these job types')
+    args = parser.parse_args(argv)
+
+    job_queue.ensure_indexes()
+    ensure_indexes(mongo)
+    print(f"Starting {args.processes} job worker(s)")
+
+    if args.processes == 1:
+        work(args.poll_interval, args.types)
+        return
+
+    # Forked children rebuild their MongoDB client (services.mongo.init_mongo)
+    processes = [
+        multiprocessing.Process(target=work, args=(args.poll_interval, args.types), daemon=False)
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def shutdown(*_):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
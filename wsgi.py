@@ -0,0 +1,35 @@
+"""
+Production WSGI entry point
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Importing this module loads the app, the ML engine and every template in
+the master process. Workers forked afterwards share those pages
+copy-on-write.
+"""
+
+import gc
+from pymongo.errors import PyMongoError
+from app import app, mongo, ml_engine
+from services.mongo import ensure_indexes
+
+
+def preload():
+    """Load everything the workers can share"""
+    try:
+        ensure_indexes(mongo)
+    except PyMongoError as e:
+        print(f"Warning: could not create MongoDB indexes: {e}")
+    ml_engine.warm_up()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+
+preload()
+
+# Move everything loaded so far into the permanent generation. The cyclic
+# collector then never walks these objects in the workers, so it does not
+# dirty (and copy) the shared pages.
+gc.freeze()
+
+application = app